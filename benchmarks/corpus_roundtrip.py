@@ -0,0 +1,125 @@
+"""
+Rows/sec of the NDJSON corpus export and checkpointed import.
+
+Tops the Joke table up to `--rows` benchmark jokes, exports the whole table
+with `project.corpus.export_jokes` to a temporary file, deletes the
+benchmark jokes and loads the dump back with `project.corpus.import_jokes`,
+then prints the rows/sec of both directions and the dump size as JSON.
+
+Usage:
+    python -m benchmarks.corpus_roundtrip --fake-db [--rows 1000000] [--gzip] \\
+        [--export-batch-size 5000] [--import-batch-size 2000]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import tempfile
+import time
+
+SEED_EMAIL = "corpus-benchmark@example.com"
+
+SEED_CHUNK = 10000
+
+WORDS = (
+    "dad pun knock door chicken road cow moo cheese bread fish atom "
+    "skeleton guts ghost boo bicycle tired scarecrow field outstanding"
+).split()
+
+
+async def seed(rows: int, rng: random.Random) -> str:
+    import prisma.models
+
+    owner = await prisma.models.User.prisma().upsert(
+        where={"email": SEED_EMAIL},
+        data={
+            "create": {"email": SEED_EMAIL, "password": "!", "role": "USER"},
+            "update": {},
+        },
+    )
+    existing = await prisma.models.Joke.prisma().count(where={"submittedBy": owner.id})
+    while existing < rows:
+        chunk = min(SEED_CHUNK, rows - existing)
+        await prisma.models.Joke.prisma().create_many(
+            data=[
+                {
+                    "content": " ".join(rng.sample(WORDS, 8)) + f" #{existing + i}",
+                    "status": "APPROVED",
+                    "submittedBy": owner.id,
+                }
+                for i in range(chunk)
+            ]
+        )
+        existing += chunk
+    return owner.id
+
+
+async def main(args: argparse.Namespace) -> dict:
+    if args.fake_db:
+        from benchmarks import fake_prisma
+
+        fake_prisma.install()
+    import prisma.models
+    import project.corpus
+    import project.db
+
+    await project.db.connect()
+    try:
+        owner_id = await seed(args.rows, random.Random(args.seed))
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(
+                directory, "jokes.ndjson.gz" if args.gzip else "jokes.ndjson"
+            )
+            exported = 0
+
+            async def counted(chunks):
+                nonlocal exported
+                async for chunk in chunks:
+                    exported += chunk.count(b"\n")
+                    yield chunk
+
+            started = time.perf_counter()
+            chunks = counted(
+                project.corpus.export_jokes(batch_size=args.export_batch_size)
+            )
+            if args.gzip:
+                chunks = project.corpus.gzip_chunks(chunks)
+            with open(path, "wb") as output:
+                async for chunk in chunks:
+                    output.write(chunk)
+            export_seconds = time.perf_counter() - started
+            size = os.path.getsize(path)
+            await prisma.models.Joke.prisma().delete_many(
+                where={"submittedBy": owner_id}
+            )
+            read, inserted, import_seconds = await project.corpus.import_jokes(
+                path,
+                checkpoint=os.path.join(directory, "checkpoint.json"),
+                batch_size=args.import_batch_size,
+            )
+    finally:
+        await project.db.disconnect()
+    return {
+        "target": "fake database" if args.fake_db else "DATABASE_URL",
+        "rows": exported,
+        "dump_bytes": size,
+        "gzip": args.gzip,
+        "export_seconds": round(export_seconds, 3),
+        "export_rows_per_second": round(exported / export_seconds),
+        "import_seconds": round(import_seconds, 3),
+        "import_rows_per_second": round(read / import_seconds),
+        "inserted": inserted,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fake-db", action="store_true")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--gzip", action="store_true")
+    parser.add_argument("--export-batch-size", type=int, default=5000)
+    parser.add_argument("--import-batch-size", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=42)
+    print(json.dumps(asyncio.run(main(parser.parse_args())), indent=2))
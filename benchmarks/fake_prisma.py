@@ -0,0 +1,589 @@
+"""
+In-memory stand-in for the generated Prisma client.
+
+Lets the app and the benchmarks run without Postgres (and without running
+`prisma generate`). Call `install()` before anything imports `prisma.models`
+or the `project` package:
+
+    from benchmarks import fake_prisma
+    fake_prisma.install()
+    import project.server
+
+Only the part of the query API that the project uses is implemented:
+find_unique / find_first / find_many (where, order, take, skip), count,
+create / create_many, update / update_many, upsert, delete / delete_many,
+group_by (with sum, order and take), `tx()` and `batch_()`, plus the one raw statement
+the rate limiter flushes with. Filters support equality, equals, not, in, not_in,
+lt, lte, gt, gte, contains, startswith, endswith and AND / OR / NOT.
+Relations, includes and other raw queries are not supported. Every client shares
+one process-wide store, so a "replica" always sees the primary's writes.
+"""
+
+import sys
+import types
+from bisect import bisect_left, bisect_right, insort
+from datetime import datetime, timedelta, timezone
+from enum import Enum
+from typing import Any, Callable, Iterable, NamedTuple
+from uuid import uuid4
+
+from prisma.errors import UniqueViolationError
+
+
+class ModelSpec(NamedTuple):
+    unique: tuple[str, ...]
+    # Non-unique fields with an equality index, like the @@index on Joke.status.
+    indexed: tuple[str, ...] = ()
+    # Fields set to now() on create and on update.
+    created: tuple[str, ...] = ()
+    updated: tuple[str, ...] = ()
+    # Nullable fields, stored as None when not given.
+    optional: tuple[str, ...] = ()
+
+
+MODELS: dict[str, ModelSpec] = {
+    "User": ModelSpec(("id", "email"), (), ("createdAt", "updatedAt"), ("updatedAt",)),
+    "Joke": ModelSpec(("id",), ("status",), ("createdAt", "updatedAt"), ("updatedAt",)),
+    "AuthToken": ModelSpec(("id", "token"), (), ("createdAt",), (), ("revokedAt",)),
+    "RateLimit": ModelSpec(("id", "identifier")),
+    "JokeViewBucket": ModelSpec(("id",)),
+}
+
+ENUMS = {
+    "Role": ("ADMIN", "USER", "MODERATOR"),
+    "JokeStatus": ("PENDING", "APPROVED", "REJECTED"),
+}
+
+_MISSING = object()
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _plain(value: Any) -> Any:
+    return value.value if isinstance(value, Enum) else value
+
+
+def _compare(op: Callable[[Any, Any], bool]) -> Callable[[Any, Any], bool]:
+    return lambda value, arg: value is not None and op(value, _plain(arg))
+
+
+_OPERATORS: dict[str, Callable[[Any, Any], bool]] = {
+    "equals": lambda value, arg: value == _plain(arg),
+    "not": lambda value, arg: not _field_matches(value, arg),
+    "in": lambda value, arg: value in {_plain(item) for item in arg},
+    "not_in": lambda value, arg: value not in {_plain(item) for item in arg},
+    "lt": _compare(lambda value, arg: value < arg),
+    "lte": _compare(lambda value, arg: value <= arg),
+    "gt": _compare(lambda value, arg: value > arg),
+    "gte": _compare(lambda value, arg: value >= arg),
+    "contains": _compare(lambda value, arg: arg in value),
+    "startswith": _compare(lambda value, arg: value.startswith(arg)),
+    "endswith": _compare(lambda value, arg: value.endswith(arg)),
+}
+
+
+def _field_matches(value: Any, condition: Any) -> bool:
+    if isinstance(condition, dict):
+        return all(_OPERATORS[op](value, arg) for op, arg in condition.items())
+    return value == _plain(condition)
+
+
+def _as_list(value: Any) -> list:
+    return value if isinstance(value, list) else [value]
+
+
+def matches(row: dict[str, Any], where: dict[str, Any] | None) -> bool:
+    """
+    Evaluate a Prisma `where` filter against a stored row.
+    """
+    if not where:
+        return True
+    for key, condition in where.items():
+        if key == "AND":
+            if not all(matches(row, part) for part in _as_list(condition)):
+                return False
+        elif key == "OR":
+            if not any(matches(row, part) for part in condition):
+                return False
+        elif key == "NOT":
+            if any(matches(row, part) for part in _as_list(condition)):
+                return False
+        elif not _field_matches(row.get(key), condition):
+            return False
+    return True
+
+
+class Record:
+    """
+    A returned row; fields are plain attributes, like the generated models.
+    """
+
+    def __init__(self, row: dict[str, Any]) -> None:
+        self.__dict__.update(row)
+
+    def __repr__(self) -> str:
+        return f"Record({self.__dict__!r})"
+
+
+class Table:
+    def __init__(self, name: str) -> None:
+        self.name = name
+        self.spec = MODELS[name]
+        self.rows: dict[str, dict[str, Any]] = {}
+        self.sorted_ids: list[str] = []
+        self.indexes: dict[str, dict[Any, str]] = {
+            field: {} for field in self.spec.unique if field != "id"
+        }
+        self.groups: dict[str, dict[Any, set[str]]] = {
+            field: {} for field in self.spec.indexed
+        }
+
+    def clear(self) -> None:
+        self.rows.clear()
+        self.sorted_ids.clear()
+        for index in self.indexes.values():
+            index.clear()
+        for groups in self.groups.values():
+            groups.clear()
+
+    def _conflict(self, field: str) -> UniqueViolationError:
+        return UniqueViolationError(
+            {
+                "user_facing_error": {
+                    "error_code": "P2002",
+                    "message": f"Unique constraint failed on the fields: (`{field}`)",
+                    "meta": {"target": [field]},
+                }
+            }
+        )
+
+    def insert(self, data: dict[str, Any]) -> dict[str, Any]:
+        row = {key: _plain(value) for key, value in data.items()}
+        row.setdefault("id", str(uuid4()))
+        now = _now()
+        for field in self.spec.created:
+            row.setdefault(field, now)
+        for field in self.spec.optional:
+            row.setdefault(field, None)
+        if row["id"] in self.rows:
+            raise self._conflict("id")
+        for field, index in self.indexes.items():
+            if row.get(field) is not None and row[field] in index:
+                raise self._conflict(field)
+        self.rows[row["id"]] = row
+        insort(self.sorted_ids, row["id"])
+        for field, index in self.indexes.items():
+            if row.get(field) is not None:
+                index[row[field]] = row["id"]
+        for field, groups in self.groups.items():
+            groups.setdefault(row.get(field), set()).add(row["id"])
+        return row
+
+    def modify(self, row: dict[str, Any], data: dict[str, Any]) -> dict[str, Any]:
+        changes = {}
+        for field, value in data.items():
+            if isinstance(value, dict):
+                current = row.get(field) or 0
+                if "set" in value:
+                    value = value["set"]
+                elif "increment" in value:
+                    value = current + value["increment"]
+                elif "decrement" in value:
+                    value = current - value["decrement"]
+                elif "multiply" in value:
+                    value = current * value["multiply"]
+                elif "divide" in value:
+                    value = current / value["divide"]
+            changes[field] = _plain(value)
+        for field, index in self.indexes.items():
+            if field in changes and changes[field] != row.get(field):
+                if index.get(changes[field], row["id"]) != row["id"]:
+                    raise self._conflict(field)
+                index.pop(row.get(field), None)
+                index[changes[field]] = row["id"]
+        for field, groups in self.groups.items():
+            if field in changes and changes[field] != row.get(field):
+                groups[row.get(field)].discard(row["id"])
+                groups.setdefault(changes[field], set()).add(row["id"])
+        now = _now()
+        for field in self.spec.updated:
+            changes.setdefault(field, now)
+        row.update(changes)
+        return row
+
+    def remove(self, row: dict[str, Any]) -> None:
+        del self.rows[row["id"]]
+        del self.sorted_ids[bisect_left(self.sorted_ids, row["id"])]
+        for field, index in self.indexes.items():
+            index.pop(row.get(field), None)
+        for field, groups in self.groups.items():
+            groups[row.get(field)].discard(row["id"])
+
+    def _candidates(self, where: dict[str, Any]) -> Iterable[dict[str, Any]]:
+        for field, groups in self.groups.items():
+            condition = where.get(field)
+            if condition is not None and not isinstance(condition, dict):
+                return [
+                    self.rows[row_id] for row_id in groups.get(_plain(condition), ())
+                ]
+        return self.rows.values()
+
+    def lookup(self, where: dict[str, Any]) -> dict[str, Any] | None:
+        for field, value in where.items():
+            if field == "id":
+                row = self.rows.get(value)
+            elif field in self.indexes:
+                row = self.rows.get(self.indexes[field].get(_plain(value)))
+            else:
+                continue
+            return row if row is not None and matches(row, where) else None
+        return next((row for row in self.rows.values() if matches(row, where)), None)
+
+    def _id_range(self, where: dict[str, Any]) -> Iterable[str]:
+        bounds = where.get("id")
+        start, stop = 0, len(self.sorted_ids)
+        if isinstance(bounds, dict):
+            if "gt" in bounds:
+                start = bisect_right(self.sorted_ids, bounds["gt"])
+            elif "gte" in bounds:
+                start = bisect_left(self.sorted_ids, bounds["gte"])
+            if "lt" in bounds:
+                stop = bisect_left(self.sorted_ids, bounds["lt"])
+            elif "lte" in bounds:
+                stop = bisect_right(self.sorted_ids, bounds["lte"])
+        return (self.sorted_ids[i] for i in range(start, stop))
+
+    def select(
+        self,
+        where: dict[str, Any] | None = None,
+        order: dict | list[dict] | None = None,
+        take: int | None = None,
+        skip: int | None = None,
+    ) -> list[dict[str, Any]]:
+        where = where or {}
+        orders = [
+            (field, direction)
+            for part in _as_list(order or [])
+            for field, direction in part.items()
+        ]
+        limit = None if take is None else (skip or 0) + take
+        if orders in ([], [("id", "asc")]):
+            # Walk the primary key in order and stop early, like an index scan.
+            found = []
+            for row_id in self._id_range(where):
+                row = self.rows[row_id]
+                if matches(row, where):
+                    found.append(row)
+                    if limit is not None and len(found) >= limit:
+                        break
+        else:
+            found = [row for row in self._candidates(where) if matches(row, where)]
+            for field, direction in reversed(orders):
+                found.sort(
+                    key=lambda row: (row.get(field) is None, row.get(field)),
+                    reverse=direction == "desc",
+                )
+        return found[skip or 0 : limit]
+
+
+class Database:
+    """
+    The process-wide store shared by every fake client.
+    """
+
+    def __init__(self) -> None:
+        self.tables = {name: Table(name) for name in MODELS}
+
+    def clear(self) -> None:
+        for table in self.tables.values():
+            table.clear()
+
+
+database = Database()
+
+
+class Actions:
+    """
+    Query methods of one model, mirroring the generated `<Model>Actions`.
+    """
+
+    def __init__(self, table: Table) -> None:
+        self._table = table
+
+    async def find_unique(self, where: dict[str, Any], **_: Any) -> Record | None:
+        row = self._table.lookup(where)
+        return Record(row) if row is not None else None
+
+    async def find_first(
+        self,
+        where: dict[str, Any] | None = None,
+        order: dict | list[dict] | None = None,
+        skip: int | None = None,
+        **_: Any,
+    ) -> Record | None:
+        rows = self._table.select(where, order, take=1, skip=skip)
+        return Record(rows[0]) if rows else None
+
+    async def find_many(
+        self,
+        where: dict[str, Any] | None = None,
+        order: dict | list[dict] | None = None,
+        take: int | None = None,
+        skip: int | None = None,
+        **_: Any,
+    ) -> list[Record]:
+        return [Record(row) for row in self._table.select(where, order, take, skip)]
+
+    async def count(self, where: dict[str, Any] | None = None, **_: Any) -> int:
+        return sum(1 for row in self._table.rows.values() if matches(row, where))
+
+    async def create(self, data: dict[str, Any], **_: Any) -> Record:
+        return Record(self._table.insert(data))
+
+    async def create_many(
+        self, data: list[dict[str, Any]], *, skip_duplicates: bool = False
+    ) -> int:
+        created = 0
+        for item in data:
+            try:
+                self._table.insert(item)
+                created += 1
+            except UniqueViolationError:
+                if not skip_duplicates:
+                    raise
+        return created
+
+    async def update(
+        self, data: dict[str, Any], where: dict[str, Any], **_: Any
+    ) -> Record | None:
+        row = self._table.lookup(where)
+        if row is None:
+            return None
+        return Record(self._table.modify(row, data))
+
+    async def update_many(self, data: dict[str, Any], where: dict[str, Any]) -> int:
+        rows = [row for row in self._table.rows.values() if matches(row, where)]
+        for row in rows:
+            self._table.modify(row, data)
+        return len(rows)
+
+    async def upsert(
+        self, where: dict[str, Any], data: dict[str, Any], **_: Any
+    ) -> Record:
+        row = self._table.lookup(where)
+        if row is None:
+            return Record(self._table.insert(data["create"]))
+        return Record(self._table.modify(row, data["update"]))
+
+    async def delete(self, where: dict[str, Any], **_: Any) -> Record | None:
+        row = self._table.lookup(where)
+        if row is None:
+            return None
+        self._table.remove(row)
+        return Record(row)
+
+    async def group_by(
+        self,
+        by: list[str],
+        where: dict[str, Any] | None = None,
+        sum: dict[str, bool] | None = None,
+        order: dict | list[dict] | None = None,
+        take: int | None = None,
+        **_: Any,
+    ) -> list[dict[str, Any]]:
+        groups: dict[tuple, dict[str, Any]] = {}
+        for row in self._table.select(where):
+            key = tuple(row.get(field) for field in by)
+            group = groups.get(key)
+            if group is None:
+                group = groups[key] = dict(zip(by, key))
+                if sum:
+                    group["_sum"] = {field: 0 for field in sum}
+            for field in sum or ():
+                group["_sum"][field] += row.get(field) or 0
+        found = list(groups.values())
+        # Ordered by grouped fields, e.g. {"jokeId": "asc"}, or aggregates,
+        # e.g. {"_sum": {"views": "desc"}}.
+        for part in reversed(_as_list(order or [])):
+            for field, direction in reversed(list(part.items())):
+                if isinstance(direction, dict):
+                    ((inner, direction),) = direction.items()
+                    key = lambda group: group[field][inner]
+                else:
+                    key = lambda group: group[field]
+                found.sort(key=key, reverse=direction == "desc")
+        return found[:take]
+
+    async def delete_many(self, where: dict[str, Any] | None = None) -> int:
+        rows = [row for row in self._table.rows.values() if matches(row, where)]
+        for row in rows:
+            self._table.remove(row)
+        return len(rows)
+
+    async def query_raw(self, query: str, *args: Any) -> list[Record]:
+        # Emulates project.rate_limit's spend statement and nothing else.
+        if self._table.name != "RateLimit" or "unnest" not in query:
+            raise NotImplementedError("raw queries are not supported by the fake")
+        identifiers, seconds, points, wall = args
+        wall = wall.replace(tzinfo=timezone.utc)
+        found = []
+        for identifier, delay, spent in zip(identifiers, seconds, points):
+            row = self._table.lookup({"identifier": identifier})
+            if row is None:
+                row = self._table.insert(
+                    {
+                        "identifier": identifier,
+                        "points": spent,
+                        "resetAt": wall + timedelta(seconds=delay),
+                    }
+                )
+            else:
+                row = self._table.modify(
+                    row,
+                    {
+                        "points": row["points"] + spent,
+                        "resetAt": max(row["resetAt"], wall) + timedelta(seconds=delay),
+                    },
+                )
+            found.append(Record(row))
+        return found
+
+
+class FakeModel:
+    """
+    Base of the fake `prisma.models` classes; `Model.prisma()` returns its actions.
+    """
+
+    __table__ = ""
+
+    @classmethod
+    def prisma(cls, client: Any = None) -> Actions:
+        return Actions(database.tables[cls.__table__])
+
+
+class _BatchModel:
+    def __init__(self, operations: list, table: Table) -> None:
+        self._operations = operations
+        self._actions = Actions(table)
+
+    def __getattr__(self, method: str) -> Callable[..., None]:
+        action = getattr(self._actions, method)
+        return lambda **kwargs: self._operations.append((action, kwargs))
+
+
+class Batch:
+    """
+    Queues writes and runs them in order when the `batch_()` block exits.
+    """
+
+    def __init__(self) -> None:
+        self._operations: list = []
+        for name, table in database.tables.items():
+            setattr(self, name.lower(), _BatchModel(self._operations, table))
+
+    async def __aenter__(self) -> "Batch":
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        if exc_type is None:
+            for action, kwargs in self._operations:
+                await action(**kwargs)
+
+
+class Transaction:
+    """
+    `tx()` stand-in. Queries run directly on the shared store, so there is no
+    isolation or rollback; the single event loop makes each query atomic.
+    """
+
+    def __init__(self, client: "Prisma") -> None:
+        self._client = client
+
+    async def __aenter__(self) -> "Prisma":
+        return self._client
+
+    async def __aexit__(self, exc_type, exc, tb) -> None:
+        pass
+
+
+class _Metrics:
+    counters: list = []
+    gauges: list = []
+    histograms: list = []
+
+
+class Prisma:
+    """
+    Fake `prisma.Prisma`; connection settings are accepted and ignored.
+    """
+
+    def __init__(self, auto_register: bool = False, **_: Any) -> None:
+        self._connected = False
+        if auto_register:
+            register(self)
+
+    async def connect(self, **_: Any) -> None:
+        self._connected = True
+
+    async def disconnect(self, **_: Any) -> None:
+        self._connected = False
+
+    def is_connected(self) -> bool:
+        return self._connected
+
+    def tx(self, **_: Any) -> Transaction:
+        return Transaction(self)
+
+    def batch_(self) -> Batch:
+        return Batch()
+
+    async def get_metrics(self, format: str = "json", **_: Any) -> Any:
+        return "" if format == "prometheus" else _Metrics()
+
+    async def execute_raw(self, query: str, *args: Any) -> int:
+        # Only used for NOTIFY, which has no effect on the stored rows.
+        return 0
+
+
+_client: Prisma | None = None
+
+
+def register(client: Prisma) -> None:
+    global _client
+    _client = client
+
+
+def get_client() -> Prisma:
+    if _client is None:
+        raise RuntimeError("No fake Prisma client has been registered")
+    return _client
+
+
+def install() -> None:
+    """
+    Replace `prisma.Prisma`, `prisma.models` and `prisma.enums` with the fakes.
+
+    Must run before `prisma.models` or any `project` module is imported.
+    """
+    if "project.db" in sys.modules or "prisma.models" in sys.modules:
+        if getattr(sys.modules.get("prisma.models"), "__fake__", False):
+            return
+        raise RuntimeError("fake_prisma.install() must run before importing project")
+    import prisma
+
+    models = types.ModuleType("prisma.models")
+    models.__fake__ = True
+    for name in MODELS:
+        setattr(models, name, type(name, (FakeModel,), {"__table__": name}))
+    enums = types.ModuleType("prisma.enums")
+    for name, members in ENUMS.items():
+        setattr(
+            enums, name, Enum(name, {member: member for member in members}, type=str)
+        )
+    sys.modules["prisma.models"] = prisma.models = models
+    sys.modules["prisma.enums"] = prisma.enums = enums
+    prisma.Prisma = Prisma
+    prisma.register = register
+    prisma.get_client = get_client
@@ -0,0 +1,400 @@
+"""
+Seeded load test reporting throughput and p50/p95/p99 per endpoint as JSON.
+
+Seeds `--jokes` jokes and `--users` login users, then replays a workload
+trace with `--concurrency` concurrent clients for `--duration` seconds
+(after `--warmup` seconds that are not recorded) against one of:
+
+* the app in-process on the in-memory Prisma stand-in (`--fake-db`; no
+  Postgres, no `prisma generate`)
+* the app in-process on the database in DATABASE_URL (the default)
+* a running server (`--base-url`); seeding goes to DATABASE_URL, so run
+  with `--seed-only` before starting the server to have the jokes in its
+  pool from the start
+
+Rate limiting is turned off for in-process runs unless RATE_LIMIT_ENABLED
+is set. A trace is JSON lines of `{"op": ..., "params": {...}, "weight": n}`
+(see benchmarks/workload.jsonl); each line is repeated `weight` times and
+the result is shuffled unless `--in-order` is given. Ops: random,
+random_batch, search, submit, login, moderate, moderation_queue. Submits
+carry a bearer token of a random seeded user and the moderation ops one of
+the seed account, which is made a MODERATOR. Tokens are signed with
+JWT_SECRET_KEY, which must therefore match the server's when using
+`--base-url`.
+
+With `--baseline`, exits with status 1 if any endpoint's p95 rose, or its
+throughput fell, by more than `--tolerance` relative to the baseline run.
+
+Usage:
+    python -m benchmarks.load_test --fake-db [--jokes 10000] [--users 50] \\
+        [--concurrency 32] [--duration 10] [--trace benchmarks/workload.jsonl] \\
+        [--output result.json] [--baseline base.json --tolerance 0.25]
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable
+from uuid import uuid4
+
+import httpx
+
+DEFAULT_TRACE = Path(__file__).with_name("workload.jsonl")
+
+SEED_EMAIL = "load-test-seed@example.com"
+
+USER_EMAIL = "load-test-{}@example.com"
+
+USER_PASSWORD = "load-test-password"
+
+SEED_CHUNK = 5000
+
+WORDS = (
+    "dad pun cheese egg chicken road ghost skeleton bicycle ladder fish "
+    "calendar coffee cow moon atom pencil cookie tomato bakery spider "
+    "piano zombie scarecrow library ocean robot penguin pirate vampire"
+).split()
+
+
+@dataclass
+class Workload:
+    users: list[str]
+    pending_ids: list[str]
+    tokens: list[str]
+    moderator_token: str
+    rng: random.Random = field(default_factory=random.Random)
+
+
+def _random(entry: dict, workload: Workload) -> tuple[str, str, dict]:
+    return "GET", "/jokes/random", {}
+
+
+def _random_batch(entry: dict, workload: Workload) -> tuple[str, str, dict]:
+    return "GET", "/jokes/random", {"count": 10}
+
+
+def _search(entry: dict, workload: Workload) -> tuple[str, str, dict]:
+    return "GET", "/jokes/search", {"q": workload.rng.choice(WORDS)}
+
+
+def _submit(entry: dict, workload: Workload) -> tuple[str, str, dict]:
+    words = " ".join(workload.rng.sample(WORDS, 6))
+    return "POST", "/jokes/submit", {"content": f"{words} {uuid4()}"}
+
+
+def _login(entry: dict, workload: Workload) -> tuple[str, str, dict]:
+    email = workload.rng.choice(workload.users)
+    return "POST", "/auth/login", {"email": email, "password": USER_PASSWORD}
+
+
+def _moderate(entry: dict, workload: Workload) -> tuple[str, str, dict]:
+    return (
+        "PUT",
+        "/jokes/moderate",
+        {
+            "joke_id": workload.rng.choice(workload.pending_ids),
+            "new_status": workload.rng.choice(("APPROVED", "REJECTED")),
+        },
+    )
+
+
+def _moderation_queue(entry: dict, workload: Workload) -> tuple[str, str, dict]:
+    return "GET", "/jokes/moderation-queue", {"limit": 50}
+
+
+# Ops sent with a seeded user's bearer token.
+AUTHENTICATED_OPS = {"submit"}
+
+# Ops sent with the seed account's moderator token.
+MODERATOR_OPS = {"moderate", "moderation_queue"}
+
+OPS: dict[str, Callable[[dict, Workload], tuple[str, str, dict]]] = {
+    "random": _random,
+    "random_batch": _random_batch,
+    "search": _search,
+    "submit": _submit,
+    "login": _login,
+    "moderate": _moderate,
+    "moderation_queue": _moderation_queue,
+}
+
+
+def load_trace(path: Path, rng: random.Random, in_order: bool) -> list[dict]:
+    trace = []
+    for number, line in enumerate(path.read_text().splitlines(), 1):
+        if not line.strip():
+            continue
+        entry = json.loads(line)
+        if entry.get("op") not in OPS:
+            raise SystemExit(f"{path}:{number}: unknown op {entry.get('op')!r}")
+        trace.extend([entry] * int(entry.get("weight", 1)))
+    if not in_order:
+        rng.shuffle(trace)
+    return trace
+
+
+async def seed(
+    jokes: int, users: int, pending_ratio: float, rng: random.Random
+) -> Workload:
+    """
+    Top up the benchmark jokes and users; safe to run repeatedly.
+    """
+    import prisma.models
+    from project.auth_tokens import encode_token
+    from project.password_hashing import password_hasher
+
+    owner = await prisma.models.User.prisma().upsert(
+        where={"email": SEED_EMAIL},
+        data={
+            "create": {"email": SEED_EMAIL, "password": "!", "role": "MODERATOR"},
+            "update": {"role": "MODERATOR"},
+        },
+    )
+    existing = await prisma.models.Joke.prisma().count(where={"submittedBy": owner.id})
+    while existing < jokes:
+        chunk = min(SEED_CHUNK, jokes - existing)
+        await prisma.models.Joke.prisma().create_many(
+            data=[
+                {
+                    "content": " ".join(rng.sample(WORDS, 8)) + f" #{existing + i}",
+                    "status": "PENDING" if rng.random() < pending_ratio else "APPROVED",
+                    "submittedBy": owner.id,
+                }
+                for i in range(chunk)
+            ]
+        )
+        existing += chunk
+    emails = [USER_EMAIL.format(i) for i in range(users)]
+    hashed = await password_hasher.hash(USER_PASSWORD)
+    await prisma.models.User.prisma().create_many(
+        data=[{"email": email, "password": hashed, "role": "USER"} for email in emails],
+        skip_duplicates=True,
+    )
+    pending = await prisma.models.Joke.prisma().find_many(
+        where={"submittedBy": owner.id, "status": "PENDING"}, take=1000
+    )
+    users = await prisma.models.User.prisma().find_many(where={"email": {"in": emails}})
+    tokens = [
+        encode_token(
+            {"sub": user.email, "uid": user.id, "role": "USER"}, timedelta(days=1)
+        )
+        for user in users
+    ]
+    return Workload(
+        users=emails,
+        pending_ids=[joke.id for joke in pending],
+        tokens=tokens,
+        moderator_token=encode_token(
+            {"sub": owner.email, "uid": owner.id, "role": "MODERATOR"},
+            timedelta(days=1),
+        ),
+        rng=rng,
+    )
+
+
+def percentile(ordered: list[float], fraction: float) -> float:
+    return ordered[max(0, math.ceil(fraction * len(ordered)) - 1)]
+
+
+def summarize(latencies: list[float], statuses: Counter, elapsed: float) -> dict:
+    ordered = sorted(latencies)
+    if not ordered:
+        return {"requests": 0}
+    return {
+        "requests": len(ordered),
+        "errors": sum(
+            count
+            for status, count in statuses.items()
+            if status == "error" or int(status) >= 500
+        ),
+        "throughput_rps": round(len(ordered) / elapsed, 1),
+        "p50_ms": round(percentile(ordered, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(ordered, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(ordered, 0.99) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+        "statuses": dict(sorted(statuses.items())),
+    }
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    trace: list[dict],
+    workload: Workload,
+    concurrency: int,
+    duration: float,
+    warmup: float,
+) -> dict:
+    latencies: dict[str, list[float]] = defaultdict(list)
+    statuses: dict[str, Counter] = defaultdict(Counter)
+    entries = itertools.cycle(trace)
+    record_from = time.perf_counter() + warmup
+    deadline = record_from + duration
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            entry = next(entries)
+            method, url, params = OPS[entry["op"]](entry, workload)
+            params.update(entry.get("params", {}))
+            headers = {}
+            if entry["op"] in AUTHENTICATED_OPS:
+                headers["Authorization"] = (
+                    f"Bearer {workload.rng.choice(workload.tokens)}"
+                )
+            elif entry["op"] in MODERATOR_OPS:
+                headers["Authorization"] = f"Bearer {workload.moderator_token}"
+            started = time.perf_counter()
+            try:
+                response = await client.request(
+                    method, url, params=params, headers=headers
+                )
+                status = str(response.status_code)
+            except Exception:
+                status = "error"
+            if started >= record_from:
+                latencies[entry["op"]].append(time.perf_counter() - started)
+                statuses[entry["op"]][status] += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - record_from
+    total_statuses: Counter = Counter()
+    for counts in statuses.values():
+        total_statuses.update(counts)
+    return {
+        "endpoints": {
+            op: summarize(latencies[op], statuses[op], elapsed)
+            for op in sorted(latencies)
+        },
+        "total": summarize(
+            list(itertools.chain.from_iterable(latencies.values())),
+            total_statuses,
+            elapsed,
+        ),
+        "measured_seconds": round(elapsed, 2),
+    }
+
+
+def regressions(result: dict, baseline: dict, tolerance: float) -> list[str]:
+    found = []
+    for op, before in baseline["endpoints"].items():
+        after = result["endpoints"].get(op)
+        if not after or not after.get("requests") or not before.get("requests"):
+            continue
+        if after["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{op}: p95 {before['p95_ms']}ms -> {after['p95_ms']}ms")
+        if after["throughput_rps"] < before["throughput_rps"] * (1 - tolerance):
+            found.append(
+                f"{op}: throughput {before['throughput_rps']} -> "
+                f"{after['throughput_rps']} req/s"
+            )
+    return found
+
+
+async def main(args: argparse.Namespace) -> dict | None:
+    if args.fake_db:
+        from benchmarks import fake_prisma
+
+        fake_prisma.install()
+    if not args.base_url:
+        os.environ.setdefault("RATE_LIMIT_ENABLED", "0")
+    import project.db
+
+    rng = random.Random(args.seed)
+    trace = load_trace(args.trace, rng, args.in_order)
+    await project.db.connect()
+    try:
+        workload = await seed(args.jokes, args.users, args.pending_ratio, rng)
+    finally:
+        await project.db.disconnect()
+    if args.seed_only:
+        return None
+    if "moderate" in {entry["op"] for entry in trace} and not workload.pending_ids:
+        raise SystemExit("the trace moderates jokes but none were seeded as pending")
+    limits = httpx.Limits(max_connections=args.concurrency)
+    result: dict[str, Any] = {
+        "target": args.base_url
+        or ("in-process, fake database" if args.fake_db else "in-process"),
+        "trace": str(args.trace),
+        "concurrency": args.concurrency,
+        "seeded": {"jokes": args.jokes, "users": args.users},
+    }
+    if args.base_url:
+        from project.password_hashing import password_hasher
+
+        password_hasher.shutdown()
+        async with httpx.AsyncClient(
+            base_url=args.base_url, limits=limits, timeout=30
+        ) as client:
+            result.update(
+                await run_load(
+                    client,
+                    trace,
+                    workload,
+                    args.concurrency,
+                    args.duration,
+                    args.warmup,
+                )
+            )
+        return result
+    import project.server
+
+    app = project.server.app
+    transport = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+    async with app.router.lifespan_context(app):
+        async with httpx.AsyncClient(
+            transport=transport, base_url="http://load-test", limits=limits
+        ) as client:
+            result.update(
+                await run_load(
+                    client,
+                    trace,
+                    workload,
+                    args.concurrency,
+                    args.duration,
+                    args.warmup,
+                )
+            )
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fake-db", action="store_true")
+    parser.add_argument("--base-url")
+    parser.add_argument("--seed-only", action="store_true")
+    parser.add_argument("--jokes", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--pending-ratio", type=float, default=0.1)
+    parser.add_argument("--trace", type=Path, default=DEFAULT_TRACE)
+    parser.add_argument("--in-order", action="store_true")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0)
+    parser.add_argument("--warmup", type=float, default=2.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", type=Path)
+    parser.add_argument("--baseline", type=Path)
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args()
+    result = asyncio.run(main(args))
+    if result is None:
+        sys.exit(0)
+    text = json.dumps(result, indent=2)
+    print(text)
+    if args.output:
+        args.output.write_text(text + "\n")
+    if args.baseline:
+        found = regressions(
+            result, json.loads(args.baseline.read_text()), args.tolerance
+        )
+        for line in found:
+            print(f"regression: {line}", file=sys.stderr)
+        sys.exit(1 if found else 0)
@@ -0,0 +1,106 @@
+"""
+/jokes/random latency while /auth/login is under load.
+
+Measures /jokes/random p50/p99 against a running server, first on its own
+and then while `--login-concurrency` clients hammer /auth/login. With bcrypt
+running on the password hashing pool the two p99 figures should be close;
+logins beyond the pool's capacity are answered with 503.
+
+Usage:
+    python -m benchmarks.login_load --base-url http://localhost:8000 \\
+        --email user@example.com --password secret [--seed]
+
+`--seed` creates the login user with a real bcrypt hash through Prisma.
+"""
+
+import argparse
+import asyncio
+import collections
+import statistics
+import time
+
+import httpx
+
+
+async def seed_user(email: str, password: str) -> None:
+    import prisma.models
+    import project.db
+    from project.password_hashing import password_hasher
+
+    await project.db.connect()
+    try:
+        hashed = await password_hasher.hash(password)
+        await prisma.models.User.prisma().upsert(
+            where={"email": email},
+            data={
+                "create": {"email": email, "password": hashed, "role": "USER"},
+                "update": {"password": hashed},
+            },
+        )
+    finally:
+        password_hasher.shutdown()
+        await project.db.disconnect()
+
+
+async def sample_random(client: httpx.AsyncClient, duration: float) -> list[float]:
+    latencies = []
+    deadline = time.perf_counter() + duration
+    while time.perf_counter() < deadline:
+        started = time.perf_counter()
+        await client.get("/jokes/random")
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+async def hammer_login(
+    client: httpx.AsyncClient,
+    email: str,
+    password: str,
+    stop: asyncio.Event,
+    statuses: collections.Counter,
+) -> None:
+    while not stop.is_set():
+        response = await client.post(
+            "/auth/login", params={"email": email, "password": password}
+        )
+        statuses[response.status_code] += 1
+
+
+def summarize(label: str, latencies: list[float]) -> None:
+    latencies.sort()
+    p99 = latencies[max(0, int(len(latencies) * 0.99) - 1)]
+    print(
+        f"{label:<16} n={len(latencies):<6} "
+        f"p50={statistics.median(latencies):.2f}ms p99={p99:.2f}ms"
+    )
+
+
+async def main(args: argparse.Namespace) -> None:
+    if args.seed:
+        await seed_user(args.email, args.password)
+    limits = httpx.Limits(max_connections=args.login_concurrency + 4)
+    async with httpx.AsyncClient(base_url=args.base_url, limits=limits) as client:
+        summarize("idle", await sample_random(client, args.duration))
+        stop = asyncio.Event()
+        statuses: collections.Counter = collections.Counter()
+        loaders = [
+            asyncio.create_task(
+                hammer_login(client, args.email, args.password, stop, statuses)
+            )
+            for _ in range(args.login_concurrency)
+        ]
+        summarize("under login load", await sample_random(client, args.duration))
+        stop.set()
+        await asyncio.gather(*loaders)
+    print("login statuses:", dict(statuses))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--base-url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--seed", action="store_true")
+    parser.add_argument("--login-concurrency", type=int, default=64)
+    parser.add_argument("--duration", type=float, default=10.0)
+    asyncio.run(main(parser.parse_args()))
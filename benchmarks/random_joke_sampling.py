@@ -0,0 +1,90 @@
+"""
+Latency of database-side random joke sampling as the Joke table grows.
+
+Seeds the database pointed to by DATABASE_URL in steps (1k, 10k, 100k, 1M
+approved jokes by default) and, at each step, times `sample_approved_joke`
+with the in-process pool bypassed. p50/p99 should stay flat across sizes.
+
+Usage:
+    python -m benchmarks.random_joke_sampling [--sizes 1000,10000] [--samples 2000]
+
+The seeded rows are left in place so later runs only insert the difference.
+"""
+
+import argparse
+import asyncio
+import statistics
+import time
+from uuid import uuid4
+
+import prisma
+import prisma.models
+import project.db
+from project.get_random_joke_service import sample_approved_joke
+
+SEED_EMAIL = "benchmark-seed@example.com"
+
+SEED_CHUNK = 5000
+
+
+async def ensure_seed_user() -> str:
+    user = await prisma.models.User.prisma().upsert(
+        where={"email": SEED_EMAIL},
+        data={
+            "create": {"email": SEED_EMAIL, "password": "!", "role": "USER"},
+            "update": {},
+        },
+    )
+    return user.id
+
+
+async def seed_to(size: int, user_id: str) -> None:
+    existing = await prisma.models.Joke.prisma().count(where={"status": "APPROVED"})
+    while existing < size:
+        chunk = min(SEED_CHUNK, size - existing)
+        await prisma.models.Joke.prisma().create_many(
+            data=[
+                {
+                    "content": f"Benchmark joke {uuid4()}",
+                    "status": "APPROVED",
+                    "submittedBy": user_id,
+                }
+                for _ in range(chunk)
+            ]
+        )
+        existing += chunk
+
+
+async def measure(samples: int) -> tuple[float, float]:
+    latencies = []
+    for _ in range(samples):
+        started = time.perf_counter()
+        await sample_approved_joke()
+        latencies.append((time.perf_counter() - started) * 1000)
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    return p50, p99
+
+
+async def main(sizes: list[int], samples: int) -> None:
+    # The service reads through project.db's registered client, so that is
+    # the one to connect rather than a second client of our own.
+    await project.db.connect()
+    try:
+        user_id = await ensure_seed_user()
+        print(f"{'rows':>10} {'p50 ms':>10} {'p99 ms':>10}")
+        for size in sizes:
+            await seed_to(size, user_id)
+            p50, p99 = await measure(samples)
+            print(f"{size:>10} {p50:>10.3f} {p99:>10.3f}")
+    finally:
+        await project.db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="1000,10000,100000,1000000")
+    parser.add_argument("--samples", type=int, default=2000)
+    args = parser.parse_args()
+    asyncio.run(main([int(size) for size in args.sizes.split(",")], args.samples))
@@ -0,0 +1,100 @@
+"""
+Requests/sec per core for /jokes/random: pydantic response path vs pre-encoded bytes.
+
+Drives two minimal FastAPI apps directly over ASGI in one process, so the
+numbers measure only routing and response building on a single core:
+
+* before: the handler returns a GetRandomJokeResponse and FastAPI validates
+  it against the response model and serializes it with jsonable_encoder
+* after: the handler returns the JSON bytes pre-encoded by the joke pool
+
+Usage:
+    python -m benchmarks.response_encoding [--requests 20000] [--jokes 10000]
+"""
+
+import argparse
+import asyncio
+import time
+
+from fastapi import FastAPI
+from project.fast_json import json_bytes_response, orjson
+from project.get_random_joke_service import GetRandomJokeResponse
+from project.joke_pool import ApprovedJokePool
+
+
+class _Joke:
+    def __init__(self, joke_id: str, content: str) -> None:
+        self.id = joke_id
+        self.content = content
+        self.updatedAt = None
+
+
+def build_apps(pool: ApprovedJokePool) -> tuple[FastAPI, FastAPI]:
+    before = FastAPI()
+    after = FastAPI()
+
+    @before.get("/jokes/random", response_model=GetRandomJokeResponse)
+    async def random_model() -> GetRandomJokeResponse:
+        joke_id, content = pool.random()
+        return GetRandomJokeResponse(id=joke_id, content=content, status="APPROVED")
+
+    @after.get("/jokes/random", response_model=GetRandomJokeResponse)
+    async def random_bytes():
+        return json_bytes_response(pool.random_payload())
+
+    return before, after
+
+
+async def drive(app: FastAPI, requests: int) -> float:
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": "GET",
+        "scheme": "http",
+        "path": "/jokes/random",
+        "raw_path": b"/jokes/random",
+        "query_string": b"",
+        "root_path": "",
+        "headers": [(b"host", b"bench")],
+        "client": ("127.0.0.1", 50000),
+        "server": ("bench", 80),
+    }
+
+    async def receive() -> dict:
+        return {"type": "http.request", "body": b"", "more_body": False}
+
+    async def send(message: dict) -> None:
+        pass
+
+    for _ in range(min(1000, requests)):
+        await app(dict(scope), receive, send)
+    started = time.perf_counter()
+    for _ in range(requests):
+        await app(dict(scope), receive, send)
+    return requests / (time.perf_counter() - started)
+
+
+async def main(requests: int, jokes: int) -> None:
+    pool = ApprovedJokePool()
+    pool.replace_all(
+        [
+            _Joke(f"{i:08d}-0000-4000-8000-000000000000", f"Dad joke number {i}")
+            for i in range(jokes)
+        ]
+    )
+    before, after = build_apps(pool)
+    before_rps = await drive(before, requests)
+    after_rps = await drive(after, requests)
+    print(f"encoder: {'orjson' if orjson is not None else 'json (stdlib)'}")
+    print(f"before (pydantic + response_model): {before_rps:>9.0f} req/s")
+    print(f"after (pre-encoded bytes):          {after_rps:>9.0f} req/s")
+    print(f"speed-up: {after_rps / before_rps:.2f}x")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--requests", type=int, default=20000)
+    parser.add_argument("--jokes", type=int, default=10000)
+    args = parser.parse_args()
+    asyncio.run(main(args.requests, args.jokes))
@@ -0,0 +1,80 @@
+"""
+Query latency and memory of the in-process joke search index by corpus size.
+
+Builds a SearchIndex over a synthetic corpus at each size and reports build
+time, index memory and p50/p99 latency for whole-word and prefix queries.
+Runs entirely in-process; no database is needed.
+
+Usage:
+    python -m benchmarks.search_index [--sizes 10000,100000,1000000] [--queries 2000]
+"""
+
+import argparse
+import random
+import statistics
+import time
+
+from project.search_index import SearchIndex
+
+WORDS = 20000
+
+
+def make_vocabulary(rng: random.Random) -> list[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return [
+        "".join(rng.choice(letters) for _ in range(rng.randint(3, 9)))
+        for _ in range(WORDS)
+    ]
+
+
+def make_joke(rng: random.Random, vocabulary: list[str]) -> str:
+    # Zipf-like word choice so common words have long postings lists.
+    return " ".join(
+        vocabulary[min(int(rng.paretovariate(0.6)) - 1, WORDS - 1)]
+        for _ in range(rng.randint(8, 25))
+    )
+
+
+def percentiles(latencies: list[float]) -> tuple[float, float]:
+    latencies.sort()
+    return statistics.median(latencies), latencies[int(len(latencies) * 0.99) - 1]
+
+
+def run(size: int, queries: int, rng: random.Random, vocabulary: list[str]) -> None:
+    index = SearchIndex()
+    started = time.perf_counter()
+    for i in range(size):
+        index.add(f"joke-{i}", make_joke(rng, vocabulary))
+    build = time.perf_counter() - started
+    word_latencies = []
+    prefix_latencies = []
+    for _ in range(queries):
+        distinct = sorted(set(make_joke(rng, vocabulary).split()))
+        words = rng.sample(distinct, min(2, len(distinct)))
+        started = time.perf_counter()
+        index.search(" ".join(words), prefix=False)
+        word_latencies.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        index.search(words[0][:3], prefix=True)
+        prefix_latencies.append((time.perf_counter() - started) * 1000)
+    word_p50, word_p99 = percentiles(word_latencies)
+    prefix_p50, prefix_p99 = percentiles(prefix_latencies)
+    print(
+        f"{size:>9} {build:>8.2f}s {index.memory_bytes() / 2**20:>9.1f} "
+        f"{word_p50:>9.3f} {word_p99:>9.3f} {prefix_p50:>9.3f} {prefix_p99:>9.3f}"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", default="10000,100000,1000000")
+    parser.add_argument("--queries", type=int, default=2000)
+    args = parser.parse_args()
+    rng = random.Random(42)
+    vocabulary = make_vocabulary(rng)
+    print(
+        f"{'jokes':>9} {'build':>9} {'mem MiB':>9} "
+        f"{'word p50':>9} {'word p99':>9} {'pfx p50':>9} {'pfx p99':>9}"
+    )
+    for size in (int(size) for size in args.sizes.split(",")):
+        run(size, args.queries, rng, vocabulary)
@@ -0,0 +1,139 @@
+"""
+Time from a fresh worker process to its first /jokes/random response.
+
+Each scenario starts new interpreters that import `project.server`, run the
+app's startup and serve one request in-process, and reports the median of
+each phase as JSON:
+
+* `database` - no JOKE_SNAPSHOT_PATH; the pool is loaded from the database
+* `snapshot_build` - the first worker on a host, which builds the snapshot
+* `snapshot_mapped` - every later worker, which maps the existing snapshot
+
+With `--fake-db` every process seeds the same `--jokes` approved jokes into
+the in-memory Prisma stand-in before the clock starts (so the import time
+excludes the `prisma` package, which the stand-in loads); without it the
+workers use DATABASE_URL as it is.
+
+Usage:
+    python -m benchmarks.startup_time --fake-db [--jokes 100000] [--repeat 3]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+
+SEED_CHUNK = 10000
+
+
+async def seed(jokes: int) -> None:
+    import prisma.models
+    from prisma import Prisma
+
+    Prisma(auto_register=True)
+    # Fixed ids and timestamps, so every process seeds the same table and a
+    # mapped snapshot has nothing to catch up on.
+    base = datetime(2024, 1, 1, tzinfo=timezone.utc)
+    for start in range(0, jokes, SEED_CHUNK):
+        await prisma.models.Joke.prisma().create_many(
+            data=[
+                {
+                    "id": f"startup-{n:08d}",
+                    "content": f"Startup benchmark joke number {n}",
+                    "status": "APPROVED",
+                    "submittedBy": "startup-benchmark",
+                    "createdAt": base,
+                    "updatedAt": base + timedelta(microseconds=n),
+                }
+                for n in range(start, min(start + SEED_CHUNK, jokes))
+            ]
+        )
+
+
+async def child(args: argparse.Namespace) -> dict:
+    if args.fake_db:
+        from benchmarks import fake_prisma
+
+        fake_prisma.install()
+        await seed(args.jokes)
+    started = time.perf_counter()
+    import httpx
+    import project.server
+
+    imported = time.perf_counter()
+    app = project.server.app
+    async with app.router.lifespan_context(app):
+        ready = time.perf_counter()
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://startup"
+        ) as client:
+            response = await client.get("/jokes/random")
+            response.raise_for_status()
+        served = time.perf_counter()
+        pool_size = len(project.joke_pool.approved_joke_pool)
+    return {
+        "import_seconds": imported - started,
+        "startup_seconds": ready - imported,
+        "first_response_seconds": served - ready,
+        "ready_seconds": served - started,
+        "pool_size": pool_size,
+    }
+
+
+def run_child(args: argparse.Namespace, snapshot_path: str) -> dict:
+    command = [sys.executable, "-m", "benchmarks.startup_time", "--child"]
+    command += ["--jokes", str(args.jokes)] + (["--fake-db"] if args.fake_db else [])
+    environment = dict(os.environ, JOKE_SNAPSHOT_PATH=snapshot_path)
+    environment.setdefault("RETENTION_ENABLED", "0")
+    output = subprocess.run(
+        command, env=environment, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def summarize(runs: list[dict]) -> dict:
+    return {
+        key: (
+            round(statistics.median(run[key] for run in runs), 4)
+            if key.endswith("_seconds")
+            else runs[0][key]
+        )
+        for key in runs[0]
+    }
+
+
+def main(args: argparse.Namespace) -> dict:
+    result: dict = {"jokes": args.jokes if args.fake_db else "DATABASE_URL"}
+    result["database"] = summarize([run_child(args, "") for _ in range(args.repeat)])
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "approved-jokes.snapshot")
+        builds = []
+        for _ in range(args.repeat):
+            if os.path.exists(path):
+                os.remove(path)
+            builds.append(run_child(args, path))
+        result["snapshot_build"] = summarize(builds)
+        result["snapshot_mapped"] = summarize(
+            [run_child(args, path) for _ in range(args.repeat)]
+        )
+        result["snapshot_bytes"] = os.path.getsize(path)
+    return result
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--fake-db", action="store_true")
+    parser.add_argument("--jokes", type=int, default=100000)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    arguments = parser.parse_args()
+    if arguments.child:
+        print(json.dumps(asyncio.run(child(arguments))))
+    else:
+        print(json.dumps(main(arguments), indent=2))
@@ -0,0 +1,9 @@
+from dotenv import load_dotenv
+
+# Settings are read from the environment when each module is imported, which
+# is before a Prisma client would load .env; load it here, the same way the
+# client does (variables already set in the environment win), so that
+# DATABASE_URL, DATABASE_REPLICA_URL, the DB_* pool settings and the rest
+# can all be set in .env.
+load_dotenv(".env")
+load_dotenv("prisma/.env")
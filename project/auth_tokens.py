@@ -0,0 +1,202 @@
+import functools
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Optional
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import JWTError
+
+SECRET_KEY = os.getenv(
+    "JWT_SECRET_KEY",
+    "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7",
+)
+
+ALGORITHM = os.getenv("JWT_ALGORITHM", "HS256")
+
+ACCESS_TOKEN_EXPIRE_MINUTES = int(os.getenv("ACCESS_TOKEN_EXPIRE_MINUTES", "30"))
+
+VERIFIED_TOKEN_CACHE_SIZE = int(os.getenv("VERIFIED_TOKEN_CACHE_SIZE", "10000"))
+
+
+@functools.lru_cache(maxsize=None)
+def signing_key() -> Any:
+    """
+    The application's JWT key, built on first use.
+
+    Built once so python-jose does not re-parse the secret on every
+    sign/verify, and not at import time because `jose.jwk` loads its
+    cryptography backends, which is a large share of a worker's startup.
+    """
+    from jose import jwk
+
+    return jwk.construct(SECRET_KEY, ALGORITHM)
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU cache of claims for tokens whose signature already checked out.
+
+    Entries are keyed by a digest of the raw token and expire at the token's
+    own `exp`, so a hit skips both HMAC verification and JSON parsing without
+    ever outliving the token.
+    """
+
+    def __init__(self, max_size: int = VERIFIED_TOKEN_CACHE_SIZE) -> None:
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[bytes, tuple[dict[str, Any], float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, digest: bytes) -> dict[str, Any] | None:
+        entry = self._entries.get(digest)
+        if entry is None:
+            self.misses += 1
+            return None
+        claims, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[digest]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(digest)
+        self.hits += 1
+        return claims
+
+    def put(self, digest: bytes, claims: dict[str, Any], expires_at: float) -> None:
+        self._entries[digest] = (claims, expires_at)
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def discard(self, digest: bytes) -> None:
+        self._entries.pop(digest, None)
+
+
+verified_tokens = VerifiedTokenCache()
+
+
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+
+def encode_token(
+    claims: dict[str, Any], expires_delta: Optional[timedelta] = None
+) -> str:
+    """
+    Sign a JWT with the application key.
+
+    Args:
+        claims (dict[str, Any]): The payload to encode.
+        expires_delta (Optional[timedelta]): Lifetime of the token. Defaults to ACCESS_TOKEN_EXPIRE_MINUTES.
+
+    Returns:
+        str: The encoded JWT.
+    """
+    if expires_delta is None:
+        expires_delta = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
+    to_encode = dict(claims)
+    to_encode["exp"] = datetime.now(timezone.utc) + expires_delta
+    from jose import jwt
+
+    return jwt.encode(to_encode, signing_key(), algorithm=ALGORITHM)
+
+
+def decode_token(token: str) -> dict[str, Any]:
+    """
+    Verify a JWT and return its claims, using the verified-token cache.
+
+    The returned dict is shared with the cache and must not be mutated.
+
+    Args:
+        token (str): The encoded JWT.
+
+    Returns:
+        dict[str, Any]: The verified claims.
+
+    Raises:
+        JWTError: If the token is malformed, badly signed or expired.
+    """
+    digest = token_digest(token)
+    claims = verified_tokens.get(digest)
+    if claims is not None:
+        return claims
+    from jose import jwt
+
+    claims = jwt.decode(token, signing_key(), algorithms=[ALGORITHM])
+    expires_at = claims.get("exp")
+    if expires_at is not None:
+        verified_tokens.put(digest, claims, float(expires_at))
+    return claims
+
+
+def decode_access_token(token: str) -> dict[str, Any]:
+    """
+    Verify a JWT that may authenticate a request, i.e. anything but a refresh token.
+
+    Raises:
+        JWTError: If the token is invalid, expired or a refresh token.
+    """
+    claims = decode_token(token)
+    if claims.get("typ") == "refresh":
+        raise JWTError("Refresh tokens cannot authenticate requests")
+    return claims
+
+
+_bearer = HTTPBearer(auto_error=False)
+
+
+async def get_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+) -> dict[str, Any]:
+    """
+    FastAPI dependency returning the verified claims of the bearer access token.
+
+    Raises:
+        HTTPException: 401 if the token is missing, invalid or a refresh token.
+    """
+    if credentials is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Not authenticated",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    try:
+        return decode_access_token(credentials.credentials)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+
+
+async def get_optional_token_claims(
+    credentials: Optional[HTTPAuthorizationCredentials] = Depends(_bearer),
+    access_token: Optional[str] = None,
+) -> dict[str, Any] | None:
+    """
+    FastAPI dependency like `get_token_claims`, but None when no token is given.
+
+    The token may also be passed as an `access_token` query parameter, for
+    clients such as EventSource that cannot set headers.
+
+    Raises:
+        HTTPException: 401 if a token is given but invalid.
+    """
+    token = credentials.credentials if credentials is not None else access_token
+    if token is None:
+        return None
+    try:
+        return decode_access_token(token)
+    except JWTError:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
@@ -0,0 +1,256 @@
+"""
+Export the Joke table as NDJSON, or load such a dump back in.
+
+    python -m project.corpus export [--output jokes.ndjson.gz] [--gzip] [--status APPROVED]
+    python -m project.corpus import jokes.ndjson.gz [--checkpoint FILE] [--submitted-by USER_ID]
+
+Export walks the table in id order with keyset pagination, so memory use
+does not depend on the table size. Import inserts in create_many batches
+with the dumped ids and skip_duplicates, and records its position in a
+checkpoint file after every batch; running it again after an interruption
+resumes from there, and re-inserting an already loaded batch is harmless.
+Both report rows/sec on stderr.
+"""
+
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+from datetime import datetime
+from typing import Any, AsyncIterator, BinaryIO, Iterator, Optional
+
+import prisma
+import prisma.models
+from project.fast_json import dumps
+from project.metrics import timed_query
+
+CORPUS_EXPORT_BATCH_SIZE = int(os.getenv("CORPUS_EXPORT_BATCH_SIZE", "5000"))
+
+CORPUS_IMPORT_BATCH_SIZE = int(os.getenv("CORPUS_IMPORT_BATCH_SIZE", "2000"))
+
+_GZIP_MAGIC = b"\x1f\x8b"
+
+
+def encode_joke_line(joke: prisma.models.Joke) -> bytes:
+    return (
+        dumps(
+            {
+                "id": joke.id,
+                "content": joke.content,
+                "status": str(getattr(joke.status, "value", joke.status)),
+                "submittedBy": joke.submittedBy,
+                "createdAt": joke.createdAt.isoformat(),
+            }
+        )
+        + b"\n"
+    )
+
+
+async def export_jokes(
+    status: Optional[str] = None, batch_size: int = CORPUS_EXPORT_BATCH_SIZE
+) -> AsyncIterator[bytes]:
+    """
+    Yield the Joke table as NDJSON, one chunk of lines per page.
+
+    Each page is an index range scan starting after the last id of the
+    previous one, so every page costs the same however deep the export is.
+
+    Args:
+        status (Optional[str]): Only export jokes with this status.
+        batch_size (int): Rows per query.
+
+    Yields:
+        bytes: Newline-terminated JSON lines.
+    """
+    where: dict[str, Any] = {} if status is None else {"status": status}
+    last_id: Optional[str] = None
+    while True:
+        page = await timed_query(
+            "Joke.find_many",
+            prisma.models.Joke.prisma().find_many(
+                where=where if last_id is None else {**where, "id": {"gt": last_id}},
+                order={"id": "asc"},
+                take=batch_size,
+            ),
+        )
+        if not page:
+            return
+        yield b"".join(encode_joke_line(joke) for joke in page)
+        if len(page) < batch_size:
+            return
+        last_id = page[-1].id
+
+
+async def gzip_chunks(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Gzip-compress a stream of chunks without buffering it.
+    """
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    async for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
+
+
+def _open_dump(path: str) -> BinaryIO:
+    raw = sys.stdin.buffer if path == "-" else open(path, "rb")
+    if raw.peek(2)[:2] == _GZIP_MAGIC:
+        return gzip.GzipFile(fileobj=raw)
+    return raw
+
+
+def _read_checkpoint(path: str, source: str) -> int:
+    try:
+        with open(path) as file:
+            checkpoint = json.load(file)
+    except FileNotFoundError:
+        return 0
+    if checkpoint.get("source") != source:
+        raise SystemExit(
+            f"{path} is a checkpoint for {checkpoint.get('source')!r}, not {source!r}"
+        )
+    return int(checkpoint["lines"])
+
+
+def _write_checkpoint(path: str, source: str, lines: int) -> None:
+    temporary = f"{path}.tmp"
+    with open(temporary, "w") as file:
+        json.dump({"source": source, "lines": lines}, file)
+    os.replace(temporary, path)
+
+
+def _joke_data(line: bytes, submitted_by: Optional[str]) -> dict[str, Any]:
+    item = json.loads(line)
+    return {
+        "id": item["id"],
+        "content": item["content"],
+        "status": item["status"],
+        "submittedBy": submitted_by or item["submittedBy"],
+        "createdAt": datetime.fromisoformat(item["createdAt"]),
+    }
+
+
+def _batches(
+    lines: Iterator[bytes], batch_size: int
+) -> Iterator[tuple[int, list[bytes]]]:
+    """
+    Group non-blank lines into batches, with the line count consumed so far.
+    """
+    batch: list[bytes] = []
+    consumed = 0
+    for line in lines:
+        consumed += 1
+        if line.strip():
+            batch.append(line)
+        if len(batch) >= batch_size:
+            yield consumed, batch
+            batch = []
+    if batch or consumed:
+        yield consumed, batch
+
+
+async def import_jokes(
+    path: str,
+    checkpoint: Optional[str] = None,
+    batch_size: int = CORPUS_IMPORT_BATCH_SIZE,
+    submitted_by: Optional[str] = None,
+) -> tuple[int, int, float]:
+    """
+    Load an NDJSON (optionally gzipped) joke dump in create_many batches.
+
+    Args:
+        path (str): The dump file, or "-" for stdin.
+        checkpoint (Optional[str]): File recording how many lines are loaded; resumed from if it exists.
+        batch_size (int): Rows per create_many call.
+        submitted_by (Optional[str]): Assign every joke to this user id instead of the dumped one.
+
+    Returns:
+        tuple[int, int, float]: Lines read in this run, rows inserted (already present ones are skipped) and seconds taken.
+    """
+    source = os.path.abspath(path) if path != "-" else "-"
+    done = _read_checkpoint(checkpoint, source) if checkpoint else 0
+    started = time.perf_counter()
+    read = inserted = 0
+    with _open_dump(path) as dump:
+        lines = iter(dump)
+        for _ in range(done):
+            next(lines, None)
+        for consumed, batch in _batches(lines, batch_size):
+            if batch:
+                inserted += await timed_query(
+                    "Joke.create_many",
+                    prisma.models.Joke.prisma().create_many(
+                        data=[_joke_data(line, submitted_by) for line in batch],
+                        skip_duplicates=True,
+                    ),
+                )
+            read = consumed
+            if checkpoint:
+                _write_checkpoint(checkpoint, source, done + read)
+    return read, inserted, time.perf_counter() - started
+
+
+async def main(args: argparse.Namespace) -> None:
+    import project.db
+
+    await project.db.connect()
+    try:
+        if args.command == "export":
+            started = time.perf_counter()
+            rows = 0
+
+            async def counted(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+                nonlocal rows
+                async for chunk in chunks:
+                    rows += chunk.count(b"\n")
+                    yield chunk
+
+            chunks = counted(export_jokes(args.status, args.batch_size))
+            if args.gzip or args.output.endswith(".gz"):
+                chunks = gzip_chunks(chunks)
+            output = (
+                sys.stdout.buffer if args.output == "-" else open(args.output, "wb")
+            )
+            try:
+                async for chunk in chunks:
+                    output.write(chunk)
+            finally:
+                if output is not sys.stdout.buffer:
+                    output.close()
+            elapsed = time.perf_counter() - started
+            print(
+                f"exported {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)",
+                file=sys.stderr,
+            )
+        else:
+            read, inserted, elapsed = await import_jokes(
+                args.path, args.checkpoint, args.batch_size, args.submitted_by
+            )
+            print(
+                f"read {read} lines, inserted {inserted} rows in {elapsed:.1f}s "
+                f"({read / elapsed if elapsed else 0:,.0f} rows/s)",
+                file=sys.stderr,
+            )
+    finally:
+        await project.db.disconnect()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export")
+    export.add_argument("--output", default="-")
+    export.add_argument("--gzip", action="store_true")
+    export.add_argument("--status", choices=["PENDING", "APPROVED", "REJECTED"])
+    export.add_argument("--batch-size", type=int, default=CORPUS_EXPORT_BATCH_SIZE)
+    load = commands.add_parser("import")
+    load.add_argument("path")
+    load.add_argument("--checkpoint")
+    load.add_argument("--batch-size", type=int, default=CORPUS_IMPORT_BATCH_SIZE)
+    load.add_argument("--submitted-by")
+    asyncio.run(main(parser.parse_args()))
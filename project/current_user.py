@@ -0,0 +1,331 @@
+"""
+Resolve bearer tokens to the current user through a per-worker profile cache.
+
+`get_current_user` maps the access token's `uid` (the user's id, which
+unlike the email never changes) to the user's profile. Profiles are kept in
+a bounded LRU for USER_PROFILE_CACHE_SECONDS, so an authenticated request
+costs no query while its user is cached, and concurrent misses for one user
+share a single lookup.
+
+Profile writes call `invalidate_user`, which drops the entry locally and
+publishes the change with NOTIFY on USER_INVALIDATION_CHANNEL. Every worker
+LISTENs on that channel (see project.notifications) and drops the entry
+too. While the listener is reconnecting, other workers fall
+back to the TTL, which bounds how stale a profile can get.
+"""
+
+import logging
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Optional
+
+import prisma
+import prisma.models
+from fastapi import Depends, HTTPException, status
+from jose import JWTError
+from project.auth_tokens import (
+    decode_access_token,
+    get_optional_token_claims,
+    get_token_claims,
+)
+from project.joke_events import is_moderator
+from project.metrics import timed_query
+from project.notifications import notification_listener, notify
+from project.single_flight import SingleFlight
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+USER_PROFILE_CACHE_SIZE = int(os.getenv("USER_PROFILE_CACHE_SIZE", "10000"))
+
+# Upper bound on how long another worker may serve a profile after it
+# changed, should its invalidation be missed.
+USER_PROFILE_CACHE_SECONDS = float(os.getenv("USER_PROFILE_CACHE_SECONDS", "60"))
+
+USER_INVALIDATION_CHANNEL = os.getenv(
+    "USER_INVALIDATION_CHANNEL", "user_profile_changed"
+)
+
+
+class UserProfile(BaseModel):
+    """
+    The authenticated user's profile, without credentials.
+    """
+
+    id: str
+    email: str
+    role: str
+    createdAt: datetime
+    updatedAt: datetime
+
+
+class UserProfileCacheStats(BaseModel):
+    """
+    Profile cache and invalidation metrics for this worker.
+    """
+
+    size: int
+    max_size: int
+    ttl_seconds: float
+    hits: int
+    misses: int
+    evictions: int
+    invalidations: int
+    remote_invalidations: int
+    listening: bool
+
+
+class UserProfileCache:
+    """
+    Bounded LRU of user profiles keyed by user id, with a TTL.
+
+    `generation` moves on every invalidation; a lookup that started before
+    one passes the generation it saw to `put`, which then drops the result
+    instead of caching a row that may predate the write.
+    """
+
+    def __init__(
+        self,
+        max_size: int = USER_PROFILE_CACHE_SIZE,
+        ttl: float = USER_PROFILE_CACHE_SECONDS,
+    ) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.generation = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.remote_invalidations = 0
+        self._entries: OrderedDict[str, tuple[UserProfile, float]] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, user_id: str) -> Optional[UserProfile]:
+        entry = self._entries.get(user_id)
+        if entry is None:
+            self.misses += 1
+            return None
+        profile, expires_at = entry
+        if expires_at <= time.monotonic():
+            del self._entries[user_id]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(user_id)
+        self.hits += 1
+        return profile
+
+    def put(self, profile: UserProfile, generation: int) -> None:
+        if generation != self.generation or self.max_size <= 0:
+            return
+        self._entries[profile.id] = (profile, time.monotonic() + self.ttl)
+        self._entries.move_to_end(profile.id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def invalidate(self, user_id: str) -> None:
+        self.generation += 1
+        self.invalidations += 1
+        self._entries.pop(user_id, None)
+
+    def clear(self) -> None:
+        self.generation += 1
+        self._entries.clear()
+
+
+user_profiles = UserProfileCache()
+
+profile_lookups: SingleFlight[Optional[prisma.models.User]] = SingleFlight(
+    "current_user"
+)
+
+
+def to_profile(user: prisma.models.User) -> UserProfile:
+    return UserProfile(
+        id=user.id,
+        email=user.email,
+        role=str(getattr(user.role, "value", user.role)),
+        createdAt=user.createdAt,
+        updatedAt=user.updatedAt,
+    )
+
+
+async def resolve_user(user_id: str) -> Optional[UserProfile]:
+    """
+    Return the profile of the user with this id, from the cache if possible.
+
+    Misses read the primary rather than the replica, so a profile is never
+    cached from a replica that has not caught up with the write that just
+    invalidated it.
+
+    Args:
+        user_id (str): The user's id, as carried in the token's `uid`.
+
+    Returns:
+        Optional[UserProfile]: The profile, or None if there is no such user.
+    """
+    profile = user_profiles.get(user_id)
+    if profile is not None:
+        return profile
+    generation = user_profiles.generation
+    user = await profile_lookups.do(
+        user_id,
+        lambda: timed_query(
+            "User.find_unique",
+            prisma.models.User.prisma().find_unique(where={"id": user_id}),
+        ),
+    )
+    if user is None:
+        return None
+    profile = to_profile(user)
+    user_profiles.put(profile, generation)
+    return profile
+
+
+async def user_from_claims(claims: dict[str, Any]) -> UserProfile:
+    """
+    Resolve the verified claims of an access token to its user's profile.
+
+    Tokens without `uid`, issued before it was added, are refused and their
+    users have to log in again.
+
+    Raises:
+        HTTPException: 401 if the token names no user or its user no longer exists.
+    """
+    user_id = claims.get("uid")
+    if not user_id:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid or expired token",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    profile = await resolve_user(user_id)
+    if profile is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="User no longer exists",
+            headers={"WWW-Authenticate": "Bearer"},
+        )
+    return profile
+
+
+async def get_current_user(
+    claims: dict[str, Any] = Depends(get_token_claims),
+) -> UserProfile:
+    """
+    FastAPI dependency returning the profile of the bearer token's user.
+
+    The role comes from the profile, not the token, so a role change
+    applies to tokens issued before it.
+
+    Raises:
+        HTTPException: 401 without a valid access token, or if its user no longer exists.
+    """
+    return await user_from_claims(claims)
+
+
+async def get_optional_current_user(
+    claims: Optional[dict[str, Any]] = Depends(get_optional_token_claims),
+) -> Optional[UserProfile]:
+    """
+    FastAPI dependency like `get_current_user`, but None when no token is given.
+
+    Raises:
+        HTTPException: 401 if a token is given but invalid, or its user no longer exists.
+    """
+    if claims is None:
+        return None
+    return await user_from_claims(claims)
+
+
+async def authenticate_token(token: str) -> Optional[UserProfile]:
+    """
+    Resolve a raw access token, e.g. from a WebSocket query string, to its user.
+
+    Returns:
+        Optional[UserProfile]: The profile, or None if the token does not authenticate anyone.
+    """
+    try:
+        return await user_from_claims(decode_access_token(token))
+    except (JWTError, HTTPException):
+        return None
+
+
+async def require_admin(
+    user: UserProfile = Depends(get_current_user),
+) -> UserProfile:
+    """
+    FastAPI dependency that only lets users whose profile has the ADMIN role through.
+
+    Raises:
+        HTTPException: 401 without a valid token, 403 if the user is not an admin.
+    """
+    if user.role != "ADMIN":
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Admin role required"
+        )
+    return user
+
+
+async def require_moderator(
+    user: UserProfile = Depends(get_current_user),
+) -> UserProfile:
+    """
+    FastAPI dependency that only lets moderators and admins through.
+
+    Raises:
+        HTTPException: 401 without a valid token, 403 if the user may not moderate.
+    """
+    if not is_moderator(user.role):
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Moderator role required"
+        )
+    return user
+
+
+async def invalidate_user(user_id: str) -> None:
+    """
+    Drop a changed user's profile here and tell the other workers to do the same.
+
+    A failed NOTIFY is logged, not raised: the write already happened and
+    the other workers' TTL still applies.
+
+    Args:
+        user_id (str): The changed user's id.
+    """
+    user_profiles.invalidate(user_id)
+    try:
+        await notify(USER_INVALIDATION_CHANNEL, {"id": user_id})
+    except Exception:
+        logger.exception("Publishing user invalidation failed")
+
+
+def _on_invalidation(message: dict[str, Any]) -> None:
+    if message.get("id"):
+        user_profiles.invalidate(message["id"])
+    user_profiles.remote_invalidations += 1
+
+
+# The cache is cleared whenever listening (re)starts, since invalidations
+# sent while not listening are lost.
+notification_listener.subscribe(
+    USER_INVALIDATION_CHANNEL, _on_invalidation, on_connect=user_profiles.clear
+)
+
+
+def stats() -> UserProfileCacheStats:
+    return UserProfileCacheStats(
+        size=len(user_profiles),
+        max_size=user_profiles.max_size,
+        ttl_seconds=user_profiles.ttl,
+        hits=user_profiles.hits,
+        misses=user_profiles.misses,
+        evictions=user_profiles.evictions,
+        invalidations=user_profiles.invalidations,
+        remote_invalidations=user_profiles.remote_invalidations,
+        listening=notification_listener.listening,
+    )
@@ -0,0 +1,184 @@
+import logging
+import os
+from typing import Any, Awaitable, Callable, TypeVar
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from prisma import Prisma
+from project.metrics import Sample, render_family
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+DATABASE_URL = os.getenv("DATABASE_URL", "")
+
+DATABASE_REPLICA_URL = os.getenv("DATABASE_REPLICA_URL", "")
+
+# Connection pool settings, applied through the Prisma connection string.
+DB_CONNECTION_LIMIT = os.getenv("DB_CONNECTION_LIMIT", "")
+
+DB_POOL_TIMEOUT = os.getenv("DB_POOL_TIMEOUT", "")
+
+DB_CONNECT_TIMEOUT = os.getenv("DB_CONNECT_TIMEOUT", "")
+
+DB_REPLICA_CONNECTION_LIMIT = os.getenv(
+    "DB_REPLICA_CONNECTION_LIMIT", DB_CONNECTION_LIMIT
+)
+
+# Seconds the client waits on the query engine for a single request.
+DB_QUERY_TIMEOUT = float(os.getenv("DB_QUERY_TIMEOUT", "30"))
+
+
+def with_pool_settings(url: str, connection_limit: str) -> str:
+    """
+    Add pool sizing and timeout parameters to a connection string.
+
+    Parameters already present in the URL win over the environment.
+
+    Args:
+        url (str): A PostgreSQL connection string.
+        connection_limit (str): Value for `connection_limit`, or "" to leave the engine default.
+
+    Returns:
+        str: The connection string with the extra query parameters.
+    """
+    parts = urlsplit(url)
+    query = dict(parse_qsl(parts.query))
+    for key, value in (
+        ("connection_limit", connection_limit),
+        ("pool_timeout", DB_POOL_TIMEOUT),
+        ("connect_timeout", DB_CONNECT_TIMEOUT),
+    ):
+        if value and key not in query:
+            query[key] = value
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+def _client_options(url: str, connection_limit: str) -> dict[str, Any]:
+    options: dict[str, Any] = {"http": {"timeout": DB_QUERY_TIMEOUT}}
+    if url:
+        options["datasource"] = {"url": with_pool_settings(url, connection_limit)}
+    return options
+
+
+db_client = Prisma(
+    auto_register=True, **_client_options(DATABASE_URL, DB_CONNECTION_LIMIT)
+)
+
+replica_client: Prisma | None = (
+    Prisma(**_client_options(DATABASE_REPLICA_URL, DB_REPLICA_CONNECTION_LIMIT))
+    if DATABASE_REPLICA_URL
+    else None
+)
+
+replica_reads = 0
+
+replica_fallbacks = 0
+
+
+async def connect() -> None:
+    await db_client.connect()
+    if replica_client is not None:
+        try:
+            await replica_client.connect()
+        except Exception:
+            logger.exception(
+                "Could not connect to the read replica; reading from primary"
+            )
+
+
+async def disconnect() -> None:
+    if replica_client is not None and replica_client.is_connected():
+        await replica_client.disconnect()
+    await db_client.disconnect()
+
+
+async def read(query: Callable[[Prisma], Awaitable[T]]) -> T:
+    """
+    Run a read-only query on the replica, falling back to the primary on error.
+
+    Args:
+        query (Callable[[Prisma], Awaitable[T]]): Builds the query for a given client, e.g. `lambda client: prisma.models.Joke.prisma(client).find_first(...)`.
+
+    Returns:
+        T: The query result.
+    """
+    global replica_reads, replica_fallbacks
+    if replica_client is not None and replica_client.is_connected():
+        try:
+            result = await query(replica_client)
+            replica_reads += 1
+            return result
+        except Exception:
+            replica_fallbacks += 1
+            logger.warning(
+                "Read replica query failed; retrying on primary", exc_info=True
+            )
+    return await query(db_client)
+
+
+def connected_clients() -> dict[str, Prisma]:
+    clients = {"primary": db_client}
+    if replica_client is not None and replica_client.is_connected():
+        clients["replica"] = replica_client
+    return clients
+
+
+class DatabasePoolStats(BaseModel):
+    """
+    Connection pool metrics for the primary and read-replica clients.
+    """
+
+    replica_configured: bool
+    replica_connected: bool
+    replica_reads: int
+    replica_fallbacks: int
+    pools: dict[str, dict[str, float]]
+
+
+async def pool_stats() -> DatabasePoolStats:
+    """
+    Collect connection pool gauges and counters from each connected client.
+
+    Requires the `metrics` preview feature in schema.prisma. Pool metrics are
+    reported under Prisma's names, e.g. `prisma_pool_connections_busy`.
+
+    Returns:
+        DatabasePoolStats: Routing counters plus metric values keyed by "primary" / "replica".
+    """
+    clients = connected_clients()
+    pools = {}
+    for name, client in clients.items():
+        metrics = await client.get_metrics()
+        values = {counter.key: counter.value for counter in metrics.counters}
+        values.update({gauge.key: gauge.value for gauge in metrics.gauges})
+        pools[name] = values
+    return DatabasePoolStats(
+        replica_configured=replica_client is not None,
+        replica_connected="replica" in clients,
+        replica_reads=replica_reads,
+        replica_fallbacks=replica_fallbacks,
+        pools=pools,
+    )
+
+
+async def prometheus_pool_metrics() -> str:
+    """
+    Render Prisma's pool counters and gauges for each connected client in Prometheus format.
+
+    Returns:
+        str: Exposition text with a `client` label of "primary" or "replica".
+    """
+    families: dict[str, tuple[str, str, list[Sample]]] = {}
+    for name, client in connected_clients().items():
+        metrics = await client.get_metrics()
+        for kind, items in (("counter", metrics.counters), ("gauge", metrics.gauges)):
+            for metric in items:
+                family = families.setdefault(metric.key, (kind, metric.description, []))
+                labels = (*sorted(metric.labels.items()), ("client", name))
+                family[2].append((metric.key, labels, metric.value))
+    return "".join(
+        render_family(key, kind, description, samples)
+        for key, (kind, description, samples) in families.items()
+    )
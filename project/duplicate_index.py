@@ -0,0 +1,299 @@
+import asyncio
+import hashlib
+import logging
+import os
+import re
+import struct
+import sys
+from array import array
+from datetime import datetime
+from typing import Callable
+
+import prisma
+import prisma.models
+from project.metrics import timed_query
+
+logger = logging.getLogger(__name__)
+
+DUPLICATE_CHECK_ENABLED = os.getenv("DUPLICATE_CHECK_ENABLED", "1") != "0"
+
+NEAR_DUPLICATE_THRESHOLD = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.6"))
+
+DUPLICATE_INDEX_RESYNC_SECONDS = float(
+    os.getenv("DUPLICATE_INDEX_RESYNC_SECONDS", "30")
+)
+
+MINHASH_BANDS = 16
+
+MINHASH_ROWS = 2
+
+MINHASH_PERMUTATIONS = MINHASH_BANDS * MINHASH_ROWS
+
+# One 64-byte digest per shingle yields all 32 MinHash values at once as
+# 16-bit lanes, so the per-permutation work happens in C.
+_LANES = struct.Struct(">%dH" % MINHASH_PERMUTATIONS)
+
+_NON_WORD = re.compile(r"[\W_]+")
+
+_LOAD_PAGE_SIZE = 5000
+
+_LOAD_YIELD_EVERY = 250
+
+
+def normalize_joke(content: str) -> str:
+    """
+    Case-fold a joke and reduce punctuation and whitespace runs to single spaces.
+    """
+    return _NON_WORD.sub(" ", content.casefold()).strip()
+
+
+def _exact_key(normalized: str) -> int:
+    return int.from_bytes(
+        hashlib.blake2b(normalized.encode(), digest_size=8).digest(), "big"
+    )
+
+
+def _signature(normalized: str) -> list[int]:
+    words = normalized.split()
+    if len(words) > 1:
+        shingles = {f"{left} {right}" for left, right in zip(words, words[1:])}
+    else:
+        shingles = set(words) or {""}
+    lanes = [
+        _LANES.unpack(hashlib.blake2b(shingle.encode(), digest_size=64).digest())
+        for shingle in shingles
+    ]
+    return list(map(min, zip(*lanes)))
+
+
+class DuplicateIndex:
+    """
+    In-memory exact and near-duplicate index over joke content.
+
+    Exact duplicates are found through a 64-bit hash of the normalized text.
+    Near duplicates use MinHash signatures over word bigrams with LSH
+    banding: a joke is a candidate if any band of its signature collides,
+    and a match if the signatures agree on at least `threshold` of their
+    positions. Signatures are stored in one flat array of 16-bit integers.
+
+    Rejected jokes are not indexed. After the initial load the index pulls
+    the jokes changed since its updatedAt watermark, like the approved
+    joke pool, so it also covers jokes submitted to or moderated on other
+    workers.
+    """
+
+    def __init__(self, threshold: float = NEAR_DUPLICATE_THRESHOLD) -> None:
+        self.threshold = threshold
+        self._exact: dict[int, str] = {}
+        self._ids: list[str | None] = []
+        self._slots: dict[str, int] = {}
+        self._watermark: datetime | None = None
+        self.loaded = False
+        self._signatures = array("H")
+        # Band buckets hold a bare slot number until a second joke collides.
+        self._bands: list[dict[int, int | list[int]]] = [
+            {} for _ in range(MINHASH_BANDS)
+        ]
+
+    def __len__(self) -> int:
+        return len(self._exact)
+
+    def check(self, content: str) -> tuple[str, str] | None:
+        """
+        Look up a joke that duplicates `content`.
+
+        Args:
+            content (str): The submitted joke text.
+
+        Returns:
+            tuple[str, str] | None: ("exact" or "near", id of the existing joke), or None.
+        """
+        normalized = normalize_joke(content)
+        existing = self._exact.get(_exact_key(normalized))
+        if existing is not None:
+            return "exact", existing
+        signature = _signature(normalized)
+        match = self._near(signature)
+        if match is not None:
+            return "near", match
+        return None
+
+    def add(self, joke_id: str, content: str) -> None:
+        """
+        Index a joke; a joke that is already indexed is left as it is.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+            content (str): The joke text.
+        """
+        if joke_id in self._slots:
+            return
+        normalized = normalize_joke(content)
+        self._exact.setdefault(_exact_key(normalized), joke_id)
+        signature = _signature(normalized)
+        slot = len(self._ids)
+        self._ids.append(joke_id)
+        self._slots[joke_id] = slot
+        self._signatures.extend(signature)
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._bands[band].get(key)
+            if bucket is None:
+                self._bands[band][key] = slot
+            elif isinstance(bucket, int):
+                self._bands[band][key] = [bucket, slot]
+            else:
+                bucket.append(slot)
+
+    def discard(self, joke_id: str, content: str) -> None:
+        """
+        Remove a joke that was rejected, or added but never stored, e.g. after a failed insert.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+            content (str): The joke text it was added with.
+        """
+        slot = self._slots.pop(joke_id, None)
+        if slot is None:
+            return
+        key = _exact_key(normalize_joke(content))
+        if self._exact.get(key) == joke_id:
+            del self._exact[key]
+        self._ids[slot] = None
+
+    def apply_status(self, joke_id: str, content: str, status: str) -> None:
+        """
+        Apply a joke's new moderation status to the index.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+            content (str): The joke text.
+            status (str): The joke's current status.
+        """
+        if status == "REJECTED":
+            self.discard(joke_id, content)
+        else:
+            self.add(joke_id, content)
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate memory held by the index, in bytes.
+        """
+        total = sys.getsizeof(self._exact) + sys.getsizeof(self._ids)
+        total += sys.getsizeof(self._slots)
+        total += self._signatures.itemsize * len(self._signatures)
+        for buckets in self._bands:
+            total += sys.getsizeof(buckets)
+            total += sum(
+                sys.getsizeof(slots)
+                for slots in buckets.values()
+                if type(slots) is list
+            )
+        return total
+
+    async def load(self) -> None:
+        """
+        Build the index from every joke that is not rejected, paging by id.
+        """
+        cursor = None
+        while True:
+            where: dict = {"status": {"not": "REJECTED"}}
+            if cursor:
+                where["id"] = {"gt": cursor}
+            page = await timed_query(
+                "Joke.find_many",
+                prisma.models.Joke.prisma().find_many(
+                    where=where,
+                    order={"id": "asc"},
+                    take=_LOAD_PAGE_SIZE,
+                ),
+            )
+            await self._apply(page, lambda joke: self.add(joke.id, joke.content))
+            if len(page) < _LOAD_PAGE_SIZE:
+                break
+            cursor = page[-1].id
+        self.loaded = True
+        logger.info(
+            "Duplicate index built with %d jokes using %d bytes",
+            len(self._ids),
+            self.memory_bytes(),
+        )
+
+    async def resync(self) -> None:
+        """
+        Pull the jokes changed since the last load or resync.
+
+        New jokes are indexed and rejected ones dropped. Rows whose
+        updatedAt is at or after the watermark are fetched, so the rows at
+        the watermark are seen again; applying them twice is harmless.
+        """
+        where = {"updatedAt": {"gte": self._watermark}} if self._watermark else {}
+        changed = await timed_query(
+            "Joke.find_many", prisma.models.Joke.prisma().find_many(where=where)
+        )
+        await self._apply(
+            changed,
+            lambda joke: self.apply_status(joke.id, joke.content, joke.status),
+        )
+
+    async def sync_forever(
+        self, interval: float = DUPLICATE_INDEX_RESYNC_SECONDS
+    ) -> None:
+        """
+        Load the index as a startup task, then resync it every `interval` seconds until cancelled.
+
+        The worker serves while the index fills: submissions checked before
+        it finishes are only compared with the jokes indexed so far. A
+        failed load is logged, not raised, and retried after `interval`.
+
+        Args:
+            interval (float): Seconds to wait between resyncs.
+        """
+        while True:
+            try:
+                if self.loaded:
+                    await self.resync()
+                else:
+                    await self.load()
+            except Exception:
+                logger.exception("Duplicate index sync failed")
+            await asyncio.sleep(interval)
+
+    async def _apply(
+        self,
+        jokes: list[prisma.models.Joke],
+        apply: Callable[[prisma.models.Joke], None],
+    ) -> None:
+        for position, joke in enumerate(jokes, 1):
+            apply(joke)
+            if self._watermark is None or joke.updatedAt > self._watermark:
+                self._watermark = joke.updatedAt
+            if position % _LOAD_YIELD_EVERY == 0:
+                # Hashing is CPU-bound; let requests in between slices.
+                await asyncio.sleep(0)
+
+    def _near(self, signature: list[int]) -> str | None:
+        seen = set()
+        for band, key in enumerate(self._band_keys(signature)):
+            bucket = self._bands[band].get(key)
+            if bucket is None:
+                continue
+            for slot in (bucket,) if isinstance(bucket, int) else bucket:
+                if slot in seen or self._ids[slot] is None:
+                    continue
+                seen.add(slot)
+                offset = slot * MINHASH_PERMUTATIONS
+                stored = self._signatures[offset : offset + MINHASH_PERMUTATIONS]
+                agree = sum(x == y for x, y in zip(signature, stored))
+                if agree >= self.threshold * MINHASH_PERMUTATIONS:
+                    return self._ids[slot]
+        return None
+
+    @staticmethod
+    def _band_keys(signature: list[int]) -> list[int]:
+        return [
+            hash(tuple(signature[band * MINHASH_ROWS : (band + 1) * MINHASH_ROWS]))
+            for band in range(MINHASH_BANDS)
+        ]
+
+
+duplicate_index = DuplicateIndex()
@@ -0,0 +1,39 @@
+import json
+from typing import Any
+
+from fastapi.responses import Response
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is an optional speed-up
+    orjson = None
+
+_encoder = json.JSONEncoder(ensure_ascii=False, separators=(",", ":"))
+
+
+def dumps(obj: Any) -> bytes:
+    """
+    Encode plain JSON data (dicts, lists, str, numbers) to UTF-8 bytes.
+
+    Uses orjson when it is installed and the standard library otherwise.
+    """
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return _encoder.encode(obj).encode()
+
+
+def json_bytes_response(content: bytes, status_code: int = 200) -> Response:
+    """
+    Wrap already-encoded JSON bytes in a response, bypassing FastAPI's
+    serialization and response-model validation.
+    """
+    return Response(
+        content=content, status_code=status_code, media_type="application/json"
+    )
+
+
+def error_response(error: Exception, status_code: int = 500) -> Response:
+    """
+    Build the JSON error response returned by the route handlers.
+    """
+    return json_bytes_response(dumps({"error": str(error)}), status_code)
@@ -1,7 +1,15 @@
-from random import choice
+import asyncio
+from uuid import uuid4
 
 import prisma
 import prisma.models
+from project.db import read
+from project.fast_json import dumps
+from project.joke_pool import JOKE_POOL_ENABLED, approved_joke_pool
+from project.joke_views import JOKE_VIEWS_ENABLED, joke_views
+from project.metrics import timed_query
+from project.seen_sets import client_seen_sets
+from project.single_flight import SingleFlight
 from pydantic import BaseModel
 
 
@@ -15,26 +23,135 @@ class GetRandomJokeResponse(BaseModel):
     status: str
 
 
-async def get_random_joke() -> GetRandomJokeResponse:
+class GetRandomJokesResponse(BaseModel):
     """
-    Retrieve a random dad joke from the database.
+    A batch of random dad jokes returned in a single response.
+    """
+
+    jokes: list[GetRandomJokeResponse]
+
+
+FALLBACK_PAYLOAD = dumps(
+    {
+        "id": "fallback",
+        "content": "Sorry, no jokes available right now.",
+        "status": "APPROVED",
+    }
+)
+
+first_approved_jokes: SingleFlight[prisma.models.Joke | None] = SingleFlight(
+    "first_approved_joke"
+)
+
+
+async def sample_approved_joke() -> prisma.models.Joke | None:
+    """
+    Pick a random approved joke on the database side.
+
+    Joke ids are random v4 UUIDs, so seeking to the first approved id at or
+    after a freshly generated UUID is an approximately uniform sample. The
+    lookup is a single index seek on (status, id), independent of table size.
+    Runs on the read replica when one is configured.
+
+    Returns:
+        prisma.models.Joke | None: A random approved joke, or None if there are none.
+    """
+    pivot = str(uuid4())
+    joke = await timed_query(
+        "Joke.find_first",
+        read(
+            lambda client: prisma.models.Joke.prisma(client).find_first(
+                where={"status": "APPROVED", "id": {"gte": pivot}},
+                order={"id": "asc"},
+            )
+        ),
+    )
+    if joke is None:
+        # Wrapping around past the last id is the same query for everyone.
+        joke = await first_approved_jokes.do(
+            None,
+            lambda: timed_query(
+                "Joke.find_first",
+                read(
+                    lambda client: prisma.models.Joke.prisma(client).find_first(
+                        where={"status": "APPROVED"}, order={"id": "asc"}
+                    )
+                ),
+            ),
+        )
+    return joke
+
+
+async def get_random_joke_payload() -> bytes:
+    """
+    Retrieve a random dad joke as the encoded JSON body of GetRandomJokeResponse.
+
+    Pooled jokes are returned as the bytes encoded when they entered the
+    pool, with no model construction or serialization per request.
+
+    Returns:
+        bytes: The JSON body.
+    """
+    if JOKE_POOL_ENABLED and approved_joke_pool.warmed:
+        slot = approved_joke_pool.random_slot()
+        if slot is None:
+            return FALLBACK_PAYLOAD
+        if JOKE_VIEWS_ENABLED:
+            joke_views.record(approved_joke_pool.id_at(slot))
+        return approved_joke_pool.payload_at(slot)
+    random_joke = await sample_approved_joke()
+    if random_joke is None:
+        return FALLBACK_PAYLOAD
+    if JOKE_VIEWS_ENABLED:
+        joke_views.record(random_joke.id)
+    return dumps(
+        {
+            "id": random_joke.id,
+            "content": random_joke.content,
+            "status": random_joke.status,
+        }
+    )
+
+
+async def get_random_jokes_payload(count: int, client_key: str | None = None) -> bytes:
+    """
+    Retrieve several distinct random dad jokes as the encoded JSON body of GetRandomJokesResponse.
 
     Args:
+        count (int): The number of jokes wanted.
+        client_key (str | None): When given, jokes already served to this client are skipped until the whole pool has been seen.
 
     Returns:
-        GetRandomJokeResponse: This response model houses the random dad joke fetched from the database, providing a simple joke structure to the caller.
-    """
-    approved_jokes: list[
-        prisma.models.Joke
-    ] = await prisma.models.Joke.prisma().find_many(where={"status": "APPROVED"})
-    if not approved_jokes:
-        return GetRandomJokeResponse(
-            id="fallback",
-            content="Sorry, no jokes available right now.",
-            status="APPROVED",
+        bytes: The JSON body.
+    """
+    if JOKE_POOL_ENABLED and approved_joke_pool.warmed:
+        if client_key is None:
+            slots = approved_joke_pool.sample_slots(count)
+        else:
+            slots = client_seen_sets.draw(
+                client_key,
+                len(approved_joke_pool),
+                count,
+                approved_joke_pool.generation,
+            )
+        if JOKE_VIEWS_ENABLED:
+            for slot in slots:
+                joke_views.record(approved_joke_pool.id_at(slot))
+        return (
+            b'{"jokes":['
+            + b",".join(approved_joke_pool.payload_at(slot) for slot in slots)
+            + b"]}"
         )
-    random_joke: prisma.models.Joke = choice(approved_jokes)
-    response: GetRandomJokeResponse = GetRandomJokeResponse(
-        id=random_joke.id, content=random_joke.content, status=random_joke.status
+    sampled = await asyncio.gather(*(sample_approved_joke() for _ in range(count)))
+    unique = {joke.id: joke for joke in sampled if joke is not None}
+    if JOKE_VIEWS_ENABLED:
+        for joke_id in unique:
+            joke_views.record(joke_id)
+    return dumps(
+        {
+            "jokes": [
+                {"id": joke.id, "content": joke.content, "status": joke.status}
+                for joke in unique.values()
+            ]
+        }
     )
-    return response
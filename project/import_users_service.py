@@ -0,0 +1,203 @@
+import os
+import time
+from typing import Any, AsyncIterator, Optional
+from uuid import uuid4
+
+import prisma
+import prisma.models
+from project.json_stream import MalformedBody
+from project.metrics import timed_query
+from project.password_hashing import import_password_hasher
+from project.register_user_service import Role
+from pydantic import BaseModel
+
+USER_IMPORT_CHUNK_SIZE = int(os.getenv("USER_IMPORT_CHUNK_SIZE", "500"))
+
+
+class ImportUserItem(BaseModel):
+    """
+    Outcome for one user of a bulk import, identified by its position in the body.
+    """
+
+    index: int
+    success: bool
+    email: Optional[str] = None
+    user_id: Optional[str] = None
+    message: str
+
+
+class ImportUsersResponse(BaseModel):
+    """
+    Response model for a bulk user import, with totals, timing and a result per submitted user.
+    """
+
+    imported: int
+    failed: int
+    seconds: float
+    results: list[ImportUserItem]
+    error: Optional[str] = None
+
+
+def validate_import_item(item: Any) -> tuple[str, str, Role]:
+    """
+    Check one import item and return its email, password and role.
+
+    Args:
+        item (Any): A decoded item; expected to be an object with "email", "password" and optionally "role".
+
+    Returns:
+        tuple[str, str, Role]: The stripped email, the password and the role (USER by default).
+
+    Raises:
+        ValueError: If a field is missing or invalid.
+    """
+    if isinstance(item, Exception):
+        raise ValueError("Item is not valid JSON.")
+    if not isinstance(item, dict):
+        raise ValueError("Item must be an object.")
+    email = item.get("email")
+    if not isinstance(email, str) or "@" not in email.strip():
+        raise ValueError("A valid email is required.")
+    password = item.get("password")
+    if not isinstance(password, str) or not password:
+        raise ValueError("A password is required.")
+    try:
+        role = Role(item.get("role", Role.USER.value))
+    except ValueError:
+        raise ValueError(f"Unknown role {item.get('role')!r}.")
+    return email.strip(), password, role
+
+
+async def import_users(
+    items: AsyncIterator[Any], chunk_size: int = USER_IMPORT_CHUNK_SIZE
+) -> ImportUsersResponse:
+    """
+    Create many users, hashing passwords in parallel and inserting them in create_many chunks.
+
+    For each chunk, emails that already exist are looked up first so their
+    passwords are never hashed. The remaining passwords are hashed across
+    the import process pool and the rows inserted with pre-assigned ids and
+    skip_duplicates, relying on the email unique constraint. If fewer rows
+    than expected were inserted, because a concurrent registration won the
+    race, the chunk's ids are read back to tell which rows were skipped.
+    A malformed body ends the import where it breaks; the users before
+    that point are still imported and `error` gives the position.
+
+    Args:
+        items (AsyncIterator[Any]): Decoded items, e.g. from iter_json_items. An exception instance marks an unparsable item.
+        chunk_size (int): Number of users per create_many call.
+
+    Returns:
+        ImportUsersResponse: Response model for a bulk user import, with totals, timing and a result per submitted user.
+    """
+    started = time.perf_counter()
+    results: list[ImportUserItem] = []
+    pending: list[tuple[int, str, str, Role]] = []
+
+    def conflict(index: int, email: str) -> ImportUserItem:
+        return ImportUserItem(
+            index=index,
+            success=False,
+            email=email,
+            message="User already exists with this email",
+        )
+
+    async def flush() -> None:
+        existing = await timed_query(
+            "User.find_many",
+            prisma.models.User.prisma().find_many(
+                where={"email": {"in": [email for _, email, _, _ in pending]}}
+            ),
+        )
+        taken = {user.email for user in existing}
+        fresh = []
+        for index, email, password, role in pending:
+            if email in taken:
+                results.append(conflict(index, email))
+            else:
+                taken.add(email)
+                fresh.append((index, email, password, role))
+        pending.clear()
+        if not fresh:
+            return
+        hashed = await import_password_hasher.hash_many(
+            [password for _, _, password, _ in fresh]
+        )
+        rows = [
+            {
+                "id": str(uuid4()),
+                "email": email,
+                "password": hashed_password,
+                "role": role.value,
+            }
+            for (_, email, _, role), hashed_password in zip(fresh, hashed)
+        ]
+        try:
+            inserted = await timed_query(
+                "User.create_many",
+                prisma.models.User.prisma().create_many(
+                    data=rows, skip_duplicates=True
+                ),
+            )
+        except Exception:
+            results.extend(
+                ImportUserItem(
+                    index=index,
+                    success=False,
+                    email=email,
+                    message="Failed to import the user.",
+                )
+                for index, email, _, _ in fresh
+            )
+            return
+        created = {row["id"] for row in rows}
+        if inserted < len(rows):
+            found = await timed_query(
+                "User.find_many",
+                prisma.models.User.prisma().find_many(
+                    where={"id": {"in": [row["id"] for row in rows]}}
+                ),
+            )
+            created = {user.id for user in found}
+        for (index, email, _, _), row in zip(fresh, rows):
+            if row["id"] in created:
+                results.append(
+                    ImportUserItem(
+                        index=index,
+                        success=True,
+                        email=email,
+                        user_id=row["id"],
+                        message="User imported successfully.",
+                    )
+                )
+            else:
+                results.append(conflict(index, email))
+
+    index = 0
+    error = None
+    try:
+        async for item in items:
+            try:
+                email, password, role = validate_import_item(item)
+            except ValueError as e:
+                results.append(
+                    ImportUserItem(index=index, success=False, message=str(e))
+                )
+            else:
+                pending.append((index, email, password, role))
+                if len(pending) >= chunk_size:
+                    await flush()
+            index += 1
+    except MalformedBody as e:
+        error = str(e)
+    if pending:
+        await flush()
+    results.sort(key=lambda result: result.index)
+    imported = sum(result.success for result in results)
+    return ImportUsersResponse(
+        imported=imported,
+        failed=len(results) - imported,
+        seconds=round(time.perf_counter() - started, 3),
+        results=results,
+        error=error,
+    )
@@ -0,0 +1,364 @@
+import asyncio
+import logging
+import os
+from collections import OrderedDict, deque
+from typing import Any, AsyncIterator, Iterable
+
+from fastapi import WebSocket, WebSocketDisconnect
+from project.fast_json import dumps
+from project.notifications import notification_listener, notify
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+JOKE_STREAM_BUFFER = int(os.getenv("JOKE_STREAM_BUFFER", "64"))
+
+JOKE_STREAM_HEARTBEAT_SECONDS = float(os.getenv("JOKE_STREAM_HEARTBEAT_SECONDS", "15"))
+
+JOKE_STREAM_MAX_SUBSCRIBERS = int(os.getenv("JOKE_STREAM_MAX_SUBSCRIBERS", "50000"))
+
+JOKE_EVENTS_CHANNEL = os.getenv("JOKE_EVENTS_CHANNEL", "joke_events")
+
+MODERATOR_ROLES = {"MODERATOR", "ADMIN"}
+
+# Recently announced approvals remembered per worker, so that the pool
+# resync does not announce a joke a second time.
+_ANNOUNCED_MAX = 10000
+
+# Events waiting to be sent to the other workers; the oldest are dropped
+# while the database is unreachable.
+_OUTBOX_MAX = 10000
+
+
+class JokeEvent:
+    """
+    One feed event, encoded once and shared by every subscriber.
+
+    `sse` is the complete Server-Sent Events frame and `text` the JSON body
+    sent over WebSockets.
+    """
+
+    __slots__ = ("type", "text", "sse")
+
+    def __init__(self, event_type: str, joke_id: str, content: str) -> None:
+        self.type = event_type
+        body = dumps({"type": event_type, "id": joke_id, "content": content})
+        self.text = body.decode()
+        self.sse = b"event: " + event_type.encode() + b"\ndata: " + body + b"\n\n"
+
+
+class StreamSubscriberEvicted(Exception):
+    """
+    Raised to a subscriber that fell more than its buffer size behind.
+    """
+
+
+class Subscriber:
+    """
+    A bounded event buffer for one stream connection.
+
+    The buffer is only allocated once the first event arrives, and an idle
+    subscriber holds just a pending future and a timer, so tens of thousands of them
+    stay cheap.
+    """
+
+    __slots__ = ("moderator", "evicted", "_buffer", "_waiter", "_max_buffer")
+
+    def __init__(self, moderator: bool, max_buffer: int) -> None:
+        self.moderator = moderator
+        self.evicted = False
+        self._buffer: deque[JokeEvent] | None = None
+        self._waiter: asyncio.Future | None = None
+        self._max_buffer = max_buffer
+
+    def push(self, event: JokeEvent) -> bool:
+        """
+        Queue an event; returns False if the buffer is full.
+        """
+        if self._buffer is None:
+            self._buffer = deque()
+        elif len(self._buffer) >= self._max_buffer:
+            return False
+        self._buffer.append(event)
+        self._wake()
+        return True
+
+    def evict(self) -> None:
+        self.evicted = True
+        self._buffer = None
+        self._wake()
+
+    def _wake(self) -> None:
+        if self._waiter is not None and not self._waiter.done():
+            self._waiter.set_result(None)
+
+    async def next(self, timeout: float) -> JokeEvent | None:
+        """
+        Wait for the next event.
+
+        Args:
+            timeout (float): Seconds to wait before returning None so the caller can send a heartbeat.
+
+        Returns:
+            JokeEvent | None: The next event, or None on timeout.
+
+        Raises:
+            StreamSubscriberEvicted: If the subscriber was evicted for falling behind.
+        """
+        if not self._buffer and not self.evicted:
+            # A bare future plus a timer is much cheaper to wake than wait_for,
+            # which matters when one event wakes every subscriber at once.
+            loop = asyncio.get_running_loop()
+            self._waiter = loop.create_future()
+            timer = loop.call_later(timeout, self._wake)
+            try:
+                await self._waiter
+            finally:
+                timer.cancel()
+                self._waiter = None
+        if self.evicted:
+            raise StreamSubscriberEvicted()
+        if not self._buffer:
+            return None
+        return self._buffer.popleft()
+
+
+class JokeStreamStats(BaseModel):
+    """
+    Subscriber counts and delivery metrics for the live joke feed.
+    """
+
+    subscribers: int
+    moderators: int
+    published: int
+    delivered: int
+    evicted: int
+    rejected: int
+    fanned_out: int
+    fan_out_failed: int
+
+
+class JokeBroadcaster:
+    """
+    Fans feed events out to every subscriber, on every worker.
+
+    Approved jokes go to everyone, new PENDING submissions only to
+    moderators. Publishing never waits: an event is appended to each
+    subscriber's buffer, and a subscriber whose buffer is already full is
+    evicted instead of slowing the publisher down.
+
+    Events published on this worker are also sent to the other workers
+    with NOTIFY on JOKE_EVENTS_CHANNEL, from a background task, and events
+    received from them are delivered here. The broadcaster also listens to
+    the approved joke pool: a joke that enters it through a resync without
+    having been announced (approved outside the API, or while this worker
+    was not listening) is announced then, to this worker's subscribers.
+    Jokes that arrive with a full resync are not announced.
+    """
+
+    def __init__(
+        self,
+        max_buffer: int = JOKE_STREAM_BUFFER,
+        max_subscribers: int = JOKE_STREAM_MAX_SUBSCRIBERS,
+    ) -> None:
+        self.max_buffer = max_buffer
+        self.max_subscribers = max_subscribers
+        self.published = 0
+        self.delivered = 0
+        self.evicted = 0
+        self.rejected = 0
+        self.fanned_out = 0
+        self.fan_out_failed = 0
+        self._announced: OrderedDict[str, None] = OrderedDict()
+        self._outbox: deque[dict[str, Any]] = deque(maxlen=_OUTBOX_MAX)
+        self._sender: asyncio.Task | None = None
+        self._everyone: set[Subscriber] = set()
+        self._moderators: set[Subscriber] = set()
+
+    def __len__(self) -> int:
+        return len(self._everyone)
+
+    def full(self) -> bool:
+        return len(self._everyone) >= self.max_subscribers
+
+    def subscribe(self, moderator: bool = False) -> Subscriber | None:
+        """
+        Register a new subscriber.
+
+        Args:
+            moderator (bool): Whether the subscriber also receives PENDING submissions.
+
+        Returns:
+            Subscriber | None: The subscriber, or None if the worker is at `max_subscribers`.
+        """
+        if self.full():
+            self.rejected += 1
+            return None
+        subscriber = Subscriber(moderator, self.max_buffer)
+        self._everyone.add(subscriber)
+        if moderator:
+            self._moderators.add(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._everyone.discard(subscriber)
+        self._moderators.discard(subscriber)
+
+    def _publish(self, event: JokeEvent, subscribers: set[Subscriber]) -> None:
+        self.published += 1
+        slow = []
+        for subscriber in subscribers:
+            if subscriber.push(event):
+                self.delivered += 1
+            else:
+                slow.append(subscriber)
+        for subscriber in slow:
+            subscriber.evict()
+            self.unsubscribe(subscriber)
+        if slow:
+            self.evicted += len(slow)
+            logger.info("Evicted %d slow joke stream subscribers", len(slow))
+
+    def _deliver(self, event_type: str, joke_id: str, content: str) -> None:
+        if event_type == "approved":
+            self._announce(joke_id)
+            if self._everyone:
+                self._publish(JokeEvent(event_type, joke_id, content), self._everyone)
+        elif self._moderators:
+            self._publish(JokeEvent(event_type, joke_id, content), self._moderators)
+
+    def _announce(self, joke_id: str) -> None:
+        self._announced[joke_id] = None
+        self._announced.move_to_end(joke_id)
+        if len(self._announced) > _ANNOUNCED_MAX:
+            self._announced.popitem(last=False)
+
+    def _fan_out(self, event_type: str, joke_id: str, content: str) -> None:
+        self._outbox.append({"type": event_type, "id": joke_id, "content": content})
+        if self._sender is None or self._sender.done():
+            self._sender = asyncio.get_running_loop().create_task(self._send())
+
+    async def _send(self) -> None:
+        failed = 0
+        while self._outbox:
+            message = self._outbox.popleft()
+            try:
+                await notify(JOKE_EVENTS_CHANNEL, message)
+                self.fanned_out += 1
+            except Exception:
+                failed += 1
+                if failed == 1:
+                    logger.warning(
+                        "Sending joke events to other workers failed", exc_info=True
+                    )
+        self.fan_out_failed += failed
+
+    def publish_approved(self, joke_id: str, content: str) -> None:
+        """
+        Announce a joke approved on this worker, here and on every other worker.
+
+        Call it before the approval reaches the joke pool, or the pool
+        listener will already have announced it to this worker only.
+        """
+        self._deliver("approved", joke_id, content)
+        self._fan_out("approved", joke_id, content)
+
+    def publish_pending(self, joke_id: str, content: str) -> None:
+        """
+        Announce a joke submitted on this worker to moderators on every worker.
+        """
+        self._deliver("pending", joke_id, content)
+        self._fan_out("pending", joke_id, content)
+
+    def on_remote(self, message: dict[str, Any]) -> None:
+        if message.get("type") in ("approved", "pending"):
+            self._deliver(message["type"], message["id"], message["content"])
+
+    def on_add(self, joke_id: str, content: str) -> None:
+        if joke_id not in self._announced:
+            self._deliver("approved", joke_id, content)
+
+    def on_discard(self, joke_id: str) -> None:
+        self._announced.pop(joke_id, None)
+
+    def on_reset(self, jokes: Iterable[tuple[str, str]]) -> None:
+        pass
+
+    def stats(self) -> JokeStreamStats:
+        return JokeStreamStats(
+            subscribers=len(self._everyone),
+            moderators=len(self._moderators),
+            published=self.published,
+            delivered=self.delivered,
+            evicted=self.evicted,
+            rejected=self.rejected,
+            fanned_out=self.fanned_out,
+            fan_out_failed=self.fan_out_failed,
+        )
+
+
+def is_moderator(role: str | None) -> bool:
+    return role in MODERATOR_ROLES
+
+
+joke_broadcaster = JokeBroadcaster()
+
+notification_listener.subscribe(JOKE_EVENTS_CHANNEL, joke_broadcaster.on_remote)
+
+_SSE_HEARTBEAT = b": heartbeat\n\n"
+
+_WS_HEARTBEAT = '{"type":"heartbeat"}'
+
+
+async def sse_stream(moderator: bool) -> AsyncIterator[bytes]:
+    """
+    Subscribe to the feed and yield Server-Sent Events frames until the
+    client disconnects or is evicted for falling behind.
+    """
+    subscriber = joke_broadcaster.subscribe(moderator)
+    if subscriber is None:
+        yield b"event: unavailable\ndata: {}\n\n"
+        return
+    try:
+        yield b"retry: 5000\n\n"
+        while True:
+            try:
+                event = await subscriber.next(JOKE_STREAM_HEARTBEAT_SECONDS)
+            except StreamSubscriberEvicted:
+                yield b"event: evicted\ndata: {}\n\n"
+                return
+            yield event.sse if event is not None else _SSE_HEARTBEAT
+    finally:
+        joke_broadcaster.unsubscribe(subscriber)
+
+
+async def websocket_stream(websocket: WebSocket, moderator: bool) -> None:
+    """
+    Send feed events as JSON text messages until the client disconnects.
+
+    Connections are refused, and evicted subscribers closed, with code 1013
+    (try again later).
+    """
+    subscriber = joke_broadcaster.subscribe(moderator)
+    if subscriber is None:
+        await websocket.close(code=1013)
+        return
+    try:
+        await websocket.accept()
+        while True:
+            try:
+                event = await subscriber.next(JOKE_STREAM_HEARTBEAT_SECONDS)
+            except StreamSubscriberEvicted:
+                await websocket.close(code=1013)
+                return
+            await websocket.send_text(
+                event.text if event is not None else _WS_HEARTBEAT
+            )
+    except (WebSocketDisconnect, OSError):
+        # The client went away: ASGI servers raise an OSError (uvicorn's
+        # ClientDisconnected) from sends to a closed connection.
+        pass
+    except Exception:
+        logger.exception("Joke feed WebSocket failed")
+    finally:
+        joke_broadcaster.unsubscribe(subscriber)
@@ -0,0 +1,419 @@
+import asyncio
+import logging
+import os
+import random
+from array import array
+from datetime import datetime
+from typing import Iterable, Iterator, Protocol
+
+import prisma
+import prisma.models
+from project.fast_json import dumps
+from project.joke_snapshot import (
+    JOKE_SNAPSHOT_PATH,
+    JokeSnapshot,
+    SnapshotFile,
+    encode_snapshot,
+)
+from project.metrics import timed_query
+from project.single_flight import SingleFlight
+
+logger = logging.getLogger(__name__)
+
+JOKE_POOL_ENABLED = os.getenv("JOKE_POOL_ENABLED", "1") != "0"
+
+JOKE_POOL_RESYNC_SECONDS = float(os.getenv("JOKE_POOL_RESYNC_SECONDS", "30"))
+
+JOKE_POOL_FULL_RESYNC_EVERY = int(os.getenv("JOKE_POOL_FULL_RESYNC_EVERY", "20"))
+
+approved_joke_loads: SingleFlight[list[prisma.models.Joke]] = SingleFlight(
+    "approved_joke_pool_load"
+)
+
+
+def encode_joke(joke_id: str, content: str) -> bytes:
+    """
+    Encode an approved joke as the JSON body of GetRandomJokeResponse.
+    """
+    return dumps({"id": joke_id, "content": content, "status": "APPROVED"})
+
+
+class PoolListener(Protocol):
+    """
+    Receives every change made to an ApprovedJokePool.
+
+    `on_reset` may be given a lazy iterable over the pool's snapshot; it
+    stays valid until the next reset.
+    """
+
+    def on_add(self, joke_id: str, content: str) -> None: ...
+
+    def on_discard(self, joke_id: str) -> None: ...
+
+    def on_reset(self, jokes: Iterable[tuple[str, str]]) -> None: ...
+
+
+class ApprovedJokePool:
+    """
+    Process-local pool of approved jokes.
+
+    The pool is a JokeSnapshot, an id-ordered array of jokes with their
+    JSON response bodies encoded once when it is built, plus the changes
+    this worker made since. Jokes are addressed by a dense slot number:
+    until the first change a slot is the snapshot index, after that
+    `_refs` maps each slot to a snapshot index (>= 0) or to a joke added
+    locally (`~index` into the `_local_*` lists). Removal swaps the last
+    slot into the hole, so add, discard and random selection stay O(1);
+    lookups by id are a dict hit for local jokes and a binary search in
+    the snapshot otherwise.
+
+    Replacing the snapshot renumbers every slot; `generation` counts those
+    replacements so that state kept per slot elsewhere can tell it is stale.
+
+    With JOKE_SNAPSHOT_PATH set the snapshot is a file mapped read-only by
+    every worker on the host and rebuilt by one of them at a time;
+    otherwise it is built in memory from the database.
+    """
+
+    def __init__(self, snapshot_path: str = JOKE_SNAPSHOT_PATH) -> None:
+        self._snapshot = JokeSnapshot.empty()
+        self._refs: array | None = None
+        self._snapshot_slots: array | None = None
+        self._local_ids: list[str | None] = []
+        self._local_contents: list[str | None] = []
+        self._local_payloads: list[bytes | None] = []
+        self._local_slots: dict[str, int] = {}
+        self._watermark: datetime | None = None
+        self._resyncs = 0
+        self.generation = 0
+        self._listeners: list[PoolListener] = []
+        self.snapshot_file = SnapshotFile(snapshot_path) if snapshot_path else None
+        self.warmed = False
+
+    def __len__(self) -> int:
+        return len(self._snapshot) if self._refs is None else len(self._refs)
+
+    def __contains__(self, joke_id: str) -> bool:
+        return self._slot_of(joke_id) is not None
+
+    @property
+    def snapshot(self) -> JokeSnapshot:
+        return self._snapshot
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        """
+        Yield the (id, content) of every pooled joke in slot order.
+        """
+        for slot in range(len(self)):
+            yield self.at(slot)
+
+    def subscribe(self, listener: PoolListener) -> None:
+        """
+        Register a listener to be told about every change to the pool.
+
+        Args:
+            listener (PoolListener): The listener; it is immediately reset to the current contents.
+        """
+        self._listeners.append(listener)
+        listener.on_reset(list(self.items()))
+
+    def _slot_of(self, joke_id: str) -> int | None:
+        slot = self._local_slots.get(joke_id)
+        if slot is not None:
+            return slot
+        index = self._snapshot.index_of(joke_id)
+        if index is None or self._snapshot_slots is None:
+            return index
+        slot = self._snapshot_slots[index]
+        return None if slot < 0 else slot
+
+    def _ref(self, slot: int) -> int:
+        return slot if self._refs is None else self._refs[slot]
+
+    def _materialize(self) -> None:
+        # The first change switches from "slot == snapshot index" to the
+        # explicit slot <-> ref tables.
+        if self._refs is None:
+            self._refs = array("q", range(len(self._snapshot)))
+            self._snapshot_slots = array("q", range(len(self._snapshot)))
+
+    def _add_local(self, joke_id: str, content: str) -> int:
+        self._local_ids.append(joke_id)
+        self._local_contents.append(content)
+        self._local_payloads.append(encode_joke(joke_id, content))
+        return ~(len(self._local_ids) - 1)
+
+    def _drop_ref(self, ref: int) -> None:
+        if ref >= 0:
+            self._snapshot_slots[ref] = -1
+        else:
+            self._local_ids[~ref] = None
+            self._local_contents[~ref] = None
+            self._local_payloads[~ref] = None
+
+    def get(self, joke_id: str) -> str | None:
+        """
+        Return the content of a pooled joke, or None if it is not in the pool.
+        """
+        slot = self._slot_of(joke_id)
+        return None if slot is None else self.at(slot)[1]
+
+    def add(self, joke_id: str, content: str) -> None:
+        """
+        Insert a joke into the pool, or replace its content if already present.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+            content (str): The joke text.
+        """
+        slot = self._slot_of(joke_id)
+        if slot is not None and self.at(slot)[1] == content:
+            return
+        self._materialize()
+        if slot is not None:
+            self._drop_ref(self._refs[slot])
+            self._refs[slot] = self._add_local(joke_id, content)
+        else:
+            slot = len(self._refs)
+            self._refs.append(self._add_local(joke_id, content))
+        self._local_slots[joke_id] = slot
+        for listener in self._listeners:
+            listener.on_add(joke_id, content)
+
+    def discard(self, joke_id: str) -> None:
+        """
+        Remove a joke from the pool if present.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+        """
+        slot = self._slot_of(joke_id)
+        if slot is None:
+            return
+        self._materialize()
+        ref = self._refs[slot]
+        last_ref = self._refs.pop()
+        if slot < len(self._refs):
+            self._refs[slot] = last_ref
+            if last_ref >= 0:
+                self._snapshot_slots[last_ref] = slot
+            else:
+                self._local_slots[self._local_ids[~last_ref]] = slot
+        self._local_slots.pop(joke_id, None)
+        self._drop_ref(ref)
+        for listener in self._listeners:
+            listener.on_discard(joke_id)
+
+    def replace_snapshot(self, snapshot: JokeSnapshot) -> None:
+        """
+        Make `snapshot` the whole pool, dropping local changes.
+
+        Args:
+            snapshot (JokeSnapshot): Every approved joke as of its watermark.
+        """
+        previous, self._snapshot = self._snapshot, snapshot
+        self._refs = self._snapshot_slots = None
+        self._local_ids, self._local_contents, self._local_payloads = [], [], []
+        self._local_slots = {}
+        self._watermark = snapshot.watermark
+        self.generation += 1
+        if previous is not snapshot:
+            previous.close()
+        for listener in self._listeners:
+            listener.on_reset(snapshot.items())
+
+    def replace_all(self, jokes: list[prisma.models.Joke]) -> None:
+        """
+        Rebuild the pool from a complete list of approved jokes.
+
+        Args:
+            jokes (list[prisma.models.Joke]): Every approved joke.
+        """
+        self.replace_snapshot(JokeSnapshot(_encode_jokes(jokes)))
+
+    def random(self) -> tuple[str, str] | None:
+        """
+        Pick a uniformly random joke from the pool.
+
+        Returns:
+            tuple[str, str] | None: The (id, content) of the joke, or None if the pool is empty.
+        """
+        slot = self.random_slot()
+        return None if slot is None else self.at(slot)
+
+    def random_payload(self) -> bytes | None:
+        """
+        Pick a uniformly random joke and return its pre-encoded JSON body.
+
+        Returns:
+            bytes | None: The encoded joke, or None if the pool is empty.
+        """
+        slot = self.random_slot()
+        return None if slot is None else self.payload_at(slot)
+
+    def random_slot(self) -> int | None:
+        """
+        Pick a uniformly random slot, or None if the pool is empty.
+        """
+        size = len(self)
+        return random.randrange(size) if size else None
+
+    def id_at(self, slot: int) -> str:
+        """
+        Return the id of the joke stored in a given slot.
+        """
+        ref = self._ref(slot)
+        return self._snapshot.id_at(ref) if ref >= 0 else self._local_ids[~ref]
+
+    def payload_at(self, slot: int) -> bytes:
+        """
+        Return the pre-encoded JSON body of the joke stored in a given slot.
+        """
+        ref = self._ref(slot)
+        if ref >= 0:
+            return self._snapshot.payload_at(ref)
+        return self._local_payloads[~ref]
+
+    def at(self, slot: int) -> tuple[str, str]:
+        """
+        Return the joke stored in a given slot.
+
+        Args:
+            slot (int): A dense slot number below len(pool).
+
+        Returns:
+            tuple[str, str]: The (id, content) of the joke.
+        """
+        ref = self._ref(slot)
+        if ref >= 0:
+            return self._snapshot.id_at(ref), self._snapshot.content_at(ref)
+        return self._local_ids[~ref], self._local_contents[~ref]
+
+    def sample(self, count: int) -> list[tuple[str, str]]:
+        """
+        Pick up to `count` distinct random jokes from the pool.
+
+        Args:
+            count (int): Number of jokes wanted.
+
+        Returns:
+            list[tuple[str, str]]: The (id, content) of each picked joke.
+        """
+        return [self.at(slot) for slot in self.sample_slots(count)]
+
+    def sample_slots(self, count: int) -> list[int]:
+        """
+        Pick up to `count` distinct random slots from the pool.
+        """
+        size = len(self)
+        return random.sample(range(size), min(count, size))
+
+    def apply_status(self, joke_id: str, content: str, status: str) -> None:
+        """
+        Apply a joke's new moderation status to the pool.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+            content (str): The joke text.
+            status (str): The joke's current status.
+        """
+        if status == "APPROVED":
+            self.add(joke_id, content)
+        else:
+            self.discard(joke_id)
+
+    async def _load_approved(self) -> list[prisma.models.Joke]:
+        return await approved_joke_loads.do(
+            "APPROVED",
+            lambda: timed_query(
+                "Joke.find_many",
+                prisma.models.Joke.prisma().find_many(where={"status": "APPROVED"}),
+            ),
+        )
+
+    async def _build_snapshot(self) -> bytes:
+        return _encode_jokes(await self._load_approved())
+
+    async def warm(self) -> None:
+        """
+        Load every approved joke into the pool.
+
+        With a snapshot file, a fresh enough snapshot built by another
+        worker is mapped as is and only the changes since its watermark are
+        fetched; otherwise this worker rebuilds it from the database.
+        """
+        if self.snapshot_file is None:
+            self.replace_all(await self._load_approved())
+        else:
+            snapshot, built = await self.snapshot_file.load(
+                self._build_snapshot,
+                max_age=JOKE_POOL_RESYNC_SECONDS * JOKE_POOL_FULL_RESYNC_EVERY,
+            )
+            self.replace_snapshot(snapshot)
+            if not built and self._watermark is not None:
+                await self._apply_changes()
+        self.warmed = True
+        logger.info("Approved joke pool warmed with %d jokes", len(self))
+
+    async def resync(self) -> None:
+        """
+        Pull changes made by other workers since the last sync.
+
+        Only rows whose updatedAt is at or after the watermark are fetched.
+        Every JOKE_POOL_FULL_RESYNC_EVERY runs, or as soon as another worker
+        has replaced the snapshot file, the pool is rebuilt from scratch so
+        that deleted rows are dropped too.
+        """
+        self._resyncs += 1
+        if (
+            self._watermark is None
+            or self._resyncs % JOKE_POOL_FULL_RESYNC_EVERY == 0
+            or (
+                self.snapshot_file is not None
+                and self.snapshot_file.changed(self._snapshot)
+            )
+        ):
+            await self.warm()
+            return
+        await self._apply_changes()
+
+    async def _apply_changes(self) -> None:
+        changed = await timed_query(
+            "Joke.find_many",
+            prisma.models.Joke.prisma().find_many(
+                where={"updatedAt": {"gte": self._watermark}}
+            ),
+        )
+        for joke in changed:
+            self.apply_status(joke.id, joke.content, joke.status)
+        self._advance_watermark(changed)
+
+    async def resync_forever(self, interval: float = JOKE_POOL_RESYNC_SECONDS) -> None:
+        """
+        Resync the pool every `interval` seconds until cancelled.
+
+        Args:
+            interval (float): Seconds to wait between resyncs.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.resync()
+            except Exception:
+                logger.exception("Approved joke pool resync failed")
+
+    def _advance_watermark(self, jokes: list[prisma.models.Joke]) -> None:
+        for joke in jokes:
+            if self._watermark is None or joke.updatedAt > self._watermark:
+                self._watermark = joke.updatedAt
+
+
+def _encode_jokes(jokes: list[prisma.models.Joke]) -> bytes:
+    watermark = max((joke.updatedAt for joke in jokes), default=None)
+    return encode_snapshot(
+        [(joke.id, joke.content, encode_joke(joke.id, joke.content)) for joke in jokes],
+        watermark,
+    )
+
+
+approved_joke_pool = ApprovedJokePool()
@@ -0,0 +1,279 @@
+"""
+Compact, memory-mappable snapshot of the approved jokes.
+
+    header   magic, version, count, source, built_at, watermark, blob size
+    offsets  3 * count + 1 unsigned 64-bit file offsets
+    blob     per joke, in id order: id, content and the encoded
+             GetRandomJokeResponse body, all UTF-8
+
+Joke i's id is file[offsets[3i]:offsets[3i + 1]], its content runs on to
+offsets[3i + 2] and its response body to offsets[3i + 3]. Integers are in
+native byte order: a snapshot file is only shared by the workers of one
+host.
+"""
+
+import asyncio
+import fcntl
+import hashlib
+import logging
+import mmap
+import os
+import struct
+import time
+from array import array
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Awaitable, Callable, Iterator, Optional, Union
+
+logger = logging.getLogger(__name__)
+
+# Unset keeps the snapshot in process memory. Point every worker of a host
+# at the same file (e.g. under /dev/shm) to build it once and share it.
+JOKE_SNAPSHOT_PATH = os.getenv("JOKE_SNAPSHOT_PATH", "")
+
+_MAGIC = b"JOKESNAP"
+
+_VERSION = 1
+
+# magic, version, count, source, built_at, watermark (µs since the epoch or -1), blob size
+_HEADER = struct.Struct("=8sII8sdqQ")
+
+_EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+# Snapshots built against another database are ignored.
+_SOURCE = hashlib.blake2b(
+    os.getenv("DATABASE_URL", "").encode(), digest_size=8
+).digest()
+
+_LOCK_POLL_SECONDS = 0.05
+
+
+def encode_snapshot(
+    jokes: list[tuple[str, str, bytes]], watermark: Optional[datetime]
+) -> bytes:
+    """
+    Serialize jokes into the snapshot format.
+
+    Args:
+        jokes (list[tuple[str, str, bytes]]): (id, content, encoded response body) of each joke, in any order.
+        watermark (Optional[datetime]): The latest updatedAt among the jokes, where incremental resyncs continue from.
+
+    Returns:
+        bytes: The snapshot.
+    """
+    encoded = sorted(
+        (joke_id.encode(), content.encode(), payload)
+        for joke_id, content, payload in jokes
+    )
+    offsets = array("Q")
+    position = _HEADER.size + 8 * (3 * len(encoded) + 1)
+    for fields in encoded:
+        for field in fields:
+            offsets.append(position)
+            position += len(field)
+    offsets.append(position)
+    blob = b"".join(field for fields in encoded for field in fields)
+    header = _HEADER.pack(
+        _MAGIC,
+        _VERSION,
+        len(encoded),
+        _SOURCE,
+        time.time(),
+        -1 if watermark is None else (watermark - _EPOCH) // timedelta(microseconds=1),
+        len(blob),
+    )
+    return header + offsets.tobytes() + blob
+
+
+class JokeSnapshot:
+    """
+    Read-only view of a snapshot held in bytes or a read-only mmap.
+
+    Nothing is decoded up front: lookups slice the buffer through the
+    offsets table, so opening a mapped snapshot costs the same for ten
+    jokes or a million, and the pages are shared with every other process
+    mapping the same file.
+    """
+
+    def __init__(self, buffer: Union[bytes, mmap.mmap]) -> None:
+        if len(buffer) < _HEADER.size:
+            raise ValueError("Snapshot is truncated")
+        magic, version, count, source, built_at, watermark, blob_size = (
+            _HEADER.unpack_from(buffer)
+        )
+        if magic != _MAGIC or version != _VERSION:
+            raise ValueError("Not a joke snapshot of this version")
+        if source != _SOURCE:
+            raise ValueError("Snapshot was built from another database")
+        offsets_end = _HEADER.size + 8 * (3 * count + 1)
+        if len(buffer) != offsets_end + blob_size:
+            raise ValueError("Snapshot is truncated")
+        self.count = count
+        self.built_at = built_at
+        self.watermark = (
+            None if watermark < 0 else _EPOCH + timedelta(microseconds=watermark)
+        )
+        self.file_id: Optional[tuple[int, int]] = None
+        self._buffer = buffer
+        self._offsets = memoryview(buffer)[_HEADER.size : offsets_end].cast("Q")
+
+    @classmethod
+    def empty(cls) -> "JokeSnapshot":
+        return cls(encode_snapshot([], None))
+
+    def __len__(self) -> int:
+        return self.count
+
+    @property
+    def size_bytes(self) -> int:
+        return len(self._buffer)
+
+    def id_at(self, index: int) -> str:
+        offsets = self._offsets
+        return self._buffer[offsets[3 * index] : offsets[3 * index + 1]].decode()
+
+    def content_at(self, index: int) -> str:
+        offsets = self._offsets
+        return self._buffer[offsets[3 * index + 1] : offsets[3 * index + 2]].decode()
+
+    def payload_at(self, index: int) -> bytes:
+        offsets = self._offsets
+        return self._buffer[offsets[3 * index + 2] : offsets[3 * index + 3]]
+
+    def items(self) -> Iterator[tuple[str, str]]:
+        """
+        Yield the (id, content) of every joke, in id order.
+        """
+        for index in range(self.count):
+            yield self.id_at(index), self.content_at(index)
+
+    def index_of(self, joke_id: str) -> Optional[int]:
+        """
+        Binary search the id-ordered jokes for `joke_id`.
+        """
+        key = joke_id.encode()
+        offsets = self._offsets
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            found = self._buffer[offsets[3 * middle] : offsets[3 * middle + 1]]
+            if found < key:
+                low = middle + 1
+            elif found > key:
+                high = middle
+            else:
+                return middle
+        return None
+
+    def close(self) -> None:
+        """
+        Release the buffer; only the mapping of a file-backed snapshot needs it.
+        """
+        self._offsets.release()
+        if isinstance(self._buffer, mmap.mmap):
+            self._buffer.close()
+
+
+class SnapshotFile:
+    """
+    A snapshot shared by every worker on a host through one file.
+
+    Readers map the file read-only. Whoever finds it missing or older than
+    `max_age` takes an exclusive flock on a sibling lock file and rebuilds
+    it; workers that were waiting on the lock then find it fresh and map
+    the new one instead of querying the database themselves. The new
+    snapshot is written to a temporary file and renamed over the old one,
+    so readers see either the complete old or the complete new file, and
+    mappings of the old one stay valid until closed.
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.lock_path = f"{path}.lock"
+        self.builds = 0
+
+    def open(self) -> Optional[JokeSnapshot]:
+        """
+        Map the current snapshot, or return None if it is missing or unusable.
+        """
+        try:
+            descriptor = os.open(self.path, os.O_RDONLY)
+        except FileNotFoundError:
+            return None
+        try:
+            stat = os.fstat(descriptor)
+            if stat.st_size == 0:
+                return None
+            mapping = mmap.mmap(descriptor, 0, access=mmap.ACCESS_READ)
+        finally:
+            os.close(descriptor)
+        try:
+            snapshot = JokeSnapshot(mapping)
+        except ValueError as e:
+            mapping.close()
+            logger.warning("Ignoring joke snapshot %s: %s", self.path, e)
+            return None
+        snapshot.file_id = (stat.st_ino, stat.st_mtime_ns)
+        return snapshot
+
+    def changed(self, snapshot: JokeSnapshot) -> bool:
+        """
+        Whether the file has been replaced since `snapshot` was mapped from it.
+        """
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return False
+        return (stat.st_ino, stat.st_mtime_ns) != snapshot.file_id
+
+    def write(self, data: bytes) -> None:
+        temporary = f"{self.path}.{os.getpid()}.tmp"
+        with open(temporary, "wb") as file:
+            file.write(data)
+        os.replace(temporary, self.path)
+        self.builds += 1
+
+    @asynccontextmanager
+    async def _leader(self) -> AsyncIterator[None]:
+        descriptor = os.open(self.lock_path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            while True:
+                try:
+                    fcntl.flock(descriptor, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    break
+                except BlockingIOError:
+                    await asyncio.sleep(_LOCK_POLL_SECONDS)
+            yield
+        finally:
+            # Closing the descriptor releases the lock.
+            os.close(descriptor)
+
+    async def load(
+        self, build: Callable[[], Awaitable[bytes]], max_age: float
+    ) -> tuple[JokeSnapshot, bool]:
+        """
+        Map the shared snapshot, rebuilding it first if it is missing or stale.
+
+        Args:
+            build (Callable[[], Awaitable[bytes]]): Produces a new snapshot from the database.
+            max_age (float): Seconds after which a snapshot is rebuilt.
+
+        Returns:
+            tuple[JokeSnapshot, bool]: The snapshot and whether this process built it.
+        """
+        snapshot = self.open()
+        if snapshot is not None and time.time() - snapshot.built_at < max_age:
+            return snapshot, False
+        async with self._leader():
+            if snapshot is not None:
+                snapshot.close()
+            snapshot = self.open()
+            if snapshot is not None and time.time() - snapshot.built_at < max_age:
+                return snapshot, False
+            if snapshot is not None:
+                snapshot.close()
+            self.write(await build())
+        snapshot = self.open()
+        if snapshot is None:
+            raise RuntimeError(f"Joke snapshot {self.path} vanished after writing it")
+        return snapshot, True
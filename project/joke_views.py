@@ -0,0 +1,301 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+import prisma
+import prisma.models
+from project.fast_json import dumps
+from project.metrics import timed_query
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+JOKE_VIEWS_ENABLED = os.getenv("JOKE_VIEWS_ENABLED", "1") != "0"
+
+JOKE_VIEWS_FLUSH_SECONDS = float(os.getenv("JOKE_VIEWS_FLUSH_SECONDS", "10"))
+
+# Distinct (joke, hour) counters kept while the database is unreachable;
+# views beyond that are dropped rather than growing memory without bound.
+JOKE_VIEWS_MAX_PENDING = int(os.getenv("JOKE_VIEWS_MAX_PENDING", "100000"))
+
+JOKE_TOP_WINDOWS = os.getenv("JOKE_TOP_WINDOWS", "1h,24h,7d")
+
+JOKE_TOP_SIZE = int(os.getenv("JOKE_TOP_SIZE", "100"))
+
+JOKE_TOP_REFRESH_SECONDS = float(os.getenv("JOKE_TOP_REFRESH_SECONDS", "60"))
+
+BUCKET_SECONDS = 3600
+
+_UNITS = {"m": 60, "h": 3600, "d": 86400}
+
+
+def parse_window(window: str) -> timedelta:
+    """
+    Parse a window such as "90m", "24h" or "7d".
+
+    Raises:
+        ValueError: If the window is not a positive number followed by m, h or d.
+    """
+    unit = _UNITS.get(window[-1:])
+    if unit is None or not window[:-1].isdigit() or int(window[:-1]) <= 0:
+        raise ValueError(f"Invalid window {window!r}")
+    return timedelta(seconds=int(window[:-1]) * unit)
+
+
+def bucket_id(joke_id: str, bucket: int) -> str:
+    """
+    Primary key of a JokeViewBucket row, so a flush can upsert by id.
+    """
+    return f"{joke_id}:{bucket}"
+
+
+class JokeViewStats(BaseModel):
+    """
+    View counting and flush metrics for this worker.
+    """
+
+    recorded: int
+    flushed: int
+    dropped: int
+    pending: int
+    flushes: int
+    failed_flushes: int
+    last_flush_seconds: float
+
+
+class JokeViewCounter:
+    """
+    Per-worker joke view counts, written to JokeViewBucket in batches.
+
+    `record` is a dict increment keyed by joke id and hour, with no I/O.
+    `flush` swaps the counts out and adds them to the hourly rows with one
+    batched round-trip of upserts, so the database sees one write per
+    joke and hour per flush interval however many times the joke was served.
+    """
+
+    def __init__(self, max_pending: int = JOKE_VIEWS_MAX_PENDING) -> None:
+        self.max_pending = max_pending
+        self.recorded = 0
+        self.flushed = 0
+        self.dropped = 0
+        self.flushes = 0
+        self.failed_flushes = 0
+        self.last_flush_seconds = 0.0
+        self._counts: dict[tuple[str, int], int] = {}
+
+    def record(self, joke_id: str) -> None:
+        key = (joke_id, int(time.time()) // BUCKET_SECONDS)
+        count = self._counts.get(key)
+        if count is None and len(self._counts) >= self.max_pending:
+            self.dropped += 1
+            return
+        self._counts[key] = (count or 0) + 1
+        self.recorded += 1
+
+    async def flush(self) -> None:
+        """
+        Add the pending counts to the database; on failure they are kept for the next flush.
+
+        The batch fails as a whole if one of its jokes was deleted since it
+        was viewed (the bucket's foreign key), so after a failure the counts
+        of jokes that no longer exist are dropped rather than retried forever.
+        """
+        if not self._counts:
+            return
+        counts, self._counts = self._counts, {}
+        started = time.perf_counter()
+        try:
+            async with prisma.get_client().batch_() as batcher:
+                for (joke_id, bucket), views in counts.items():
+                    batcher.jokeviewbucket.upsert(
+                        where={"id": bucket_id(joke_id, bucket)},
+                        data={
+                            "create": {
+                                "id": bucket_id(joke_id, bucket),
+                                "jokeId": joke_id,
+                                "bucket": datetime.fromtimestamp(
+                                    bucket * BUCKET_SECONDS, timezone.utc
+                                ),
+                                "views": views,
+                            },
+                            "update": {"views": {"increment": views}},
+                        },
+                    )
+        except Exception:
+            self.failed_flushes += 1
+            try:
+                counts = await self._drop_deleted_jokes(counts)
+            except Exception:
+                logger.warning(
+                    "Could not check joke views for deleted jokes", exc_info=True
+                )
+            for key, views in counts.items():
+                if key in self._counts or len(self._counts) < self.max_pending:
+                    self._counts[key] = self._counts.get(key, 0) + views
+                else:
+                    self.dropped += views
+            raise
+        self.flushes += 1
+        self.flushed += sum(counts.values())
+        self.last_flush_seconds = time.perf_counter() - started
+
+    async def _drop_deleted_jokes(
+        self, counts: dict[tuple[str, int], int]
+    ) -> dict[tuple[str, int], int]:
+        joke_ids = list({joke_id for joke_id, _ in counts})
+        jokes = await timed_query(
+            "Joke.find_many",
+            prisma.models.Joke.prisma().find_many(where={"id": {"in": joke_ids}}),
+        )
+        existing = {joke.id for joke in jokes}
+        kept = {}
+        for key, views in counts.items():
+            if key[0] in existing:
+                kept[key] = views
+            else:
+                self.dropped += views
+        if len(kept) < len(counts):
+            logger.info(
+                "Dropped views of %d deleted jokes",
+                len(joke_ids) - len(existing),
+            )
+        return kept
+
+    async def flush_forever(self, interval: float = JOKE_VIEWS_FLUSH_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Joke view flush failed")
+
+    def stats(self) -> JokeViewStats:
+        return JokeViewStats(
+            recorded=self.recorded,
+            flushed=self.flushed,
+            dropped=self.dropped,
+            pending=sum(self._counts.values()),
+            flushes=self.flushes,
+            failed_flushes=self.failed_flushes,
+            last_flush_seconds=self.last_flush_seconds,
+        )
+
+
+class TopJoke(BaseModel):
+    """
+    An approved dad joke and how often it was served in the window.
+    """
+
+    id: str
+    content: str
+    views: int
+
+
+class TopJokesResponse(BaseModel):
+    """
+    The most served approved dad jokes in a time window, most viewed first.
+    """
+
+    window: str
+    refreshed_at: Optional[datetime] = None
+    jokes: list[TopJoke]
+
+
+class TopJokes:
+    """
+    Precomputed top-K most viewed approved jokes for each window.
+
+    `refresh` sums the hourly buckets inside each window on the database
+    (one grouped aggregate over the window's buckets, found through the
+    index on `bucket`, ordered and cut to the top rows there so only those
+    are transferred), drops jokes that are no longer approved and
+    pre-encodes each entry. Requests only slice and join those
+    bytes. Windows are rounded to whole hours.
+    """
+
+    def __init__(self, windows: list[str], size: int = JOKE_TOP_SIZE) -> None:
+        self.windows = {window: parse_window(window) for window in windows}
+        self.size = size
+        self._entries: dict[str, list[bytes]] = {window: [] for window in windows}
+        self._refreshed_at: dict[str, datetime] = {}
+
+    async def refresh(self) -> None:
+        for window, length in self.windows.items():
+            since = datetime.now(timezone.utc) - length
+            since = since.replace(minute=0, second=0, microsecond=0)
+            top = await timed_query(
+                "JokeViewBucket.group_by",
+                prisma.models.JokeViewBucket.prisma().group_by(
+                    by=["jokeId"],
+                    where={"bucket": {"gte": since}},
+                    sum={"views": True},
+                    order={"_sum": {"views": "desc"}},
+                    # A few extra in case some are no longer approved.
+                    take=self.size * 2,
+                ),
+            )
+            approved = {}
+            if top:
+                jokes = await timed_query(
+                    "Joke.find_many",
+                    prisma.models.Joke.prisma().find_many(
+                        where={
+                            "id": {"in": [group["jokeId"] for group in top]},
+                            "status": "APPROVED",
+                        }
+                    ),
+                )
+                approved = {joke.id: joke.content for joke in jokes}
+            self._entries[window] = [
+                dumps(
+                    {
+                        "id": group["jokeId"],
+                        "content": approved[group["jokeId"]],
+                        "views": group["_sum"]["views"],
+                    }
+                )
+                for group in top
+                if group["jokeId"] in approved
+            ][: self.size]
+            self._refreshed_at[window] = datetime.now(timezone.utc)
+
+    async def refresh_forever(self, interval: float = JOKE_TOP_REFRESH_SECONDS) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.exception("Top jokes refresh failed")
+            await asyncio.sleep(interval)
+
+    def payload(self, window: str, limit: int) -> bytes:
+        """
+        Return the encoded TopJokesResponse for a window.
+
+        Args:
+            window (str): One of the configured windows.
+            limit (int): Maximum number of jokes, at most the configured top size.
+
+        Returns:
+            bytes: The JSON body.
+        """
+        refreshed_at = self._refreshed_at.get(window)
+        header = {
+            "window": window,
+            "refreshed_at": refreshed_at.isoformat() if refreshed_at else None,
+        }
+        return (
+            dumps(header)[:-1]
+            + b',"jokes":['
+            + b",".join(self._entries[window][:limit])
+            + b"]}"
+        )
+
+
+joke_views = JokeViewCounter()
+
+top_jokes = TopJokes(
+    [window.strip() for window in JOKE_TOP_WINDOWS.split(",") if window.strip()]
+)
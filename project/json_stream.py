@@ -0,0 +1,150 @@
+import codecs
+import json
+import os
+from typing import Any, AsyncIterator
+
+# Longest item (NDJSON line or array element) buffered while waiting for
+# the rest of it; a longer one ends the body.
+JSON_ITEM_MAX_CHARS = int(os.getenv("JSON_ITEM_MAX_CHARS", str(64 * 1024)))
+
+_WHITESPACE = " \t\r\n"
+
+_SEPARATORS = _WHITESPACE + ","
+
+_decoder = json.JSONDecoder()
+
+_BLANK = object()
+
+
+class MalformedBody(ValueError):
+    """
+    The body cannot be parsed past `position`, a character offset into it.
+    """
+
+    def __init__(self, message: str, position: int) -> None:
+        super().__init__(f"{message} at character {position}")
+        self.position = position
+
+
+async def iter_json_items(
+    chunks: AsyncIterator[bytes], max_item_chars: int = JSON_ITEM_MAX_CHARS
+) -> AsyncIterator[Any]:
+    """
+    Incrementally parse a streamed NDJSON or JSON-array body.
+
+    The body is treated as a JSON array if its first non-whitespace
+    character is "[", otherwise as newline-delimited JSON. Only the current
+    item is ever buffered, and at most `max_item_chars` of it: an array
+    element that does not parse cannot be told apart from one that is still
+    arriving, so without the cap it would buffer the rest of the body.
+
+    Items yielded before a MalformedBody is raised are unaffected by it, so
+    callers can report them together with the error.
+
+    Args:
+        chunks (AsyncIterator[bytes]): The raw request body, e.g. `request.stream()`.
+        max_item_chars (int): Longest item accepted, in characters.
+
+    Yields:
+        Any: Each decoded item. NDJSON lines that fail to parse are yielded as the ValueError raised for them.
+
+    Raises:
+        MalformedBody: If the body is not UTF-8, a JSON-array body is malformed or an item is too long.
+    """
+    utf8 = codecs.getincrementaldecoder("utf-8")()
+    buffer = ""
+    # Characters of the body before `buffer`.
+    offset = 0
+    mode = None
+    async for chunk in chunks:
+        buffer += _decode(utf8, chunk, offset + len(buffer))
+        if mode is None:
+            stripped = buffer.lstrip(_WHITESPACE)
+            offset += len(buffer) - len(stripped)
+            buffer = stripped
+            if not buffer:
+                continue
+            mode = "array" if buffer[0] == "[" else "ndjson"
+            if mode == "array":
+                buffer = buffer[1:]
+                offset += 1
+        if mode == "ndjson":
+            *lines, buffer = buffer.split("\n")
+            for line in lines:
+                offset += len(line) + 1
+                item = _parse_line(line)
+                if item is not _BLANK:
+                    yield item
+            if len(buffer) > max_item_chars:
+                raise MalformedBody(
+                    f"Line longer than {max_item_chars} characters", offset
+                )
+        else:
+            pos = 0
+            while True:
+                pos = _skip_separators(buffer, pos)
+                if pos == len(buffer) or buffer[pos] == "]":
+                    break
+                try:
+                    item, end = _decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    break
+                if end == len(buffer) and not isinstance(item, (str, dict, list)):
+                    # A bare number or literal may continue in the next chunk.
+                    break
+                pos = end
+                yield item
+            buffer = buffer[pos:]
+            offset += pos
+            if len(buffer.lstrip(_SEPARATORS)) > max_item_chars:
+                raise MalformedBody(
+                    f"Malformed or over {max_item_chars} characters long array item",
+                    offset + len(buffer) - len(buffer.lstrip(_SEPARATORS)),
+                )
+    buffer += _decode(utf8, b"", offset + len(buffer), final=True)
+    if mode == "ndjson":
+        item = _parse_line(buffer)
+        if item is not _BLANK:
+            yield item
+    elif mode == "array":
+        stripped = buffer.lstrip(_SEPARATORS)
+        offset += len(buffer) - len(stripped)
+        buffer = stripped
+        if buffer and buffer[0] != "]":
+            try:
+                item, end = _decoder.raw_decode(buffer)
+            except json.JSONDecodeError as e:
+                raise MalformedBody("Malformed JSON array item", offset + e.pos)
+            yield item
+            stripped = buffer[end:].lstrip(_SEPARATORS)
+            offset += len(buffer) - len(stripped)
+            buffer = stripped
+        if buffer.rstrip(_WHITESPACE) != "]":
+            raise MalformedBody("Malformed JSON array body", offset)
+
+
+def _decode(
+    utf8: codecs.IncrementalDecoder, chunk: bytes, position: int, final: bool = False
+) -> str:
+    try:
+        return utf8.decode(chunk, final)
+    except UnicodeDecodeError as e:
+        # `e.object` also holds the bytes of a character split across chunks.
+        valid = len(e.object[: e.start].decode("utf-8"))
+        raise MalformedBody("Body is not valid UTF-8", position + valid) from None
+
+
+def _skip_separators(buffer: str, pos: int) -> int:
+    while pos < len(buffer) and buffer[pos] in _SEPARATORS:
+        pos += 1
+    return pos
+
+
+def _parse_line(line: str) -> Any:
+    line = line.strip(_WHITESPACE)
+    if not line:
+        return _BLANK
+    try:
+        return json.loads(line)
+    except ValueError as e:
+        return e
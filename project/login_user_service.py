@@ -1,29 +1,38 @@
+import os
+
 import prisma
 import prisma.models
 from fastapi import HTTPException, status
-from jose import jwt
-from passlib.context import CryptContext
+from project.auth_tokens import encode_token
+from project.db import read
+from project.metrics import timed_query
+from project.password_hashing import PasswordHasherSaturated, password_hasher
+from project.refresh_tokens import refresh_token_store
+from project.single_flight import SingleFlight
 from pydantic import BaseModel
 
+# Seconds a looked-up user row may be reused by later logins for the same
+# email; 0 only shares lookups that are in flight at the same moment.
+LOGIN_USER_CACHE_SECONDS = float(os.getenv("LOGIN_USER_CACHE_SECONDS", "0"))
+
+user_lookups: SingleFlight[prisma.models.User | None] = SingleFlight(
+    "login_user", ttl=LOGIN_USER_CACHE_SECONDS
+)
+
 
 class LoginResponse(BaseModel):
     """
-    Response model for a successful login operation, returning a JWT token.
+    Response model for a successful login operation, returning a JWT token
+    and a single-use refresh token for /auth/refresh.
     """
 
     jwt_token: str
-
-
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-SECRET_KEY = "09d25e094faa6ca2556c818166b7a9563b93f7099f6f0f4caa6cf63b88e8d3e7"
-
-ALGORITHM = "HS256"
+    refresh_token: str
 
 
 async def verify_password(plain_password: str, hashed_password: str) -> bool:
     """
-    Verify a password against its hash.
+    Verify a password against its hash on the password hashing pool.
 
     Args:
         plain_password (str): Plaintext password to verify.
@@ -32,7 +41,7 @@ async def verify_password(plain_password: str, hashed_password: str) -> bool:
     Returns:
         bool: True if passwords match, false otherwise.
     """
-    return pwd_context.verify(plain_password, hashed_password)
+    return await password_hasher.verify(plain_password, hashed_password)
 
 
 async def authenticate_user(email: str, password: str) -> prisma.models.User | None:
@@ -46,7 +55,17 @@ async def authenticate_user(email: str, password: str) -> prisma.models.User | N
     Returns:
         prisma.models.User | None: The authenticated user or None if authentication failed.
     """
-    user = await prisma.models.User.prisma().find_unique(where={"email": email})
+    user = await user_lookups.do(
+        email,
+        lambda: timed_query(
+            "User.find_unique",
+            read(
+                lambda client: prisma.models.User.prisma(client).find_unique(
+                    where={"email": email}
+                )
+            ),
+        ),
+    )
     if not user:
         return None
     if not await verify_password(password, user.password):
@@ -56,7 +75,7 @@ async def authenticate_user(email: str, password: str) -> prisma.models.User | N
 
 async def create_access_token(data: dict) -> str:
     """
-    Create a JWT access token.
+    Create a JWT access token signed with the shared application key.
 
     Args:
         data (dict): The payload data to encode in the token.
@@ -64,8 +83,7 @@ async def create_access_token(data: dict) -> str:
     Returns:
         str: The encoded JWT token.
     """
-    encoded_jwt = jwt.encode(data, SECRET_KEY, algorithm=ALGORITHM)
-    return encoded_jwt
+    return encode_token(data)
 
 
 async def login_user(email: str, password: str) -> LoginResponse:
@@ -79,12 +97,21 @@ async def login_user(email: str, password: str) -> LoginResponse:
     Returns:
       LoginResponse: Response model for a successful login operation, returning a JWT token.
     """
-    user = await authenticate_user(email, password)
+    try:
+        user = await authenticate_user(email, password)
+    except PasswordHasherSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent logins, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Incorrect username or password",
             headers={"WWW-Authenticate": "Bearer"},
         )
-    access_token = await create_access_token(data={"sub": user.email})
-    return LoginResponse(jwt_token=access_token)
+    claims = {"sub": user.email, "uid": user.id, "role": user.role}
+    access_token = await create_access_token(data=claims)
+    refresh_token = await refresh_token_store.issue(user.id)
+    return LoginResponse(jwt_token=access_token, refresh_token=refresh_token)
@@ -0,0 +1,310 @@
+import os
+import time
+from bisect import bisect_left
+from typing import Any, Awaitable, Callable, Iterable, Iterator, TypeVar
+
+T = TypeVar("T")
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "1") == "1"
+
+LATENCY_BUCKETS = (
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+)
+
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+Sample = tuple[str, tuple[tuple[str, str], ...], float]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: tuple[tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    Base class for metrics kept in the module-level registry.
+
+    Every worker process aggregates into its own plain dicts. Updates happen
+    on the event loop thread only, so no locks are taken on the hot path;
+    `/metrics` reports the values of the worker that served the scrape.
+    """
+
+    kind = "untyped"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        self.name = name
+        self.help = help
+        self.labels = labels
+        registry.append(self)
+
+    def _label_pairs(self, values: tuple[str, ...]) -> tuple[tuple[str, str], ...]:
+        return tuple(zip(self.labels, values))
+
+    def samples(self) -> Iterator[Sample]:
+        raise NotImplementedError
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels: tuple[str, ...] = ()) -> None:
+        super().__init__(name, help, labels)
+        self._values: dict[tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) + amount
+
+    def samples(self) -> Iterator[Sample]:
+        for values, value in self._values.items():
+            yield self.name, self._label_pairs(values), value
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def dec(self, *label_values: str, amount: float = 1.0) -> None:
+        self._values[label_values] = self._values.get(label_values, 0.0) - amount
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labels: tuple[str, ...] = (),
+        buckets: tuple[float, ...] = LATENCY_BUCKETS,
+    ) -> None:
+        super().__init__(name, help, labels)
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self._series: dict[tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        series = self._series.get(label_values)
+        if series is None:
+            series = self._series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+        series[0][bisect_left(self.buckets, value)] += 1
+        series[1] += value
+
+    def samples(self) -> Iterator[Sample]:
+        for values, (counts, total) in self._series.items():
+            labels = self._label_pairs(values)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float("inf")), counts):
+                cumulative += count
+                yield (
+                    self.name + "_bucket",
+                    (*labels, ("le", _format_value(bound))),
+                    cumulative,
+                )
+            yield self.name + "_sum", labels, total
+            yield self.name + "_count", labels, cumulative
+
+
+class Callback(Metric):
+    """
+    A gauge or counter whose value is read from another component at scrape time.
+    """
+
+    def __init__(
+        self, name: str, help: str, read: Callable[[], float], kind: str = "gauge"
+    ) -> None:
+        super().__init__(name, help)
+        self.read = read
+        self.kind = kind
+
+    def samples(self) -> Iterator[Sample]:
+        yield self.name, (), self.read()
+
+
+registry: list[Metric] = []
+
+http_requests_total = Counter(
+    "http_requests_total",
+    "HTTP requests by method, route and status code.",
+    ("method", "route", "status"),
+)
+
+http_request_duration_seconds = Histogram(
+    "http_request_duration_seconds",
+    "Time from receiving a request until its response has been sent.",
+    ("method", "route"),
+)
+
+http_requests_in_flight = Gauge(
+    "http_requests_in_flight", "HTTP requests currently being handled."
+)
+
+db_query_duration_seconds = Histogram(
+    "db_query_duration_seconds",
+    "Prisma query latency by model and operation.",
+    ("query",),
+)
+
+db_query_rows = Histogram(
+    "db_query_rows",
+    "Rows returned or affected per Prisma query.",
+    ("query",),
+    buckets=ROW_BUCKETS,
+)
+
+db_query_errors_total = Counter(
+    "db_query_errors_total", "Prisma queries that raised an error.", ("query",)
+)
+
+single_flight_calls_total = Counter(
+    "single_flight_calls_total",
+    "Coalesced reads by group and whether they ran the query, shared an in-flight one or hit the micro-cache.",
+    ("group", "outcome"),
+)
+
+token_refresh_duration_seconds = Histogram(
+    "token_refresh_duration_seconds",
+    "Refresh token rotation latency by outcome.",
+    ("outcome",),
+)
+
+
+def render() -> str:
+    """
+    Render every registered metric in the Prometheus text exposition format.
+
+    Returns:
+        str: The exposition text, ending with a newline.
+    """
+    return "".join(
+        render_family(metric.name, metric.kind, metric.help, metric.samples())
+        for metric in registry
+    )
+
+
+def render_family(name: str, kind: str, help: str, samples: Iterable[Sample]) -> str:
+    """
+    Render one metric family in the Prometheus text exposition format.
+
+    Args:
+        name (str): The metric family name.
+        kind (str): "counter", "gauge", "histogram" or "untyped".
+        help (str): One-line description.
+        samples (Iterable[Sample]): (sample name, label pairs, value) tuples.
+
+    Returns:
+        str: The exposition text, ending with a newline.
+    """
+    help = help.replace("\\", "\\\\").replace("\n", "\\n")
+    lines = [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+    for sample_name, labels, value in samples:
+        lines.append(f"{sample_name}{_format_labels(labels)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def _row_count(result: Any) -> int:
+    if isinstance(result, list):
+        return len(result)
+    if isinstance(result, int):
+        return result
+    return int(result is not None)
+
+
+async def timed_query(query: str, awaitable: Awaitable[T]) -> T:
+    """
+    Await a Prisma call, recording its latency and the number of rows it returned.
+
+    Args:
+        query (str): Metric label naming the call, e.g. "Joke.find_many".
+        awaitable (Awaitable[T]): The pending Prisma call.
+
+    Returns:
+        T: The result of the call.
+    """
+    if not METRICS_ENABLED:
+        return await awaitable
+    started = time.perf_counter()
+    try:
+        result = await awaitable
+    except Exception:
+        db_query_errors_total.inc(query)
+        raise
+    finally:
+        db_query_duration_seconds.observe(time.perf_counter() - started, query)
+    db_query_rows.observe(_row_count(result), query)
+    return result
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording request counts, latency and in-flight requests.
+
+    Requests are labelled with the path template of the route that handled
+    them, or "unmatched" when no route did, so label cardinality stays bounded.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self._route_paths: dict[Callable, str] = {}
+
+    def _route(self, scope: dict) -> str:
+        endpoint = scope.get("endpoint")
+        if endpoint is None:
+            return "unmatched"
+        path = self._route_paths.get(endpoint)
+        if path is None:
+            path = "unmatched"
+            for route in scope["app"].routes:
+                if getattr(route, "endpoint", None) is endpoint:
+                    path = route.path
+                    break
+            self._route_paths[endpoint] = path
+        return path
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        status = 500
+
+        async def send_with_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        http_requests_in_flight.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            http_requests_in_flight.dec()
+            method = scope["method"]
+            route = self._route(scope)
+            http_request_duration_seconds.observe(elapsed, method, route)
+            http_requests_total.inc(method, route, str(status))
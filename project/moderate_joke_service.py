@@ -1,8 +1,29 @@
+import base64
+import os
+from datetime import datetime
 from enum import Enum
+from typing import Optional
 
 import prisma
 import prisma.models
-from pydantic import BaseModel
+from fastapi import HTTPException, status
+from project.duplicate_index import DUPLICATE_CHECK_ENABLED, duplicate_index
+from project.db import read
+from project.joke_events import joke_broadcaster
+from project.joke_pool import approved_joke_pool
+from project.metrics import timed_query
+from project.single_flight import SingleFlight
+from pydantic import BaseModel, Field
+
+MODERATION_BATCH_MAX_IDS = 1000
+
+# Seconds a moderation queue page may be served to other moderators asking
+# for the same page; 0 only shares requests that overlap.
+MODERATION_QUEUE_CACHE_SECONDS = float(os.getenv("MODERATION_QUEUE_CACHE_SECONDS", "0"))
+
+queue_pages: SingleFlight[list[prisma.models.Joke]] = SingleFlight(
+    "moderation_queue", ttl=MODERATION_QUEUE_CACHE_SECONDS
+)
 
 
 class JokeStatus(Enum):
@@ -10,9 +31,9 @@ class JokeStatus(Enum):
     An enum that describes the possible statuses for a dad joke in the moderation process.
     """
 
-    APPROVED: str
-    REJECTED: str
-    PENDING: str
+    APPROVED = "APPROVED"
+    REJECTED = "REJECTED"
+    PENDING = "PENDING"
 
 
 class ModerateJokeResponse(BaseModel):
@@ -25,10 +46,77 @@ class ModerateJokeResponse(BaseModel):
     new_status: str
 
 
+class ModerateJokesBatchRequest(BaseModel):
+    """
+    Request model for applying one moderation status to many dad jokes at once.
+    """
+
+    joke_ids: list[str] = Field(..., min_items=1, max_items=MODERATION_BATCH_MAX_IDS)
+    new_status: JokeStatus
+
+
+class ModerateJokesBatchResponse(BaseModel):
+    """
+    Model for response data after moderating a batch of dad jokes, including the ids that did not exist.
+    """
+
+    updated: int
+    new_status: str
+    missing_ids: list[str]
+
+
+class ModerationQueueItem(BaseModel):
+    """
+    A pending dad joke awaiting moderation.
+    """
+
+    id: str
+    content: str
+    submitted_by: str
+    created_at: datetime
+
+
+class ModerationQueueResponse(BaseModel):
+    """
+    One page of the moderation queue, oldest first. Pass `next_cursor` back to fetch the following page.
+    """
+
+    jokes: list[ModerationQueueItem]
+    next_cursor: Optional[str] = None
+
+
+def encode_queue_cursor(created_at: datetime, joke_id: str) -> str:
+    """
+    Encode a (createdAt, id) keyset position as an opaque cursor string.
+    """
+    raw = f"{created_at.isoformat()}|{joke_id}".encode()
+    return base64.urlsafe_b64encode(raw).decode()
+
+
+def decode_queue_cursor(cursor: str) -> tuple[datetime, str]:
+    """
+    Decode a cursor produced by encode_queue_cursor.
+
+    Raises:
+        ValueError: If the cursor is malformed.
+    """
+    try:
+        created_at, _, joke_id = (
+            base64.urlsafe_b64decode(cursor).decode().partition("|")
+        )
+        return datetime.fromisoformat(created_at), joke_id
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError("Invalid moderation queue cursor.")
+
+
 async def moderate_joke(joke_id: str, new_status: JokeStatus) -> ModerateJokeResponse:
     """
     Moderate a submitted dad joke.
 
+    The status is only written if it differs, so that exactly one request
+    sees the transition and updates the pool and publishes the approval;
+    setting a joke to the status it already has changes nothing.
+
     Args:
     joke_id (str): The unique identifier for the dad joke being moderated.
     new_status (JokeStatus): The new moderation status of the dad joke, which can be either 'APPROVED', 'REJECTED', or 'PENDING'.
@@ -36,10 +124,30 @@ async def moderate_joke(joke_id: str, new_status: JokeStatus) -> ModerateJokeRes
     Returns:
     ModerateJokeResponse: Model for response data after moderating a dad joke, indicating the result of the moderation.
     """
-    updated_joke = await prisma.models.Joke.prisma().update(
-        where={"id": joke_id}, data={"status": new_status.name}
+    changed = await timed_query(
+        "Joke.update_many",
+        prisma.models.Joke.prisma().update_many(
+            where={"id": joke_id, "status": {"not": new_status.name}},
+            data={"status": new_status.name},
+        ),
+    )
+    updated_joke = await timed_query(
+        "Joke.find_unique",
+        prisma.models.Joke.prisma().find_unique(where={"id": joke_id}),
     )
     if updated_joke:
+        if changed:
+            queue_pages.clear()
+            # Announced before the pool sees it; see publish_approved.
+            if new_status is JokeStatus.APPROVED:
+                joke_broadcaster.publish_approved(updated_joke.id, updated_joke.content)
+            approved_joke_pool.apply_status(
+                updated_joke.id, updated_joke.content, new_status.name
+            )
+            if DUPLICATE_CHECK_ENABLED:
+                duplicate_index.apply_status(
+                    updated_joke.id, updated_joke.content, new_status.name
+                )
         return ModerateJokeResponse(
             message="Dad joke has been successfully moderated.",
             moderated_joke_id=updated_joke.id,
@@ -51,3 +159,114 @@ async def moderate_joke(joke_id: str, new_status: JokeStatus) -> ModerateJokeRes
             moderated_joke_id=joke_id,
             new_status="FAILURE",
         )
+
+
+async def get_moderation_queue(
+    limit: int, cursor: Optional[str] = None
+) -> ModerationQueueResponse:
+    """
+    List pending dad jokes using keyset pagination on (createdAt, id).
+
+    Each page is a single index range scan on (status, createdAt, id), so
+    deep pages cost the same as the first one. Runs on the read replica when
+    one is configured, so a just-submitted joke may appear a moment later.
+
+    Args:
+        limit (int): Maximum number of jokes on the page.
+        cursor (Optional[str]): The `next_cursor` of the previous page, or None for the first page.
+
+    Returns:
+        ModerationQueueResponse: One page of the moderation queue, oldest first.
+
+    Raises:
+        HTTPException: 400 if the cursor is malformed.
+    """
+    where: dict = {"status": "PENDING"}
+    if cursor is not None:
+        try:
+            created_at, joke_id = decode_queue_cursor(cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        where["OR"] = [
+            {"createdAt": {"gt": created_at}},
+            {"createdAt": created_at, "id": {"gt": joke_id}},
+        ]
+    jokes = await queue_pages.do(
+        (limit, cursor),
+        lambda: timed_query(
+            "Joke.find_many",
+            read(
+                lambda client: prisma.models.Joke.prisma(client).find_many(
+                    where=where,
+                    order=[{"createdAt": "asc"}, {"id": "asc"}],
+                    take=limit,
+                )
+            ),
+        ),
+    )
+    next_cursor = None
+    if len(jokes) == limit:
+        next_cursor = encode_queue_cursor(jokes[-1].createdAt, jokes[-1].id)
+    return ModerationQueueResponse(
+        jokes=[
+            ModerationQueueItem(
+                id=joke.id,
+                content=joke.content,
+                submitted_by=joke.submittedBy,
+                created_at=joke.createdAt,
+            )
+            for joke in jokes
+        ],
+        next_cursor=next_cursor,
+    )
+
+
+async def moderate_jokes_batch(
+    joke_ids: list[str], new_status: JokeStatus
+) -> ModerateJokesBatchResponse:
+    """
+    Apply one moderation status to many dad jokes in a single transaction.
+
+    Only jokes whose status actually changes update the pool and publish
+    an approval.
+
+    Args:
+        joke_ids (list[str]): The unique identifiers of the dad jokes being moderated.
+        new_status (JokeStatus): The new moderation status for all of them.
+
+    Returns:
+        ModerateJokesBatchResponse: Model for response data after moderating a batch of dad jokes, including the ids that did not exist.
+    """
+    joke_ids = list(dict.fromkeys(joke_ids))
+    async with prisma.get_client().tx() as transaction:
+        found = await timed_query(
+            "Joke.find_many",
+            prisma.models.Joke.prisma(transaction).find_many(
+                where={"id": {"in": joke_ids}}
+            ),
+        )
+        updated = 0
+        if found:
+            updated = await timed_query(
+                "Joke.update_many",
+                prisma.models.Joke.prisma(transaction).update_many(
+                    where={"id": {"in": [joke.id for joke in found]}},
+                    data={"status": new_status.name},
+                ),
+            )
+    if found:
+        queue_pages.clear()
+    for joke in found:
+        if joke.status == new_status.name:
+            continue
+        if new_status is JokeStatus.APPROVED:
+            joke_broadcaster.publish_approved(joke.id, joke.content)
+        approved_joke_pool.apply_status(joke.id, joke.content, new_status.name)
+        if DUPLICATE_CHECK_ENABLED:
+            duplicate_index.apply_status(joke.id, joke.content, new_status.name)
+    found_ids = {joke.id for joke in found}
+    return ModerateJokesBatchResponse(
+        updated=updated,
+        new_status=new_status.name,
+        missing_ids=[joke_id for joke_id in joke_ids if joke_id not in found_ids],
+    )
@@ -0,0 +1,142 @@
+"""
+Cross-worker messages over Postgres NOTIFY / LISTEN.
+
+`notify` publishes a JSON message on a channel through the Prisma client.
+Every worker runs one `notification_listener`, which LISTENs on all
+subscribed channels over a single asyncpg connection (the Prisma client
+cannot LISTEN) and hands each message from another worker to the
+channel's handler. Notifications sent while a worker is not listening are
+lost, so subscribers may also register a callback that runs on every
+(re)connect to resynchronize.
+"""
+
+import asyncio
+import json
+import logging
+import uuid
+from typing import Any, Callable, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import prisma
+from project.db import DATABASE_URL
+from project.metrics import timed_query
+
+logger = logging.getLogger(__name__)
+
+_RECONNECT_SECONDS = 5.0
+
+_HEARTBEAT_SECONDS = 30.0
+
+# Identifies this worker's own notifications, which it has already applied.
+ORIGIN = uuid.uuid4().hex
+
+
+async def notify(channel: str, message: dict[str, Any]) -> None:
+    """
+    Publish a message to the other workers.
+
+    Args:
+        channel (str): The channel to NOTIFY on.
+        message (dict[str, Any]): JSON-serializable message; the encoded form must stay under Postgres' 8000 byte payload limit.
+
+    Raises:
+        Exception: Whatever the database raised; callers decide whether a lost message matters.
+    """
+    payload = json.dumps({**message, "origin": ORIGIN})
+    await timed_query(
+        "pg_notify",
+        prisma.get_client().execute_raw("SELECT pg_notify($1, $2)", channel, payload),
+    )
+
+
+def listener_dsn(url: str) -> str:
+    """
+    Strip the Prisma-only query parameters asyncpg does not understand.
+    """
+    parts = urlsplit(url)
+    query = [(key, value) for key, value in parse_qsl(parts.query) if key == "sslmode"]
+    return urlunsplit(parts._replace(query=urlencode(query)))
+
+
+class NotificationListener:
+    """
+    Delivers other workers' notifications to per-channel handlers, on a dedicated connection.
+    """
+
+    def __init__(self) -> None:
+        self.listening = False
+        self._handlers: dict[str, Callable[[dict[str, Any]], None]] = {}
+        self._on_connect: list[Callable[[], None]] = []
+
+    def subscribe(
+        self,
+        channel: str,
+        handler: Callable[[dict[str, Any]], None],
+        on_connect: Optional[Callable[[], None]] = None,
+    ) -> None:
+        """
+        Register the handler of a channel; call before `listen_forever` starts.
+
+        Args:
+            channel (str): The channel to LISTEN on.
+            handler (Callable[[dict[str, Any]], None]): Called with each decoded message from another worker.
+            on_connect (Optional[Callable[[], None]]): Called whenever listening (re)starts, since messages sent in between are lost.
+        """
+        self._handlers[channel] = handler
+        if on_connect is not None:
+            self._on_connect.append(on_connect)
+
+    def _on_notify(self, connection: Any, pid: int, channel: str, payload: str) -> None:
+        try:
+            message = json.loads(payload)
+        except ValueError:
+            logger.warning(
+                "Ignoring malformed notification on %s: %r", channel, payload
+            )
+            return
+        if message.get("origin") == ORIGIN:
+            return
+        handler = self._handlers.get(channel)
+        if handler is None:
+            return
+        try:
+            handler(message)
+        except Exception:
+            logger.exception("Handling a notification on %s failed", channel)
+
+    async def listen_forever(self) -> None:
+        if not DATABASE_URL:
+            logger.info(
+                "No DATABASE_URL to listen on; other workers' changes are only "
+                "seen through each subsystem's own refresh"
+            )
+            return
+        # Imported here, like the other optional subsystems' heavy
+        # dependencies, so that workers that never listen do not pay for it.
+        import asyncpg
+
+        while True:
+            try:
+                connection = await asyncpg.connect(listener_dsn(DATABASE_URL))
+                try:
+                    for channel in self._handlers:
+                        await connection.add_listener(channel, self._on_notify)
+                    for callback in self._on_connect:
+                        callback()
+                    self.listening = True
+                    # Also notices a dead connection, which asyncpg would not
+                    # report while it only waits for notifications.
+                    while True:
+                        await asyncio.sleep(_HEARTBEAT_SECONDS)
+                        await connection.execute("SELECT 1")
+                finally:
+                    self.listening = False
+                    await connection.close()
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Notification listener failed; reconnecting")
+            await asyncio.sleep(_RECONNECT_SECONDS)
+
+
+notification_listener = NotificationListener()
@@ -0,0 +1,161 @@
+import asyncio
+import functools
+import os
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable
+
+PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+
+PASSWORD_HASH_WORKERS = int(
+    os.getenv("PASSWORD_HASH_WORKERS", str(min(4, os.cpu_count() or 1)))
+)
+
+PASSWORD_HASH_MAX_QUEUE = int(os.getenv("PASSWORD_HASH_MAX_QUEUE", "32"))
+
+# Bulk imports hash on their own process pool so they never queue behind,
+# or in front of, interactive logins.
+PASSWORD_IMPORT_WORKERS = int(
+    os.getenv("PASSWORD_IMPORT_WORKERS", str(os.cpu_count() or 1))
+)
+
+
+class PasswordHasherSaturated(Exception):
+    """
+    Raised when every hashing worker is busy and the wait queue is full.
+    """
+
+
+@functools.lru_cache(maxsize=None)
+def pwd_context() -> Any:
+    # passlib is imported on first use, in a hashing worker, rather than
+    # when a web worker starts.
+    from passlib.context import CryptContext
+
+    return CryptContext(schemes=["bcrypt"], deprecated="auto")
+
+
+def _hash(plain_password: str) -> str:
+    return pwd_context().hash(plain_password)
+
+
+def _hash_all(plain_passwords: list[str]) -> list[str]:
+    context = pwd_context()
+    return [context.hash(plain_password) for plain_password in plain_passwords]
+
+
+def _verify(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context().verify(plain_password, hashed_password)
+
+
+class PasswordHasher:
+    """
+    Runs bcrypt hashing and verification off the event loop.
+
+    At most `workers` operations run at once; up to `max_queue` more may wait
+    for a worker. Anything beyond that is rejected immediately with
+    PasswordHasherSaturated so a login burst cannot build an unbounded
+    backlog.
+    """
+
+    def __init__(
+        self,
+        workers: int = PASSWORD_HASH_WORKERS,
+        max_queue: int = PASSWORD_HASH_MAX_QUEUE,
+        executor: str = PASSWORD_HASH_EXECUTOR,
+    ) -> None:
+        self.workers = workers
+        self.max_queue = max_queue
+        self.executor_kind = executor
+        self.pending = 0
+        self.rejected = 0
+        self._executor: Executor | None = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    async def _run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.workers + self.max_queue:
+            self.rejected += 1
+            raise PasswordHasherSaturated("Password hashing pool is saturated")
+        self.pending += 1
+        try:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._get_executor(), fn, *args)
+        finally:
+            self.pending -= 1
+
+    async def hash(self, plain_password: str) -> str:
+        """
+        Hash a password with bcrypt.
+
+        Args:
+            plain_password (str): Plaintext password to hash.
+
+        Returns:
+            str: The bcrypt hash.
+        """
+        return await self._run(_hash, plain_password)
+
+    async def hash_many(self, plain_passwords: list[str]) -> list[str]:
+        """
+        Hash many passwords, spread evenly over the workers.
+
+        The passwords are sent as one slice per worker rather than one task
+        each, so a process pool pays the pickling round-trip once per slice.
+        Not subject to `max_queue`: callers are expected to bound the batch.
+
+        Args:
+            plain_passwords (list[str]): Plaintext passwords to hash.
+
+        Returns:
+            list[str]: The bcrypt hashes, in the same order.
+        """
+        if not plain_passwords:
+            return []
+        size = -(-len(plain_passwords) // min(self.workers, len(plain_passwords)))
+        slices = [
+            plain_passwords[start : start + size]
+            for start in range(0, len(plain_passwords), size)
+        ]
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        self.pending += len(slices)
+        try:
+            hashed = await asyncio.gather(
+                *(loop.run_in_executor(executor, _hash_all, part) for part in slices)
+            )
+        finally:
+            self.pending -= len(slices)
+        return [value for part in hashed for value in part]
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """
+        Verify a password against its bcrypt hash.
+
+        Args:
+            plain_password (str): Plaintext password to verify.
+            hashed_password (str): Hashed password for comparison.
+
+        Returns:
+            bool: True if passwords match, false otherwise.
+        """
+        return await self._run(_verify, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+password_hasher = PasswordHasher()
+
+import_password_hasher = PasswordHasher(
+    workers=PASSWORD_IMPORT_WORKERS, max_queue=0, executor="process"
+)
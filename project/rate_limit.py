@@ -0,0 +1,264 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+import prisma
+import prisma.models
+from project.metrics import timed_query
+
+logger = logging.getLogger(__name__)
+
+# Comma separated "path-prefix=capacity/seconds" rules; the longest matching
+# prefix wins and "*" is the fallback for everything else.
+RATE_LIMITS = os.getenv(
+    "RATE_LIMITS",
+    "/auth/login=10/60,/auth/=30/60,/users/register=10/60,"
+    "/jokes/submit=30/60,/jokes/random=600/60,*=300/60",
+)
+
+RATE_LIMIT_FLUSH_SECONDS = float(os.getenv("RATE_LIMIT_FLUSH_SECONDS", "5"))
+
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "1") != "0"
+
+# Buckets kept in memory per worker; beyond this the least recently
+# created ones are dropped, so a flood of distinct callers cannot grow it.
+RATE_LIMIT_MAX_BUCKETS = int(os.getenv("RATE_LIMIT_MAX_BUCKETS", "100000"))
+
+# Adds each bucket's spending since the last flush to its shared row in one
+# statement. A row's resetAt is when the bucket is full again, so spending n
+# tokens moves it n / rate seconds later, starting from now if it was full;
+# concurrent flushes from several workers add up instead of overwriting
+# each other.
+_SPEND_SQL = """
+INSERT INTO "RateLimit" ("id", "identifier", "points", "resetAt")
+SELECT gen_random_uuid()::text, spent.identifier, spent.points,
+       $4::timestamp + spent.seconds * interval '1 second'
+FROM unnest($1::text[], $2::float8[], $3::int[]) AS spent(identifier, seconds, points)
+ON CONFLICT ("identifier") DO UPDATE
+SET "points" = "RateLimit"."points" + EXCLUDED."points",
+    "resetAt" = GREATEST("RateLimit"."resetAt", $4::timestamp)
+                + (EXCLUDED."resetAt" - $4::timestamp)
+RETURNING "id", "identifier", "points", "resetAt"
+"""
+
+
+def _as_utc(value: datetime) -> datetime:
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+class RateLimitRule:
+    """
+    A token bucket shape: `capacity` requests, refilled evenly over `period` seconds.
+    """
+
+    __slots__ = ("prefix", "capacity", "rate")
+
+    def __init__(self, prefix: str, capacity: int, period: float) -> None:
+        self.prefix = prefix
+        self.capacity = capacity
+        self.rate = capacity / period
+
+
+def parse_rules(spec: str) -> list[RateLimitRule]:
+    """
+    Parse a RATE_LIMITS specification into rules, longest prefix first.
+
+    Args:
+        spec (str): Comma separated "prefix=capacity/seconds" entries.
+
+    Returns:
+        list[RateLimitRule]: The parsed rules.
+    """
+    rules = []
+    for entry in filter(None, (part.strip() for part in spec.split(","))):
+        prefix, _, shape = entry.partition("=")
+        capacity, _, period = shape.partition("/")
+        rules.append(RateLimitRule(prefix.strip(), int(capacity), float(period)))
+    rules.sort(key=lambda rule: (rule.prefix == "*", -len(rule.prefix)))
+    return rules
+
+
+class _Bucket:
+    __slots__ = ("tokens", "updated", "spent")
+
+    def __init__(self, tokens: float, updated: float) -> None:
+        self.tokens = tokens
+        self.updated = updated
+        # Tokens taken here that are not in the shared row yet.
+        self.spent = 0
+
+
+class RateLimiter:
+    """
+    In-memory token buckets keyed by route rule and caller identifier.
+
+    `hit` never touches the database. `flush` adds what each bucket spent
+    since the last flush to its shared RateLimit row and takes the row's
+    balance, which includes every worker's spending, as the new local one.
+    Limits are therefore shared by all workers (overshooting by at most
+    what they spend between two flushes) and survive restarts.
+    """
+
+    def __init__(
+        self, rules: list[RateLimitRule], max_buckets: int = RATE_LIMIT_MAX_BUCKETS
+    ) -> None:
+        self.rules = rules
+        self.max_buckets = max_buckets
+        self.evicted = 0
+        self._buckets: dict[str, _Bucket] = {}
+        self._rules_by_key: dict[str, RateLimitRule] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def rule_for(self, path: str) -> RateLimitRule | None:
+        for rule in self.rules:
+            if rule.prefix == "*" or path.startswith(rule.prefix):
+                return rule
+        return None
+
+    def hit(self, path: str, identifier: str) -> float:
+        """
+        Consume one token for `identifier` on the rule matching `path`.
+
+        Args:
+            path (str): The request path.
+            identifier (str): Who is calling, e.g. "ip:1.2.3.4" or "token:<digest>".
+
+        Returns:
+            float: 0 if the request is allowed, otherwise seconds until a token is available.
+        """
+        rule = self.rule_for(path)
+        if rule is None:
+            return 0.0
+        key = f"{rule.prefix}|{identifier}"
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_buckets:
+                oldest = next(iter(self._buckets))
+                del self._buckets[oldest]
+                self._rules_by_key.pop(oldest, None)
+                self.evicted += 1
+            bucket = self._buckets[key] = _Bucket(rule.capacity, now)
+            self._rules_by_key[key] = rule
+        else:
+            bucket.tokens = min(
+                rule.capacity, bucket.tokens + (now - bucket.updated) * rule.rate
+            )
+            bucket.updated = now
+        if bucket.tokens < 1:
+            return (1 - bucket.tokens) / rule.rate
+        bucket.tokens -= 1
+        bucket.spent += 1
+        return 0.0
+
+    def _rule_for_key(self, key: str) -> RateLimitRule | None:
+        return self._rules_by_key.get(key) or self.rule_for(key.partition("|")[0])
+
+    def _shared_tokens(
+        self, row: prisma.models.RateLimit, rule: RateLimitRule, wall: datetime
+    ) -> float:
+        remaining = (_as_utc(row.resetAt) - wall).total_seconds()
+        return min(rule.capacity, max(0.0, rule.capacity - remaining * rule.rate))
+
+    def _adopt(self, row: prisma.models.RateLimit, now: float, wall: datetime) -> None:
+        rule = self._rule_for_key(row.identifier)
+        if rule is None:
+            return
+        tokens = self._shared_tokens(row, rule, wall)
+        if tokens >= rule.capacity:
+            return
+        if row.identifier not in self._buckets:
+            if len(self._buckets) >= self.max_buckets:
+                return
+            self._rules_by_key[row.identifier] = rule
+        self._buckets[row.identifier] = _Bucket(tokens, now)
+
+    async def load(self) -> None:
+        """
+        Restore buckets that have not fully refilled from the RateLimit table.
+        """
+        wall = datetime.now(timezone.utc)
+        rows = await timed_query(
+            "RateLimit.find_many",
+            prisma.models.RateLimit.prisma().find_many(where={"resetAt": {"gt": wall}}),
+        )
+        now = time.monotonic()
+        for row in rows:
+            self._adopt(row, now, wall)
+        logger.info("Restored %d rate limit buckets", len(rows))
+
+    async def flush(self) -> None:
+        """
+        Add each bucket's recent spending to the RateLimit table in one statement.
+
+        Each bucket then continues from the shared balance, minus whatever it
+        spent while the statement ran. Idle buckets that have fully refilled
+        are dropped from memory. If the write fails the spending is kept
+        for the next flush.
+        """
+        now = time.monotonic()
+        wall = datetime.now(timezone.utc)
+        spent: dict[str, int] = {}
+        for key, bucket in list(self._buckets.items()):
+            rule = self._rule_for_key(key)
+            if rule is None:
+                continue
+            bucket.tokens = min(
+                rule.capacity, bucket.tokens + (now - bucket.updated) * rule.rate
+            )
+            bucket.updated = now
+            if bucket.spent:
+                spent[key] = bucket.spent
+                bucket.spent = 0
+            elif bucket.tokens >= rule.capacity:
+                del self._buckets[key]
+                self._rules_by_key.pop(key, None)
+        if not spent:
+            return
+        keys = list(spent)
+        try:
+            rows = await timed_query(
+                "RateLimit.query_raw",
+                prisma.models.RateLimit.prisma().query_raw(
+                    _SPEND_SQL,
+                    keys,
+                    [spent[key] / self._rule_for_key(key).rate for key in keys],
+                    [spent[key] for key in keys],
+                    wall.replace(tzinfo=None),
+                ),
+            )
+        except Exception:
+            for key, count in spent.items():
+                bucket = self._buckets.get(key)
+                if bucket is not None:
+                    bucket.spent += count
+            raise
+        now = time.monotonic()
+        for row in rows:
+            bucket = self._buckets.get(row.identifier)
+            rule = self._rule_for_key(row.identifier)
+            if bucket is None or rule is None:
+                continue
+            bucket.tokens = self._shared_tokens(row, rule, wall) - bucket.spent
+            bucket.updated = now
+
+    async def flush_forever(self, interval: float = RATE_LIMIT_FLUSH_SECONDS) -> None:
+        """
+        Flush bucket state every `interval` seconds until cancelled.
+
+        Args:
+            interval (float): Seconds to wait between flushes.
+        """
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.flush()
+            except Exception:
+                logger.exception("Rate limit flush failed")
+
+
+rate_limiter = RateLimiter(parse_rules(RATE_LIMITS))
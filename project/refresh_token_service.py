@@ -1,51 +1,67 @@
-from datetime import datetime, timedelta
-
-from jose import JWTError, jwt
+import prisma
+import prisma.models
+from fastapi import HTTPException, status
+from jose import JWTError
+from project.auth_tokens import ACCESS_TOKEN_EXPIRE_MINUTES, decode_token, encode_token
+from project.metrics import timed_query
+from project.refresh_tokens import RefreshTokenRejected, refresh_token_store
 from pydantic import BaseModel
 
 
 class RefreshTokenResponse(BaseModel):
     """
-    Response model for successfully refreshing a user's authentication token. Contains a new JWT for the user.
+    Response model for successfully refreshing a user's authentication token. Contains a new JWT for the user
+    and the refresh token to use next time; the one presented is no longer valid.
     """
 
     access_token: str
+    refresh_token: str
     token_type: str
     expires_in: int
 
 
-SECRET_KEY = "your_secret_key_here"
-
-ALGORITHM = "HS256"
-
-ACCESS_TOKEN_EXPIRE_MINUTES = 30
-
-
 async def refresh_token(refresh_token: str) -> RefreshTokenResponse:
     """
-    Refresh JWT token for authenticated users.
+    Refresh JWT token for authenticated users, rotating the refresh token.
 
     Args:
         refresh_token (str): The valid refresh token provided by the user to obtain a new JWT.
 
     Returns:
         RefreshTokenResponse: Response model for successfully refreshing a user's authentication token. Contains a new JWT for the user.
+
+    Raises:
+        HTTPException: 401 if the refresh token is invalid, expired, revoked or was already used.
     """
     try:
-        payload = jwt.decode(refresh_token, SECRET_KEY, algorithms=[ALGORITHM])
-        if "sub" not in payload:
-            raise Exception("Subject (sub) not found in the token payload.")
-        user_id = payload.get("sub")
-        access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
-        new_access_token = jwt.encode(
-            {"sub": user_id, "exp": datetime.utcnow() + access_token_expires},
-            SECRET_KEY,
-            algorithm=ALGORITHM,
+        payload = decode_token(refresh_token)
+        new_refresh_token = await refresh_token_store.rotate(payload)
+    except (JWTError, RefreshTokenRejected):
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token.",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-        return RefreshTokenResponse(
-            access_token=new_access_token,
-            token_type="Bearer",
-            expires_in=int(access_token_expires.total_seconds()),
+    # The access token carries the user's current email and role, not the
+    # ones they had when the refresh token family was first issued.
+    user = await timed_query(
+        "User.find_unique",
+        prisma.models.User.prisma().find_unique(where={"id": payload["uid"]}),
+    )
+    if user is None:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Invalid refresh token.",
+            headers={"WWW-Authenticate": "Bearer"},
         )
-    except JWTError:
-        raise Exception("Invalid refresh token.")
+    claims = {
+        "sub": user.email,
+        "uid": user.id,
+        "role": str(getattr(user.role, "value", user.role)),
+    }
+    return RefreshTokenResponse(
+        access_token=encode_token(claims),
+        refresh_token=new_refresh_token,
+        token_type="Bearer",
+        expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
+    )
@@ -0,0 +1,354 @@
+import asyncio
+import hashlib
+import logging
+import math
+import os
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any
+from uuid import uuid4
+
+import prisma
+import prisma.models
+from project.auth_tokens import encode_token
+from project.metrics import METRICS_ENABLED, timed_query, token_refresh_duration_seconds
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+REFRESH_TOKEN_EXPIRE_DAYS = int(os.getenv("REFRESH_TOKEN_EXPIRE_DAYS", "30"))
+
+REVOKED_TOKEN_FILTER_CAPACITY = int(
+    os.getenv("REVOKED_TOKEN_FILTER_CAPACITY", "100000")
+)
+
+REVOKED_TOKEN_FILTER_FP_RATE = float(os.getenv("REVOKED_TOKEN_FILTER_FP_RATE", "0.001"))
+
+# How often revocations made by other workers are folded into the filter.
+REVOKED_TOKEN_SYNC_SECONDS = float(os.getenv("REVOKED_TOKEN_SYNC_SECONDS", "5"))
+
+_LOAD_PAGE_SIZE = 5000
+
+
+class BloomFilter:
+    """
+    A fixed-size Bloom filter over byte strings.
+
+    Sized for `capacity` items at `fp_rate`; positions come from one
+    blake2b digest split into two halves (Kirsch-Mitzenmacher double
+    hashing), so an add or lookup costs a single hash.
+    """
+
+    def __init__(self, capacity: int, fp_rate: float) -> None:
+        self.capacity = capacity
+        self.bits = max(
+            64, math.ceil(-capacity * math.log(fp_rate) / (math.log(2) ** 2))
+        )
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.count = 0
+        self._array = bytearray((self.bits + 7) // 8)
+
+    def _positions(self, key: bytes) -> list[int]:
+        digest = hashlib.blake2b(key, digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        return [(first + i * second) % self.bits for i in range(self.hashes)]
+
+    def add(self, key: bytes) -> None:
+        for position in self._positions(key):
+            self._array[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: bytes) -> bool:
+        return all(
+            self._array[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self._array)
+
+    def estimated_fp_rate(self) -> float:
+        """
+        False-positive probability at the current fill, (1 - e^(-kn/m))^k.
+        """
+        return (1 - math.exp(-self.hashes * self.count / self.bits)) ** self.hashes
+
+
+class RefreshTokenStats(BaseModel):
+    """
+    Revocation filter state and refresh outcomes for this worker.
+    """
+
+    filter_items: int
+    filter_capacity: int
+    filter_bits: int
+    filter_hashes: int
+    filter_memory_bytes: int
+    estimated_fp_rate: float
+    filter_hits: int
+    filter_false_positives: int
+    observed_fp_rate: float
+    refreshes: int
+    rejected: int
+    reuse_detected: int
+    avg_refresh_ms: float
+    max_refresh_ms: float
+
+
+class RefreshTokenRejected(Exception):
+    """
+    Raised when a refresh token is unknown, expired, revoked or already used.
+    """
+
+
+class RefreshTokenStore:
+    """
+    Issues and rotates refresh tokens persisted as AuthToken rows.
+
+    Each refresh token carries a `jti` stored in `AuthToken.token`. Using a
+    token revokes its row and issues a new one. Presenting a revoked token
+    again is treated as theft and revokes every live token of the user.
+
+    Revoked ids are mirrored in a Bloom filter, which only decides when
+    reuse gets investigated: a hit reads the row first and, for a revoked
+    token, revokes the family without attempting the rotation. A miss saves
+    no round-trip, because every rotation still needs the conditional
+    revoke (the authoritative check) and the insert of its successor.
+    """
+
+    def __init__(
+        self,
+        capacity: int = REVOKED_TOKEN_FILTER_CAPACITY,
+        fp_rate: float = REVOKED_TOKEN_FILTER_FP_RATE,
+    ) -> None:
+        self.fp_rate = fp_rate
+        self.revoked = BloomFilter(capacity, fp_rate)
+        self.filter_hits = 0
+        self.filter_false_positives = 0
+        self.refreshes = 0
+        self.rejected = 0
+        self.reuse_detected = 0
+        self.total_refresh_seconds = 0.0
+        self.max_refresh_seconds = 0.0
+        self._synced_to: datetime | None = None
+
+    async def issue(self, user_id: str) -> str:
+        """
+        Persist a new refresh token for a user and return it signed.
+
+        The token only names the user (`uid`) and its AuthToken row (`jti`);
+        everything about the user is read again on each refresh.
+
+        Args:
+            user_id (str): The AuthToken owner.
+
+        Returns:
+            str: The encoded refresh token.
+        """
+        jti = uuid4().hex
+        lifetime = timedelta(days=REFRESH_TOKEN_EXPIRE_DAYS)
+        await timed_query(
+            "AuthToken.create",
+            prisma.models.AuthToken.prisma().create(
+                data={
+                    "userId": user_id,
+                    "token": jti,
+                    "expiresAt": datetime.now(timezone.utc) + lifetime,
+                }
+            ),
+        )
+        return encode_token({"uid": user_id, "typ": "refresh", "jti": jti}, lifetime)
+
+    async def rotate(self, claims: dict[str, Any]) -> str:
+        """
+        Revoke the refresh token with these verified claims and issue its successor.
+
+        Args:
+            claims (dict[str, Any]): Verified claims of the presented refresh token.
+
+        Returns:
+            str: The new encoded refresh token.
+
+        Raises:
+            RefreshTokenRejected: If the token was revoked, already rotated or is unknown.
+        """
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            token = await self._rotate(claims)
+            outcome = "rotated"
+            return token
+        except RefreshTokenRejected:
+            self.rejected += 1
+            outcome = "rejected"
+            raise
+        finally:
+            elapsed = time.perf_counter() - started
+            self.refreshes += 1
+            self.total_refresh_seconds += elapsed
+            self.max_refresh_seconds = max(self.max_refresh_seconds, elapsed)
+            if METRICS_ENABLED:
+                token_refresh_duration_seconds.observe(elapsed, outcome)
+
+    async def _rotate(self, claims: dict[str, Any]) -> str:
+        # A filter miss still costs the update_many and the create below; the
+        # filter only lets a known reused token skip straight to revoking.
+        jti = claims.get("jti")
+        if claims.get("typ") != "refresh" or not jti or not claims.get("uid"):
+            raise RefreshTokenRejected("Not a refresh token.")
+        if jti.encode() in self.revoked:
+            self.filter_hits += 1
+            row = await timed_query(
+                "AuthToken.find_unique",
+                prisma.models.AuthToken.prisma().find_unique(where={"token": jti}),
+            )
+            if row is not None and row.revokedAt is not None:
+                await self._revoke_family(row.userId)
+                raise RefreshTokenRejected("Refresh token has been revoked.")
+            self.filter_false_positives += 1
+        now = datetime.now(timezone.utc)
+        revoked = await timed_query(
+            "AuthToken.update_many",
+            prisma.models.AuthToken.prisma().update_many(
+                where={"token": jti, "revokedAt": None, "expiresAt": {"gt": now}},
+                data={"revokedAt": now},
+            ),
+        )
+        if not revoked:
+            # Revoked by another worker, raced with a concurrent use, expired
+            # or never issued: look once to tell reuse apart from the rest.
+            row = await timed_query(
+                "AuthToken.find_unique",
+                prisma.models.AuthToken.prisma().find_unique(where={"token": jti}),
+            )
+            if row is not None and row.revokedAt is not None:
+                self.revoked.add(jti.encode())
+                await self._revoke_family(row.userId)
+            raise RefreshTokenRejected("Invalid refresh token.")
+        self.revoked.add(jti.encode())
+        return await self.issue(claims["uid"])
+
+    async def _revoke_family(self, user_id: str) -> None:
+        self.reuse_detected += 1
+        logger.warning("Refresh token reuse detected; revoking all tokens of a user")
+        await self.revoke_all(user_id)
+
+    async def revoke_all(self, user_id: str) -> None:
+        """
+        Revoke every live refresh token of a user, e.g. after a password change.
+        """
+        now = datetime.now(timezone.utc)
+        live = await timed_query(
+            "AuthToken.find_many",
+            prisma.models.AuthToken.prisma().find_many(
+                where={"userId": user_id, "revokedAt": None, "expiresAt": {"gt": now}}
+            ),
+        )
+        if not live:
+            return
+        await timed_query(
+            "AuthToken.update_many",
+            prisma.models.AuthToken.prisma().update_many(
+                where={"id": {"in": [row.id for row in live]}, "revokedAt": None},
+                data={"revokedAt": now},
+            ),
+        )
+        for row in live:
+            self.revoked.add(row.token.encode())
+
+    async def load(self) -> None:
+        """
+        Rebuild the filter from every revoked, unexpired AuthToken row.
+
+        The filter is resized to twice the number of rows found if that
+        exceeds its configured capacity.
+        """
+        now = datetime.now(timezone.utc)
+        where = {"revokedAt": {"lte": now}, "expiresAt": {"gt": now}}
+        tokens: list[str] = []
+        cursor: str | None = None
+        while True:
+            page = await timed_query(
+                "AuthToken.find_many",
+                prisma.models.AuthToken.prisma().find_many(
+                    where={**where, "id": {"gt": cursor}} if cursor else where,
+                    order={"id": "asc"},
+                    take=_LOAD_PAGE_SIZE,
+                ),
+            )
+            tokens.extend(row.token for row in page)
+            if len(page) < _LOAD_PAGE_SIZE:
+                break
+            cursor = page[-1].id
+        capacity = max(REVOKED_TOKEN_FILTER_CAPACITY, 2 * len(tokens))
+        revoked = BloomFilter(capacity, self.fp_rate)
+        for token in tokens:
+            revoked.add(token.encode())
+        self.revoked = revoked
+        self._synced_to = now
+        logger.info("Loaded %d revoked refresh tokens", len(tokens))
+
+    async def sync(self) -> None:
+        """
+        Add tokens revoked since the last sync, including by other workers.
+        """
+        if self._synced_to is None or self.revoked.count >= self.revoked.capacity:
+            await self.load()
+            return
+        # Overlap a little with the last sync to allow for clock skew between
+        # workers; ids already in the filter are skipped so they are not
+        # counted twice.
+        since = self._synced_to - timedelta(seconds=REVOKED_TOKEN_SYNC_SECONDS)
+        self._synced_to = datetime.now(timezone.utc)
+        rows = await timed_query(
+            "AuthToken.find_many",
+            prisma.models.AuthToken.prisma().find_many(
+                where={"revokedAt": {"gte": since}}
+            ),
+        )
+        for row in rows:
+            key = row.token.encode()
+            if key not in self.revoked:
+                self.revoked.add(key)
+
+    async def sync_forever(self, interval: float = REVOKED_TOKEN_SYNC_SECONDS) -> None:
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.sync()
+            except Exception:
+                logger.exception("Revoked refresh token sync failed")
+
+    def observed_fp_rate(self) -> float:
+        """
+        Share of refreshes with a live token that the filter still sent to the database.
+        """
+        live = self.refreshes - (self.filter_hits - self.filter_false_positives)
+        return self.filter_false_positives / live if live > 0 else 0.0
+
+    def stats(self) -> RefreshTokenStats:
+        return RefreshTokenStats(
+            filter_items=self.revoked.count,
+            filter_capacity=self.revoked.capacity,
+            filter_bits=self.revoked.bits,
+            filter_hashes=self.revoked.hashes,
+            filter_memory_bytes=self.revoked.memory_bytes,
+            estimated_fp_rate=self.revoked.estimated_fp_rate(),
+            filter_hits=self.filter_hits,
+            filter_false_positives=self.filter_false_positives,
+            observed_fp_rate=self.observed_fp_rate(),
+            refreshes=self.refreshes,
+            rejected=self.rejected,
+            reuse_detected=self.reuse_detected,
+            avg_refresh_ms=(
+                self.total_refresh_seconds / self.refreshes * 1000
+                if self.refreshes
+                else 0.0
+            ),
+            max_refresh_ms=self.max_refresh_seconds * 1000,
+        )
+
+
+refresh_token_store = RefreshTokenStore()
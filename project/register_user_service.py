@@ -3,6 +3,10 @@ from enum import Enum
 
 import prisma
 import prisma.models
+from fastapi import HTTPException, status
+from prisma.errors import UniqueViolationError
+from project.metrics import timed_query
+from project.password_hashing import PasswordHasherSaturated, password_hasher
 from pydantic import BaseModel
 
 
@@ -11,9 +15,9 @@ class Role(Enum):
     Enumeration of user roles within the application.
     """
 
-    USER: str = USER  # TODO(autogpt): F821 Undefined name `USER`
-    MODERATOR: str = MODERATOR  # TODO(autogpt): F821 Undefined name `MODERATOR`
-    ADMIN: str = ADMIN  # TODO(autogpt): F821 Undefined name `ADMIN`
+    USER = "USER"
+    MODERATOR = "MODERATOR"
+    ADMIN = "ADMIN"
 
 
 class UserRegistrationResponse(BaseModel):
@@ -27,29 +31,48 @@ class UserRegistrationResponse(BaseModel):
     registration_date: datetime
 
 
-async def register_user(
-    email: str, password: str, role: Role
-) -> UserRegistrationResponse:
+async def register_user(email: str, password: str) -> UserRegistrationResponse:
     """
     Register a new user account.
 
+    New accounts are always plain users; only an admin can give a user
+    another role, through update_profile.
+
     Args:
         email (str): User's email address. Must be unique.
         password (str): Password for the user account. Will be hashed before storage.
-        role (Role): The role assigned to the user at registration.
 
     Returns:
         UserRegistrationResponse: Response model for when a user has successfully registered. Provides basic user information without sensitive data like passwords.
+
+    Raises:
+        HTTPException: 409 if the email is already registered, 503 if the password hashing pool is saturated.
     """
-    hashed_password: str = f"hashed_{password}"
-    existing_user = await prisma.models.User.prisma().find_unique(
-        where={"email": email}
-    )
-    if existing_user:
-        raise ValueError("User already exists with this email")
-    new_user = await prisma.models.User.prisma().create(
-        data={"email": email, "password": hashed_password, "role": role.value}
-    )
+    try:
+        hashed_password = await password_hasher.hash(password)
+    except PasswordHasherSaturated:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many concurrent registrations, please retry shortly",
+            headers={"Retry-After": "1"},
+        )
+    # One insert; the email unique constraint decides whether the user exists.
+    try:
+        new_user = await timed_query(
+            "User.create",
+            prisma.models.User.prisma().create(
+                data={
+                    "email": email,
+                    "password": hashed_password,
+                    "role": Role.USER.value,
+                }
+            ),
+        )
+    except UniqueViolationError:
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="User already exists with this email",
+        )
     registration_response = UserRegistrationResponse(
         user_id=new_user.id,
         email=new_user.email,
@@ -0,0 +1,232 @@
+"""
+Prune expired AuthToken rows, stale RateLimit rows and old JokeViewBucket rows.
+
+Runs inside the app from `server.lifespan`, or on its own:
+
+    python -m project.retention [--once] [--batch-size 500] [--pause 0.05]
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import random
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable
+
+import prisma
+import prisma.models
+from project.metrics import timed_query
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+RETENTION_ENABLED = os.getenv("RETENTION_ENABLED", "1") != "0"
+
+RETENTION_INTERVAL_SECONDS = float(os.getenv("RETENTION_INTERVAL_SECONDS", "300"))
+
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", "500"))
+
+RETENTION_BATCH_PAUSE_SECONDS = float(
+    os.getenv("RETENTION_BATCH_PAUSE_SECONDS", "0.05")
+)
+
+# A run stops after this long even if rows are left; the next run continues.
+RETENTION_MAX_RUN_SECONDS = float(os.getenv("RETENTION_MAX_RUN_SECONDS", "60"))
+
+# Hourly view buckets older than this are dropped; keep it above the
+# longest /jokes/top window.
+JOKE_VIEWS_RETENTION_DAYS = float(os.getenv("JOKE_VIEWS_RETENTION_DAYS", "8"))
+
+
+class RetentionRunStats(BaseModel):
+    """
+    What one retention job removed in one run.
+    """
+
+    job: str
+    deleted: int
+    batches: int
+    seconds: float
+    finished: bool
+    started_at: datetime
+
+
+class RetentionStats(BaseModel):
+    """
+    The latest run of each retention job plus totals since startup.
+    """
+
+    runs: int
+    deleted_total: dict[str, int]
+    last_runs: list[RetentionRunStats]
+
+
+class RetentionJob:
+    """
+    Deletes rows whose `field` is more than `max_age` in the past, `batch_size` at a time.
+
+    Each batch looks up the oldest expired ids through the index on `field`
+    and deletes exactly those ids, re-checking the cutoff so a row renewed
+    in the meantime survives. Batches are kept small and separated by a
+    pause so no statement holds locks for long or hogs the connection pool.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        actions: Callable[[], Any],
+        field: str,
+        max_age: timedelta = timedelta(0),
+    ) -> None:
+        self.name = name
+        self.actions = actions
+        self.field = field
+        self.max_age = max_age
+
+    async def run(
+        self, batch_size: int, pause: float, max_seconds: float
+    ) -> RetentionRunStats:
+        started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        deleted = 0
+        batches = 0
+        finished = False
+        while time.perf_counter() - started < max_seconds:
+            cutoff = datetime.now(timezone.utc) - self.max_age
+            expired = {self.field: {"lt": cutoff}}
+            rows = await timed_query(
+                f"{self.name}.find_many",
+                self.actions().find_many(
+                    where=expired, order={self.field: "asc"}, take=batch_size
+                ),
+            )
+            if rows:
+                deleted += await timed_query(
+                    f"{self.name}.delete_many",
+                    self.actions().delete_many(
+                        where={"id": {"in": [row.id for row in rows]}, **expired}
+                    ),
+                )
+                batches += 1
+            if len(rows) < batch_size:
+                finished = True
+                break
+            await asyncio.sleep(pause)
+        return RetentionRunStats(
+            job=self.name,
+            deleted=deleted,
+            batches=batches,
+            seconds=round(time.perf_counter() - started, 3),
+            finished=finished,
+            started_at=started_at,
+        )
+
+
+class RetentionScheduler:
+    """
+    Runs every retention job every `interval` seconds.
+
+    The first run is delayed by a random fraction of the interval so that
+    workers started together do not all prune at once.
+    """
+
+    def __init__(
+        self,
+        jobs: list[RetentionJob],
+        interval: float = RETENTION_INTERVAL_SECONDS,
+        batch_size: int = RETENTION_BATCH_SIZE,
+        pause: float = RETENTION_BATCH_PAUSE_SECONDS,
+        max_seconds: float = RETENTION_MAX_RUN_SECONDS,
+    ) -> None:
+        self.jobs = jobs
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        self.max_seconds = max_seconds
+        self.runs = 0
+        self.deleted_total = {job.name: 0 for job in jobs}
+        self.last_runs: dict[str, RetentionRunStats] = {}
+
+    async def run_once(self) -> list[RetentionRunStats]:
+        """
+        Run each job until it has nothing left to delete or hits `max_seconds`.
+
+        Returns:
+            list[RetentionRunStats]: One entry per job.
+        """
+        results = []
+        for job in self.jobs:
+            try:
+                result = await job.run(self.batch_size, self.pause, self.max_seconds)
+            except Exception:
+                logger.exception("Retention job %s failed", job.name)
+                continue
+            self.deleted_total[job.name] += result.deleted
+            self.last_runs[job.name] = result
+            results.append(result)
+            if result.deleted:
+                logger.info(
+                    "Retention removed %d %s rows in %.3fs",
+                    result.deleted,
+                    job.name,
+                    result.seconds,
+                )
+        self.runs += 1
+        return results
+
+    async def run_forever(self) -> None:
+        await asyncio.sleep(random.uniform(0, self.interval))
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
+
+    def stats(self) -> RetentionStats:
+        return RetentionStats(
+            runs=self.runs,
+            deleted_total=dict(self.deleted_total),
+            last_runs=list(self.last_runs.values()),
+        )
+
+
+retention_scheduler = RetentionScheduler(
+    [
+        RetentionJob(
+            "AuthToken", lambda: prisma.models.AuthToken.prisma(), "expiresAt"
+        ),
+        RetentionJob("RateLimit", lambda: prisma.models.RateLimit.prisma(), "resetAt"),
+        RetentionJob(
+            "JokeViewBucket",
+            lambda: prisma.models.JokeViewBucket.prisma(),
+            "bucket",
+            timedelta(days=JOKE_VIEWS_RETENTION_DAYS),
+        ),
+    ]
+)
+
+
+async def main(args: argparse.Namespace) -> None:
+    import project.db
+
+    retention_scheduler.batch_size = args.batch_size
+    retention_scheduler.pause = args.pause
+    await project.db.connect()
+    try:
+        if args.once:
+            retention_scheduler.max_seconds = float("inf")
+            for result in await retention_scheduler.run_once():
+                print(result.json())
+        else:
+            await retention_scheduler.run_forever()
+    finally:
+        await project.db.disconnect()
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--once", action="store_true")
+    parser.add_argument("--batch-size", type=int, default=RETENTION_BATCH_SIZE)
+    parser.add_argument("--pause", type=float, default=RETENTION_BATCH_PAUSE_SECONDS)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,336 @@
+import asyncio
+import heapq
+import math
+import os
+import re
+import sys
+from array import array
+from bisect import bisect_left
+from typing import Iterable
+
+SEARCH_ENABLED = os.getenv("SEARCH_ENABLED", "1") != "0"
+
+BM25_K1 = 1.2
+
+BM25_B = 0.75
+
+MAX_PREFIX_EXPANSIONS = 50
+
+# Postings lists longer than this are scanned through their champion list
+# instead of in full when a term is the first to introduce candidates.
+CHAMPION_LIST_THRESHOLD = 4096
+
+CHAMPION_LIST_SIZE = 1024
+
+_TOKEN = re.compile(r"\w+")
+
+_BUILD_YIELD_EVERY = 500
+
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.casefold())
+
+
+class _Postings:
+    """
+    Sorted document slots containing a term, with the term frequency in each.
+
+    Long lists also cache a champion list: the CHAMPION_LIST_SIZE slots where
+    the term weighs most, recomputed lazily after the list changes.
+    """
+
+    __slots__ = ("slots", "freqs", "champions")
+
+    def __init__(self) -> None:
+        self.slots = array("I")
+        self.freqs = array("H")
+        self.champions: list[tuple[int, int]] | None = None
+
+
+class SearchIndex:
+    """
+    In-memory BM25 inverted index over approved jokes.
+
+    Documents get dense integer slots in insertion order, so appending a new
+    document keeps every postings array sorted. Removed documents become
+    tombstones that are skipped at query time; once they make up half the
+    slots the index compacts itself by renumbering the live slots. The
+    vocabulary is kept in a sorted list, rebuilt lazily, for prefix lookups.
+
+    Ranking is BM25 evaluated term at a time with MaxScore pruning. Very
+    common terms are read through champion lists, so a query made only of
+    common words ranks an approximate rather than exhaustive candidate set.
+
+    The index implements the PoolListener protocol so it can follow an
+    ApprovedJokePool. A reset inside a running event loop rebuilds the
+    index as a task that yields every few hundred jokes, so a worker can
+    serve while a large pool is indexed; until it finishes the previous
+    contents keep answering queries, and changes made in the meantime are
+    replayed onto the new index before it replaces them.
+    """
+
+    def __init__(self) -> None:
+        self._reset()
+        self.ready = False
+        self._rebuild: asyncio.Task | None = None
+        self._changes: list[tuple[str, str | None]] | None = None
+
+    def _reset(self) -> None:
+        self._postings: dict[str, _Postings] = {}
+        self._doc_ids: list[str | None] = []
+        self._doc_lengths = array("I")
+        self._slot_of: dict[str, int] = {}
+        self._total_length = 0
+        self._dead = 0
+        self._vocabulary: list[str] = []
+        self._vocabulary_dirty = False
+
+    def __len__(self) -> int:
+        return len(self._slot_of)
+
+    def add(self, joke_id: str, content: str) -> None:
+        """
+        Index a joke, replacing any previous version of it.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+            content (str): The joke text.
+        """
+        if joke_id in self._slot_of:
+            self.remove(joke_id)
+        tokens = tokenize(content)
+        slot = len(self._doc_ids)
+        self._doc_ids.append(joke_id)
+        self._doc_lengths.append(len(tokens))
+        self._slot_of[joke_id] = slot
+        self._total_length += len(tokens)
+        counts: dict[str, int] = {}
+        for token in tokens:
+            counts[token] = counts.get(token, 0) + 1
+        for term, count in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = _Postings()
+                self._vocabulary_dirty = True
+            postings.slots.append(slot)
+            postings.freqs.append(min(count, 0xFFFF))
+            postings.champions = None
+
+    def remove(self, joke_id: str) -> None:
+        """
+        Remove a joke from the index if present.
+
+        Args:
+            joke_id (str): The unique identifier of the joke.
+        """
+        slot = self._slot_of.pop(joke_id, None)
+        if slot is None:
+            return
+        self._doc_ids[slot] = None
+        self._total_length -= self._doc_lengths[slot]
+        self._dead += 1
+        if self._dead * 2 > len(self._doc_ids):
+            self._compact()
+
+    def on_add(self, joke_id: str, content: str) -> None:
+        self.add(joke_id, content)
+        if self._changes is not None:
+            self._changes.append((joke_id, content))
+
+    def on_discard(self, joke_id: str) -> None:
+        self.remove(joke_id)
+        if self._changes is not None:
+            self._changes.append((joke_id, None))
+
+    def on_reset(self, jokes: Iterable[tuple[str, str]]) -> None:
+        if self._rebuild is not None:
+            self._rebuild.cancel()
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self._reset()
+            for joke_id, content in jokes:
+                self.add(joke_id, content)
+            self.ready = True
+            return
+        if not self._slot_of:
+            # Nothing to answer from until the build finishes.
+            self.ready = False
+        self._changes = []
+        self._rebuild = loop.create_task(self._build(jokes))
+
+    async def _build(self, jokes: Iterable[tuple[str, str]]) -> None:
+        fresh = SearchIndex()
+        for position, (joke_id, content) in enumerate(jokes, 1):
+            fresh.add(joke_id, content)
+            if position % _BUILD_YIELD_EVERY == 0:
+                await asyncio.sleep(0)
+        for joke_id, content in self._changes or ():
+            if content is None:
+                fresh.remove(joke_id)
+            else:
+                fresh.add(joke_id, content)
+        self._postings = fresh._postings
+        self._doc_ids = fresh._doc_ids
+        self._doc_lengths = fresh._doc_lengths
+        self._slot_of = fresh._slot_of
+        self._total_length = fresh._total_length
+        self._dead = fresh._dead
+        self._vocabulary = fresh._vocabulary
+        self._vocabulary_dirty = fresh._vocabulary_dirty
+        self._changes = None
+        self._rebuild = None
+        self.ready = True
+
+    def search(
+        self, query: str, limit: int = 10, prefix: bool = True
+    ) -> list[tuple[str, float]]:
+        """
+        Rank jokes against a free-text query with BM25.
+
+        Args:
+            query (str): The search text.
+            limit (int): Maximum number of results.
+            prefix (bool): Whether the last query word also matches longer words starting with it.
+
+        Returns:
+            list[tuple[str, float]]: (joke id, score) pairs, best first.
+        """
+        terms = tokenize(query)
+        if not terms or not self._slot_of:
+            return []
+        expanded = [[term] for term in terms]
+        if prefix:
+            expanded[-1] = self._expand_prefix(terms[-1]) or [terms[-1]]
+        live = len(self._slot_of)
+        base = BM25_K1 * (1 - BM25_B)
+        per_token = BM25_K1 * BM25_B * live / max(self._total_length, 1)
+        doc_ids = self._doc_ids
+        doc_lengths = self._doc_lengths
+        weighted = []
+        for alternatives in expanded:
+            for term in alternatives:
+                postings = self._postings.get(term)
+                if postings is not None:
+                    weighted.append(postings)
+        # MaxScore: walk terms from rarest to most common. A term contributes
+        # at most idf * (k1 + 1), so once the best `limit` partial scores beat
+        # everything the remaining terms could add, documents not seen yet
+        # cannot make the top results and the (long) postings lists of the
+        # remaining common terms only need probing for existing candidates.
+        weighted.sort(key=lambda postings: len(postings.slots))
+        idfs = [
+            math.log(1 + (live - len(p.slots) + 0.5) / (len(p.slots) + 0.5))
+            for p in weighted
+        ]
+        remaining = [0.0] * (len(weighted) + 1)
+        for i in range(len(weighted) - 1, -1, -1):
+            remaining[i] = remaining[i + 1] + idfs[i] * (BM25_K1 + 1)
+        scores: dict[int, float] = {}
+        for i, postings in enumerate(weighted):
+            idf = idfs[i]
+            df = len(postings.slots)
+            threshold = (
+                heapq.nlargest(limit, scores.values())[-1]
+                if len(scores) >= limit
+                else 0.0
+            )
+            if threshold > remaining[i]:
+                candidates = [
+                    slot
+                    for slot, score in scores.items()
+                    if score + remaining[i] >= threshold
+                ]
+                scores = {slot: scores[slot] for slot in candidates}
+                pairs = []
+                for slot in candidates:
+                    j = bisect_left(postings.slots, slot)
+                    if j < df and postings.slots[j] == slot:
+                        pairs.append((slot, postings.freqs[j]))
+            elif df > CHAMPION_LIST_THRESHOLD:
+                pairs = self._champions(postings, base, per_token)
+                if scores:
+                    probe = []
+                    for slot in scores:
+                        j = bisect_left(postings.slots, slot)
+                        if j < df and postings.slots[j] == slot:
+                            probe.append((slot, postings.freqs[j]))
+                    pairs = dict(pairs + probe).items()
+            else:
+                pairs = zip(postings.slots, postings.freqs)
+            for slot, freq in pairs:
+                if doc_ids[slot] is None:
+                    continue
+                norm = base + per_token * doc_lengths[slot]
+                scores[slot] = scores.get(slot, 0.0) + idf * freq * (BM25_K1 + 1) / (
+                    freq + norm
+                )
+        best = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        return [(self._doc_ids[slot], score) for slot, score in best]
+
+    def memory_bytes(self) -> int:
+        """
+        Approximate memory held by the index, in bytes.
+        """
+        total = sys.getsizeof(self._postings) + sys.getsizeof(self._slot_of)
+        total += sys.getsizeof(self._doc_ids) + sys.getsizeof(self._vocabulary)
+        total += self._doc_lengths.itemsize * len(self._doc_lengths)
+        for term, postings in self._postings.items():
+            total += sys.getsizeof(term) + sys.getsizeof(postings)
+            total += postings.slots.itemsize * len(postings.slots)
+            total += postings.freqs.itemsize * len(postings.freqs)
+        return total
+
+    def _champions(
+        self, postings: _Postings, base: float, per_token: float
+    ) -> list[tuple[int, int]]:
+        if postings.champions is None:
+            doc_lengths = self._doc_lengths
+            postings.champions = heapq.nlargest(
+                CHAMPION_LIST_SIZE,
+                zip(postings.slots, postings.freqs),
+                key=lambda pair: pair[1]
+                / (pair[1] + base + per_token * doc_lengths[pair[0]]),
+            )
+        return postings.champions
+
+    def _expand_prefix(self, stem: str) -> list[str]:
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        start = bisect_left(self._vocabulary, stem)
+        matches = []
+        for term in self._vocabulary[start : start + MAX_PREFIX_EXPANSIONS]:
+            if not term.startswith(stem):
+                break
+            matches.append(term)
+        return matches
+
+    def _compact(self) -> None:
+        remap = array("i", [-1]) * len(self._doc_ids)
+        doc_ids: list[str | None] = []
+        doc_lengths = array("I")
+        for slot, joke_id in enumerate(self._doc_ids):
+            if joke_id is not None:
+                remap[slot] = len(doc_ids)
+                doc_ids.append(joke_id)
+                doc_lengths.append(self._doc_lengths[slot])
+        for term in list(self._postings):
+            old = self._postings[term]
+            new = _Postings()
+            for slot, freq in zip(old.slots, old.freqs):
+                if remap[slot] >= 0:
+                    new.slots.append(remap[slot])
+                    new.freqs.append(freq)
+            if new.slots:
+                self._postings[term] = new
+            else:
+                del self._postings[term]
+                self._vocabulary_dirty = True
+        self._doc_ids = doc_ids
+        self._doc_lengths = doc_lengths
+        self._slot_of = {joke_id: slot for slot, joke_id in enumerate(doc_ids)}
+        self._dead = 0
+
+
+joke_search_index = SearchIndex()
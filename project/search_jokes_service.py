@@ -0,0 +1,41 @@
+from project.joke_pool import approved_joke_pool
+from project.search_index import joke_search_index
+from pydantic import BaseModel
+
+
+class SearchJokeResult(BaseModel):
+    """
+    A dad joke matching a search query, with its relevance score.
+    """
+
+    id: str
+    content: str
+    score: float
+
+
+class SearchJokesResponse(BaseModel):
+    """
+    Response model for a joke search, holding the best matches first.
+    """
+
+    query: str
+    results: list[SearchJokeResult]
+
+
+async def search_jokes(q: str, limit: int) -> SearchJokesResponse:
+    """
+    Search approved dad jokes by text.
+
+    Args:
+        q (str): The search text. The last word also matches words starting with it.
+        limit (int): Maximum number of results.
+
+    Returns:
+        SearchJokesResponse: Response model for a joke search, holding the best matches first.
+    """
+    results = []
+    for joke_id, score in joke_search_index.search(q, limit):
+        content = approved_joke_pool.get(joke_id)
+        if content is not None:
+            results.append(SearchJokeResult(id=joke_id, content=content, score=score))
+    return SearchJokesResponse(query=q, results=results)
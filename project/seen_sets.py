@@ -0,0 +1,140 @@
+import os
+import random
+from collections import OrderedDict
+
+SEEN_SETS_MAX_BYTES = int(os.getenv("SEEN_SETS_MAX_BYTES", str(64 * 1024 * 1024)))
+
+
+class _SeenSet:
+    """
+    One client's bitset over the approved pool's dense slots, valid for one pool generation.
+    """
+
+    __slots__ = ("bits", "seen", "generation")
+
+    def __init__(self, size: int, generation: int) -> None:
+        self.bits = bytearray((size + 7) >> 3)
+        self.seen = 0
+        self.generation = generation
+
+    def has(self, slot: int) -> bool:
+        return bool(self.bits[slot >> 3] & (1 << (slot & 7)))
+
+    def mark(self, slot: int) -> None:
+        self.bits[slot >> 3] |= 1 << (slot & 7)
+        self.seen += 1
+
+    def reset(self, size: int) -> None:
+        self.bits = bytearray((size + 7) >> 3)
+        self.seen = 0
+
+
+class SeenSets:
+    """
+    Per-client no-repeat state for random joke selection.
+
+    Each client gets a bitset with one bit per pool slot, so a 10k joke pool
+    costs 1.25 KB per client. Clients are kept in LRU order and the least
+    recently active ones are evicted once the total exceeds `max_bytes`.
+
+    Pool slots are reused when a joke is removed, so a removal may transfer
+    a "seen" mark to the joke swapped into its slot. That is harmless for
+    the purpose of avoiding repeats. Rebuilding the pool renumbers all
+    slots, though, so a bitset from an earlier pool generation would mark
+    arbitrary jokes as seen; such a bitset is cleared on the client's next
+    draw and a new cycle starts.
+    """
+
+    def __init__(self, max_bytes: int = SEEN_SETS_MAX_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self.total_bytes = 0
+        self._clients: OrderedDict[str, _SeenSet] = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+    def draw(
+        self, client_key: str, size: int, count: int, generation: int = 0
+    ) -> list[int]:
+        """
+        Draw up to `count` distinct pool slots the client has not seen yet.
+
+        When the client has seen the whole pool its bitset is cleared and a
+        new cycle starts.
+
+        Args:
+            client_key (str): Identifies the client or user.
+            size (int): Current number of slots in the pool.
+            count (int): Number of slots wanted.
+            generation (int): The pool's current generation.
+
+        Returns:
+            list[int]: The drawn slots, at most min(count, size) of them.
+        """
+        if size == 0:
+            return []
+        seen_set = self._checkout(client_key, size, generation)
+        picked: list[int] = []
+        count = min(count, size)
+        while len(picked) < count:
+            if seen_set.seen >= size:
+                seen_set.reset(size)
+                for slot in picked:
+                    seen_set.mark(slot)
+            picked.extend(self._draw_unseen(seen_set, size, count - len(picked)))
+        self._account()
+        return picked
+
+    def forget(self, client_key: str) -> None:
+        seen_set = self._clients.pop(client_key, None)
+        if seen_set is not None:
+            self.total_bytes -= len(seen_set.bits)
+
+    def _checkout(self, client_key: str, size: int, generation: int) -> _SeenSet:
+        seen_set = self._clients.get(client_key)
+        if seen_set is None:
+            seen_set = _SeenSet(size, generation)
+            self._clients[client_key] = seen_set
+            self.total_bytes += len(seen_set.bits)
+        elif seen_set.generation != generation:
+            self._clients.move_to_end(client_key)
+            self.total_bytes -= len(seen_set.bits)
+            seen_set.reset(size)
+            seen_set.generation = generation
+            self.total_bytes += len(seen_set.bits)
+        else:
+            self._clients.move_to_end(client_key)
+            needed = (size + 7) >> 3
+            if len(seen_set.bits) < needed:
+                grow = needed - len(seen_set.bits)
+                seen_set.bits.extend(bytes(grow))
+                self.total_bytes += grow
+            seen_set.seen = min(seen_set.seen, size)
+        return seen_set
+
+    def _account(self) -> None:
+        while self.total_bytes > self.max_bytes and len(self._clients) > 1:
+            _, evicted = self._clients.popitem(last=False)
+            self.total_bytes -= len(evicted.bits)
+
+    @staticmethod
+    def _draw_unseen(seen_set: _SeenSet, size: int, count: int) -> list[int]:
+        picked = []
+        remaining = size - seen_set.seen
+        if remaining > 4 * count:
+            while len(picked) < count:
+                slot = random.randrange(size)
+                if not seen_set.has(slot):
+                    seen_set.mark(slot)
+                    picked.append(slot)
+            return picked
+        unseen = [slot for slot in range(size) if not seen_set.has(slot)]
+        picked = random.sample(unseen, min(count, len(unseen)))
+        for slot in picked:
+            seen_set.mark(slot)
+        if len(unseen) <= count:
+            seen_set.seen = size
+        return picked
+
+
+client_seen_sets = SeenSets()
@@ -1,29 +1,120 @@
+import asyncio
 import logging
+import math
+import time
 from contextlib import asynccontextmanager
-from typing import Optional
+from typing import Optional, Union
 
+import project.corpus
+import project.current_user
+import project.db
+import project.duplicate_index
+import project.fast_json
 import project.get_random_joke_service
+import project.import_users_service
+import project.joke_events
+import project.joke_pool
+import project.joke_views
+import project.json_stream
 import project.login_user_service
+import project.metrics
 import project.moderate_joke_service
+import project.notifications
+import project.password_hashing
+import project.rate_limit
 import project.refresh_token_service
+import project.refresh_tokens
 import project.register_user_service
+import project.retention
+import project.search_index
+import project.search_jokes_service
+import project.single_flight
+import project.submission_buffer
 import project.submit_joke_service
 import project.update_profile_service
-from fastapi import FastAPI
-from fastapi.encoders import jsonable_encoder
-from fastapi.responses import Response
-from prisma import Prisma
+from project.auth_tokens import decode_access_token, token_digest
+from project.current_user import require_admin, require_moderator
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, WebSocket
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from jose import JWTError
 
 logger = logging.getLogger(__name__)
 
-db_client = Prisma(auto_register=True)
-
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    await db_client.connect()
+    await project.db.connect()
+    resync_task = None
+    if project.search_index.SEARCH_ENABLED and not project.joke_pool.JOKE_POOL_ENABLED:
+        logger.warning(
+            "/jokes/search is unavailable: its index needs JOKE_POOL_ENABLED"
+        )
+    if project.joke_pool.JOKE_POOL_ENABLED:
+        project.joke_pool.approved_joke_pool.subscribe(
+            project.joke_events.joke_broadcaster
+        )
+        if project.search_index.SEARCH_ENABLED:
+            project.joke_pool.approved_joke_pool.subscribe(
+                project.search_index.joke_search_index
+            )
+        await project.joke_pool.approved_joke_pool.warm()
+        resync_task = asyncio.create_task(
+            project.joke_pool.approved_joke_pool.resync_forever()
+        )
+    duplicate_sync_task = None
+    if project.duplicate_index.DUPLICATE_CHECK_ENABLED:
+        duplicate_sync_task = asyncio.create_task(
+            project.duplicate_index.duplicate_index.sync_forever()
+        )
+    flush_task = None
+    if project.rate_limit.RATE_LIMIT_ENABLED:
+        await project.rate_limit.rate_limiter.load()
+        flush_task = asyncio.create_task(
+            project.rate_limit.rate_limiter.flush_forever()
+        )
+    if project.submission_buffer.SUBMIT_BUFFERED:
+        await project.submission_buffer.submission_buffer.start()
+    await project.refresh_tokens.refresh_token_store.load()
+    revocation_sync_task = asyncio.create_task(
+        project.refresh_tokens.refresh_token_store.sync_forever()
+    )
+    views_tasks = []
+    if project.joke_views.JOKE_VIEWS_ENABLED:
+        views_tasks = [
+            asyncio.create_task(project.joke_views.joke_views.flush_forever()),
+            asyncio.create_task(project.joke_views.top_jokes.refresh_forever()),
+        ]
+    notification_task = asyncio.create_task(
+        project.notifications.notification_listener.listen_forever()
+    )
+    retention_task = None
+    if project.retention.RETENTION_ENABLED:
+        retention_task = asyncio.create_task(
+            project.retention.retention_scheduler.run_forever()
+        )
     yield
-    await db_client.disconnect()
+    notification_task.cancel()
+    if duplicate_sync_task is not None:
+        duplicate_sync_task.cancel()
+    if retention_task is not None:
+        retention_task.cancel()
+    revocation_sync_task.cancel()
+    for task in views_tasks:
+        task.cancel()
+    if views_tasks:
+        try:
+            await project.joke_views.joke_views.flush()
+        except Exception:
+            logger.exception("Final joke view flush failed")
+    await project.submission_buffer.submission_buffer.stop()
+    if resync_task is not None:
+        resync_task.cancel()
+    if flush_task is not None:
+        flush_task.cancel()
+        await project.rate_limit.rate_limiter.flush()
+    project.password_hashing.password_hasher.shutdown()
+    project.password_hashing.import_password_hasher.shutdown()
+    await project.db.disconnect()
 
 
 app = FastAPI(
@@ -32,27 +123,351 @@ app = FastAPI(
     description="Based on our conversation and the information gathered, our project will involve creating a single API endpoint using FastAPI that returns one random dad joke. Here's a summary of the steps and best practices to employ in building this API:\n\n1. **API Structure and Endpoint Design**: Create a clear and intuitive API structure with one main endpoint (e.g., /random-joke) that returns a random dad joke upon request.\n\n2. **Use of Pydantic Models**: Employ Pydantic models to validate incoming requests and serialize outgoing responses to ensure data consistency and integrity.\n\n3. **Asynchronous Request Handling**: Implement async functions to handle requests efficiently, improving scalability and performance.\n\n4. **OpenAPI Documentation**: Utilize FastAPI’s automatic OpenAPI documentation feature for easy exploration and testing of the API endpoint.\n\n5. **Security Measures**: Secure the API by integrating basic authentication or JWT tokens to control access.\n\n6. **Background Tasks and Rate Limiting**: Incorporate background tasks for any heavy processing and rate limiting to prevent abuse and ensure the API remains responsive.\n\n7. **Database Integration with PostgreSQL and Prisma ORM**: Use PostgreSQL for database needs and integrate with Prisma ORM for database operations, enabling the storage and retrieval of jokes.\n\n8. **Endpoint Testing**: Ensure thorough testing of the endpoint using FastAPI’s test client, covering various scenarios and validations.\n\n9. **Adherence to RESTful Principles**: Design the API according to RESTful principles, ensuring a resource-oriented approach and the use of appropriate HTTP methods.\n\n10. **Code Cleanliness and Documentation**: Maintain clean, well-organized code and provide adequate documentation for future maintainability.\n\nThe user expressed a preference for dad jokes, which are known for being clean, family-friendly, and simple. This project aims to craft an inclusive API experience by delivering a random dad joke, aligning with the user's preferences.",
 )
 
+# FastAPI 0.78 does not forward `lifespan` to its router and would never
+# run it; setting it on the router works on this and later versions.
+app.router.lifespan_context = lifespan
+
+
+@app.middleware("http")
+async def rate_limit_middleware(request: Request, call_next):
+    """
+    Reject callers that have exhausted their token bucket for the route.
+
+    Valid access tokens are limited per token, everything else per client
+    address; a token is only trusted once verified, so minting random ones
+    does not buy fresh buckets.
+    """
+    if not project.rate_limit.RATE_LIMIT_ENABLED:
+        return await call_next(request)
+    identifier = "ip:" + (request.client.host if request.client else "unknown")
+    authorization = request.headers.get("authorization")
+    if authorization and authorization.lower().startswith("bearer "):
+        try:
+            decode_access_token(authorization[7:])
+            identifier = "token:" + token_digest(authorization[7:]).hex()
+        except JWTError:
+            pass
+    retry_after = project.rate_limit.rate_limiter.hit(request.url.path, identifier)
+    if retry_after:
+        return Response(
+            content=b'{"error":"Too many requests"}',
+            status_code=429,
+            media_type="application/json",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+    return await call_next(request)
+
+
+# Added after the rate limiter so that it wraps it and also counts 429s.
+app.add_middleware(project.metrics.MetricsMiddleware)
+
+project.metrics.Callback(
+    "rate_limit_buckets",
+    "Rate limit buckets held in memory.",
+    lambda: len(project.rate_limit.rate_limiter),
+)
+project.metrics.Callback(
+    "rate_limit_buckets_evicted",
+    "Rate limit buckets dropped to stay within RATE_LIMIT_MAX_BUCKETS.",
+    lambda: project.rate_limit.rate_limiter.evicted,
+    kind="counter",
+)
+project.metrics.Callback(
+    "joke_pool_size",
+    "Approved jokes held in memory.",
+    lambda: len(project.joke_pool.approved_joke_pool),
+)
+project.metrics.Callback(
+    "joke_snapshot_bytes",
+    "Size of the approved joke snapshot the pool is built on.",
+    lambda: project.joke_pool.approved_joke_pool.snapshot.size_bytes,
+)
+project.metrics.Callback(
+    "joke_snapshot_age_seconds",
+    "Seconds since the approved joke snapshot was built.",
+    lambda: time.time() - project.joke_pool.approved_joke_pool.snapshot.built_at,
+)
+project.metrics.Callback(
+    "search_index_documents",
+    "Jokes in the /jokes/search index.",
+    lambda: len(project.search_index.joke_search_index),
+)
+project.metrics.Callback(
+    "search_index_memory_bytes",
+    "Approximate memory used by the /jokes/search index.",
+    lambda: project.search_index.joke_search_index.memory_bytes(),
+)
+project.metrics.Callback(
+    "duplicate_index_jokes",
+    "Jokes in the duplicate detection index.",
+    lambda: len(project.duplicate_index.duplicate_index),
+)
+project.metrics.Callback(
+    "duplicate_index_memory_bytes",
+    "Approximate memory used by the duplicate detection index.",
+    lambda: project.duplicate_index.duplicate_index.memory_bytes(),
+)
+project.metrics.Callback(
+    "submission_buffer_depth",
+    "Submissions waiting in the write-behind buffer.",
+    lambda: project.submission_buffer.submission_buffer.stats().depth,
+)
+project.metrics.Callback(
+    "submission_buffer_flushed_total",
+    "Buffered submissions written to the database.",
+    lambda: project.submission_buffer.submission_buffer.flushed,
+    kind="counter",
+)
+project.metrics.Callback(
+    "submission_buffer_failed_total",
+    "Buffered submissions lost to failed flushes.",
+    lambda: project.submission_buffer.submission_buffer.failed,
+    kind="counter",
+)
+project.metrics.Callback(
+    "submission_buffer_retries_total",
+    "Buffered submission batches written again after a failed flush.",
+    lambda: project.submission_buffer.submission_buffer.retried,
+    kind="counter",
+)
+project.metrics.Callback(
+    "password_hash_pending",
+    "bcrypt operations queued or running.",
+    lambda: project.password_hashing.password_hasher.pending,
+)
+project.metrics.Callback(
+    "password_hash_rejected_total",
+    "Logins rejected because the bcrypt pool was saturated.",
+    lambda: project.password_hashing.password_hasher.rejected,
+    kind="counter",
+)
+project.metrics.Callback(
+    "joke_stream_subscribers",
+    "Open /jokes/stream and /jokes/ws connections.",
+    lambda: len(project.joke_events.joke_broadcaster),
+)
+project.metrics.Callback(
+    "joke_stream_evicted_total",
+    "Stream subscribers disconnected for falling behind.",
+    lambda: project.joke_events.joke_broadcaster.evicted,
+    kind="counter",
+)
+project.metrics.Callback(
+    "revoked_token_filter_items",
+    "Revoked refresh token ids in the in-memory filter.",
+    lambda: project.refresh_tokens.refresh_token_store.revoked.count,
+)
+project.metrics.Callback(
+    "revoked_token_filter_fp_rate",
+    "Estimated false-positive rate of the revoked refresh token filter.",
+    lambda: project.refresh_tokens.refresh_token_store.revoked.estimated_fp_rate(),
+)
+project.metrics.Callback(
+    "revoked_token_filter_false_positives_total",
+    "Refreshes the filter sent to the database for a token that was not revoked.",
+    lambda: project.refresh_tokens.refresh_token_store.filter_false_positives,
+    kind="counter",
+)
+project.metrics.Callback(
+    "joke_views_pending",
+    "Joke views counted in memory and not yet written to JokeViewBucket.",
+    lambda: project.joke_views.joke_views.stats().pending,
+)
+project.metrics.Callback(
+    "joke_views_dropped_total",
+    "Joke views discarded because too many counters were pending.",
+    lambda: project.joke_views.joke_views.dropped,
+    kind="counter",
+)
+project.metrics.Callback(
+    "retention_runs_total",
+    "Completed runs of the AuthToken and RateLimit retention jobs.",
+    lambda: project.retention.retention_scheduler.runs,
+    kind="counter",
+)
+project.metrics.Callback(
+    "retention_deleted_rows_total",
+    "Expired rows removed by the retention jobs.",
+    lambda: sum(project.retention.retention_scheduler.deleted_total.values()),
+    kind="counter",
+)
+project.metrics.Callback(
+    "user_profile_cache_entries",
+    "User profiles cached for bearer token resolution.",
+    lambda: len(project.current_user.user_profiles),
+)
+project.metrics.Callback(
+    "user_profile_cache_hits_total",
+    "Authenticated requests whose user was resolved from the profile cache.",
+    lambda: project.current_user.user_profiles.hits,
+    kind="counter",
+)
+project.metrics.Callback(
+    "user_profile_cache_misses_total",
+    "Authenticated requests whose user had to be looked up.",
+    lambda: project.current_user.user_profiles.misses,
+    kind="counter",
+)
+project.metrics.Callback(
+    "db_replica_reads_total",
+    "Read-only queries served by the read replica.",
+    lambda: project.db.replica_reads,
+    kind="counter",
+)
+project.metrics.Callback(
+    "db_replica_fallbacks_total",
+    "Read replica queries retried on the primary.",
+    lambda: project.db.replica_fallbacks,
+    kind="counter",
+)
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def api_get_metrics() -> Response:
+    """
+    Expose request, query and component metrics in Prometheus text format.
+    """
+    text = project.metrics.render()
+    try:
+        text += await project.db.prometheus_pool_metrics()
+    except Exception:
+        logger.debug("Prisma pool metrics unavailable", exc_info=True)
+    return PlainTextResponse(
+        text, media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
+
 
 @app.get(
     "/jokes/random",
-    response_model=project.get_random_joke_service.GetRandomJokeResponse,
+    response_model=Union[
+        project.get_random_joke_service.GetRandomJokeResponse,
+        project.get_random_joke_service.GetRandomJokesResponse,
+    ],
+)
+async def api_get_get_random_joke(
+    request: Request,
+    count: Optional[int] = Query(None, ge=1, le=100),
+    no_repeat: bool = False,
+    client_id: Optional[str] = None,
+) -> project.get_random_joke_service.GetRandomJokeResponse | project.get_random_joke_service.GetRandomJokesResponse | Response:
+    """
+    Retrieve a random dad joke, or a batch of `count` jokes.
+
+    The body is assembled from JSON bytes pre-encoded when jokes enter the
+    pool, so the declared response model is documentation only. With `no_repeat`, jokes already served to `client_id` (or to the caller's
+    address if no id is given) are skipped until the whole pool has been seen.
+    """
+    try:
+        if count is None and not no_repeat:
+            payload = await project.get_random_joke_service.get_random_joke_payload()
+        else:
+            client_key = None
+            if no_repeat:
+                client_key = client_id or (
+                    request.client.host if request.client else ""
+                )
+            payload = await project.get_random_joke_service.get_random_jokes_payload(
+                count or 1, client_key
+            )
+        return project.fast_json.json_bytes_response(payload)
+    except Exception as e:
+        logger.exception("Error processing request")
+        return project.fast_json.error_response(e)
+
+
+@app.get(
+    "/jokes/search",
+    response_model=project.search_jokes_service.SearchJokesResponse,
 )
-async def api_get_get_random_joke() -> project.get_random_joke_service.GetRandomJokeResponse | Response:
+async def api_get_search_jokes(
+    q: str = Query(..., min_length=1, max_length=200),
+    limit: int = Query(10, ge=1, le=100),
+) -> project.search_jokes_service.SearchJokesResponse | Response:
     """
-    Retrieve a random dad joke.
+    Search approved dad jokes by text, best matches first.
+
+    The index follows the approved joke pool, so without either there is
+    nothing to search and the endpoint answers 503 rather than an empty list.
     """
+    if not (
+        project.search_index.SEARCH_ENABLED and project.joke_pool.JOKE_POOL_ENABLED
+    ):
+        raise HTTPException(
+            status_code=503,
+            detail="Search is disabled; it needs SEARCH_ENABLED and JOKE_POOL_ENABLED.",
+        )
+    if not project.search_index.joke_search_index.ready:
+        raise HTTPException(
+            status_code=503,
+            detail="The search index is still being built.",
+            headers={"Retry-After": "1"},
+        )
     try:
-        res = await project.get_random_joke_service.get_random_joke()
+        res = await project.search_jokes_service.search_jokes(q, limit)
         return res
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
+        return project.fast_json.error_response(e)
+
+
+@app.get("/jokes/top", response_model=project.joke_views.TopJokesResponse)
+async def api_get_top_jokes(
+    window: str = "24h",
+    limit: int = Query(10, ge=1, le=project.joke_views.JOKE_TOP_SIZE),
+) -> project.joke_views.TopJokesResponse | Response:
+    """
+    List the most served approved dad jokes in a window such as 1h, 24h or 7d.
+
+    Served from a top list refreshed in the background, so recent views
+    show up after the next view flush and refresh.
+    """
+    if window not in project.joke_views.top_jokes.windows:
+        raise HTTPException(
+            status_code=400,
+            detail=f"window must be one of {', '.join(project.joke_views.top_jokes.windows)}",
         )
+    try:
+        return project.fast_json.json_bytes_response(
+            project.joke_views.top_jokes.payload(window, limit)
+        )
+    except Exception as e:
+        logger.exception("Error processing request")
+        return project.fast_json.error_response(e)
+
+
+@app.get("/jokes/export")
+async def api_get_export_jokes(
+    status: Optional[project.moderate_joke_service.JokeStatus] = None,
+    gzip: bool = False,
+    admin: project.current_user.UserProfile = Depends(require_admin),
+) -> StreamingResponse:
+    """
+    Stream the joke corpus as NDJSON, optionally gzip-compressed (admins only).
+
+    The body is produced page by page with keyset pagination, so memory use
+    is constant however large the table is. Load it back with
+    `python -m project.corpus import`.
+    """
+    chunks = project.corpus.export_jokes(status.value if status else None)
+    filename = "jokes.ndjson"
+    media_type = "application/x-ndjson"
+    if gzip:
+        chunks = project.corpus.gzip_chunks(chunks)
+        filename += ".gz"
+        media_type = "application/gzip"
+    return StreamingResponse(
+        chunks,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/jokes/views", response_model=project.joke_views.JokeViewStats)
+async def api_get_joke_view_stats() -> project.joke_views.JokeViewStats:
+    """
+    Report view counting and flush metrics for this worker.
+    """
+    return project.joke_views.joke_views.stats()
 
 
 @app.post(
@@ -60,45 +475,198 @@ async def api_get_get_random_joke() -> project.get_random_joke_service.GetRandom
 )
 async def api_post_submit_joke(
     content: str,
+    user: project.current_user.UserProfile = Depends(
+        project.current_user.get_current_user
+    ),
 ) -> project.submit_joke_service.SubmitJokeResponse | Response:
     """
-    Submit a new dad joke.
+    Submit a new dad joke as the current user.
     """
     try:
-        res = await project.submit_joke_service.submit_joke(content)
+        res = await project.submit_joke_service.submit_joke(content, user.id)
         return res
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
+        return project.fast_json.error_response(e)
+
+
+@app.post(
+    "/jokes/submit/batch",
+    response_model=project.submit_joke_service.SubmitJokeBatchResponse,
+)
+async def api_post_submit_jokes_batch(
+    request: Request,
+    user: project.current_user.UserProfile = Depends(
+        project.current_user.get_current_user
+    ),
+) -> project.submit_joke_service.SubmitJokeBatchResponse | Response:
+    """
+    Submit many dad jokes as the current user from a streamed NDJSON or JSON-array body.
+
+    Each item is a string or an object with a "content" field.
+    """
+    try:
+        res = await project.submit_joke_service.submit_jokes_batch(
+            project.json_stream.iter_json_items(request.stream()), user.id
+        )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        return project.fast_json.error_response(e)
+
+
+@app.get(
+    "/jokes/submit/buffer",
+    response_model=project.submission_buffer.SubmissionBufferStats,
+)
+async def api_get_submission_buffer_stats() -> project.submission_buffer.SubmissionBufferStats:
+    """
+    Report queue depth and flush latency of the buffered submission queue.
+    """
+    return project.submission_buffer.submission_buffer.stats()
+
+
+@app.get("/jokes/stream")
+async def api_get_joke_stream(
+    user: Optional[project.current_user.UserProfile] = Depends(
+        project.current_user.get_optional_current_user
+    ),
+) -> Response:
+    """
+    Stream newly approved jokes as Server-Sent Events.
+
+    Moderators and admins also receive new PENDING submissions. The token
+    can be sent as a bearer header or as the `access_token` query parameter.
+    """
+    if project.joke_events.joke_broadcaster.full():
+        return project.fast_json.error_response(
+            Exception("Too many stream subscribers, please retry shortly"), 503
         )
+    return StreamingResponse(
+        project.joke_events.sse_stream(
+            project.joke_events.is_moderator(user.role if user else None)
+        ),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.get("/jokes/stream/stats", response_model=project.joke_events.JokeStreamStats)
+async def api_get_joke_stream_stats() -> project.joke_events.JokeStreamStats:
+    """
+    Report subscriber counts and delivery metrics of the live joke feed.
+    """
+    return project.joke_events.joke_broadcaster.stats()
+
+
+@app.websocket("/jokes/ws")
+async def api_joke_websocket(
+    websocket: WebSocket, access_token: Optional[str] = None
+) -> None:
+    """
+    The live joke feed over a WebSocket, as JSON text messages.
+    """
+    user = None
+    if access_token is not None:
+        user = await project.current_user.authenticate_token(access_token)
+        if user is None:
+            await websocket.close(code=1008)
+            return
+    await project.joke_events.websocket_stream(
+        websocket, project.joke_events.is_moderator(user.role if user else None)
+    )
+
+
+@app.get("/db/pool", response_model=project.db.DatabasePoolStats)
+async def api_get_db_pool_stats() -> project.db.DatabasePoolStats | Response:
+    """
+    Report connection pool utilization and read-replica routing counters.
+    """
+    try:
+        return await project.db.pool_stats()
+    except Exception as e:
+        logger.exception("Error processing request")
+        return project.fast_json.error_response(e)
+
+
+@app.get(
+    "/db/single-flight", response_model=list[project.single_flight.SingleFlightStats]
+)
+async def api_get_single_flight_stats() -> list[project.single_flight.SingleFlightStats]:
+    """
+    Report how many identical concurrent reads were coalesced, per query group.
+    """
+    return project.single_flight.all_stats()
+
+
+@app.get("/db/retention", response_model=project.retention.RetentionStats)
+async def api_get_retention_stats() -> project.retention.RetentionStats:
+    """
+    Report rows removed and time spent by the latest retention runs.
+    """
+    return project.retention.retention_scheduler.stats()
 
 
 @app.put(
     "/jokes/moderate", response_model=project.moderate_joke_service.ModerateJokeResponse
 )
 async def api_put_moderate_joke(
-    joke_id: str, new_status: project.moderate_joke_service.JokeStatus
+    joke_id: str,
+    new_status: project.moderate_joke_service.JokeStatus,
+    moderator: project.current_user.UserProfile = Depends(require_moderator),
 ) -> project.moderate_joke_service.ModerateJokeResponse | Response:
     """
-    Moderate a submitted dad joke.
+    Moderate a submitted dad joke (moderators and admins only).
     """
     try:
         res = await project.moderate_joke_service.moderate_joke(joke_id, new_status)
         return res
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
+        return project.fast_json.error_response(e)
+
+
+@app.get(
+    "/jokes/moderation-queue",
+    response_model=project.moderate_joke_service.ModerationQueueResponse,
+)
+async def api_get_moderation_queue(
+    limit: int = Query(50, ge=1, le=500),
+    cursor: Optional[str] = None,
+    moderator: project.current_user.UserProfile = Depends(require_moderator),
+) -> project.moderate_joke_service.ModerationQueueResponse | Response:
+    """
+    List pending dad jokes awaiting moderation, oldest first (moderators and admins only).
+    """
+    try:
+        res = await project.moderate_joke_service.get_moderation_queue(limit, cursor)
+        return res
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.exception("Error processing request")
+        return project.fast_json.error_response(e)
+
+
+@app.put(
+    "/jokes/moderate/batch",
+    response_model=project.moderate_joke_service.ModerateJokesBatchResponse,
+)
+async def api_put_moderate_jokes_batch(
+    request: project.moderate_joke_service.ModerateJokesBatchRequest,
+    moderator: project.current_user.UserProfile = Depends(require_moderator),
+) -> project.moderate_joke_service.ModerateJokesBatchResponse | Response:
+    """
+    Apply one moderation status to many dad jokes at once (moderators and admins only).
+    """
+    try:
+        res = await project.moderate_joke_service.moderate_jokes_batch(
+            request.joke_ids, request.new_status
         )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        return project.fast_json.error_response(e)
 
 
 @app.post("/auth/login", response_model=project.login_user_service.LoginResponse)
@@ -111,15 +679,11 @@ async def api_post_login_user(
     try:
         res = await project.login_user_service.login_user(email, password)
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return project.fast_json.error_response(e)
 
 
 @app.post(
@@ -134,15 +698,21 @@ async def api_post_refresh_token(
     try:
         res = await project.refresh_token_service.refresh_token(refresh_token)
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return project.fast_json.error_response(e)
+
+
+@app.get(
+    "/auth/refresh/stats", response_model=project.refresh_tokens.RefreshTokenStats
+)
+async def api_get_refresh_token_stats() -> project.refresh_tokens.RefreshTokenStats:
+    """
+    Report revocation filter size, false-positive rates and refresh latency.
+    """
+    return project.refresh_tokens.refresh_token_store.stats()
 
 
 @app.post(
@@ -150,23 +720,59 @@ async def api_post_refresh_token(
     response_model=project.register_user_service.UserRegistrationResponse,
 )
 async def api_post_register_user(
-    email: str, password: str, role: project.register_user_service.Role
+    email: str, password: str
 ) -> project.register_user_service.UserRegistrationResponse | Response:
     """
-    Register a new user account.
+    Register a new user account with the USER role.
     """
     try:
-        res = await project.register_user_service.register_user(email, password, role)
+        res = await project.register_user_service.register_user(email, password)
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
+        return project.fast_json.error_response(e)
+
+
+@app.post("/users/import", response_model=project.import_users_service.ImportUsersResponse)
+async def api_post_import_users(
+    request: Request,
+    admin: project.current_user.UserProfile = Depends(require_admin),
+) -> project.import_users_service.ImportUsersResponse | Response:
+    """
+    Create many users from a streamed NDJSON or JSON-array body (admins only).
+
+    Each item is an object with "email", "password" and optionally "role".
+    """
+    try:
+        res = await project.import_users_service.import_users(
+            project.json_stream.iter_json_items(request.stream())
         )
+        return res
+    except Exception as e:
+        logger.exception("Error processing request")
+        return project.fast_json.error_response(e)
+
+
+@app.get("/users/me", response_model=project.current_user.UserProfile)
+async def api_get_current_user(
+    user: project.current_user.UserProfile = Depends(
+        project.current_user.get_current_user
+    ),
+) -> project.current_user.UserProfile:
+    """
+    Return the profile of the bearer token's user.
+    """
+    return user
+
+
+@app.get("/users/cache", response_model=project.current_user.UserProfileCacheStats)
+async def api_get_user_cache_stats() -> project.current_user.UserProfileCacheStats:
+    """
+    Report hit rate and invalidations of the current-user profile cache.
+    """
+    return project.current_user.stats()
 
 
 @app.put(
@@ -174,22 +780,24 @@ async def api_post_register_user(
     response_model=project.update_profile_service.UserProfileUpdateResponse,
 )
 async def api_put_update_profile(
-    email: Optional[str],
-    password: Optional[str],
-    role: Optional[project.update_profile_service.Role],
+    email: Optional[str] = None,
+    password: Optional[str] = None,
+    role: Optional[project.update_profile_service.Role] = None,
+    user_id: Optional[str] = None,
+    user: project.current_user.UserProfile = Depends(
+        project.current_user.get_current_user
+    ),
 ) -> project.update_profile_service.UserProfileUpdateResponse | Response:
     """
-    Update user profile information.
+    Update the current user's profile information; admins may pass `user_id` to update another user.
     """
     try:
-        res = await project.update_profile_service.update_profile(email, password, role)
+        res = await project.update_profile_service.update_profile(
+            user, email, password, role, user_id
+        )
         return res
+    except HTTPException:
+        raise
     except Exception as e:
         logger.exception("Error processing request")
-        res = dict()
-        res["error"] = str(e)
-        return Response(
-            content=jsonable_encoder(res),
-            status_code=500,
-            media_type="application/json",
-        )
+        return project.fast_json.error_response(e)
@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from typing import Any, Awaitable, Callable, Generic, Hashable, TypeVar
+
+from project.metrics import METRICS_ENABLED, single_flight_calls_total
+from pydantic import BaseModel
+
+T = TypeVar("T")
+
+SINGLE_FLIGHT_ENABLED = os.getenv("SINGLE_FLIGHT_ENABLED", "1") != "0"
+
+SINGLE_FLIGHT_CACHE_MAX_ENTRIES = int(
+    os.getenv("SINGLE_FLIGHT_CACHE_MAX_ENTRIES", "10000")
+)
+
+
+class SingleFlightStats(BaseModel):
+    """
+    Call counts for one single-flight group.
+
+    `coalescing_ratio` is the share of calls answered without running the
+    query themselves, from an in-flight call or the micro-cache.
+    """
+
+    name: str
+    ttl_seconds: float
+    calls: int
+    executed: int
+    shared: int
+    cached: int
+    in_flight: int
+    coalescing_ratio: float
+
+
+groups: list["SingleFlight[Any]"] = []
+
+
+class SingleFlight(Generic[T]):
+    """
+    Collapses concurrent identical reads into one.
+
+    The first caller for a key starts the read as a task; callers arriving
+    while it runs await the same task, so a burst of N identical reads
+    costs one query. The task is shielded, so a caller that is cancelled
+    (e.g. a client disconnect) does not cancel it for the others, and
+    failures are shared, not cached.
+
+    With `ttl` > 0 results are also kept for `ttl` seconds, which absorbs
+    bursts that arrive just after a read finished. Results are shared
+    between callers and must be treated as read-only.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        ttl: float = 0.0,
+        max_entries: int = SINGLE_FLIGHT_CACHE_MAX_ENTRIES,
+    ) -> None:
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.calls = 0
+        self.executed = 0
+        self.shared = 0
+        self.cached = 0
+        self._in_flight: dict[Hashable, asyncio.Task] = {}
+        self._cache: dict[Hashable, tuple[float, T]] = {}
+        groups.append(self)
+
+    def _count(self, outcome: str) -> None:
+        if METRICS_ENABLED:
+            single_flight_calls_total.inc(self.name, outcome)
+
+    async def do(self, key: Hashable, read: Callable[[], Awaitable[T]]) -> T:
+        """
+        Return the result of `read()`, sharing it with identical concurrent calls.
+
+        Args:
+            key (Hashable): Identifies the read; calls with equal keys must return the same thing.
+            read (Callable[[], Awaitable[T]]): Starts the read. Only called if no call for `key` is in flight or cached.
+
+        Returns:
+            T: The result of the read.
+        """
+        if not SINGLE_FLIGHT_ENABLED:
+            return await read()
+        self.calls += 1
+        if self.ttl > 0:
+            entry = self._cache.get(key)
+            if entry is not None:
+                if entry[0] > time.monotonic():
+                    self.cached += 1
+                    self._count("cached")
+                    return entry[1]
+                del self._cache[key]
+        task = self._in_flight.get(key)
+        if task is not None:
+            self.shared += 1
+            self._count("shared")
+        else:
+            self.executed += 1
+            self._count("executed")
+            task = asyncio.ensure_future(read())
+            self._in_flight[key] = task
+            task.add_done_callback(lambda done: self._finish(key, done))
+        return await asyncio.shield(task)
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._in_flight.get(key) is task:
+            del self._in_flight[key]
+        # Checking the exception also marks it retrieved when every caller
+        # has already gone away.
+        failed = task.cancelled() or task.exception() is not None
+        if failed or self.ttl <= 0:
+            return
+        if len(self._cache) >= self.max_entries:
+            now = time.monotonic()
+            for stale in [
+                k for k, (expires, _) in self._cache.items() if expires <= now
+            ]:
+                del self._cache[stale]
+            if len(self._cache) >= self.max_entries:
+                self._cache.clear()
+        self._cache[key] = (time.monotonic() + self.ttl, task.result())
+
+    def forget(self, key: Hashable) -> None:
+        """
+        Drop a cached result, e.g. after the underlying row was written.
+        """
+        self._cache.pop(key, None)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+    def stats(self) -> SingleFlightStats:
+        return SingleFlightStats(
+            name=self.name,
+            ttl_seconds=self.ttl,
+            calls=self.calls,
+            executed=self.executed,
+            shared=self.shared,
+            cached=self.cached,
+            in_flight=len(self._in_flight),
+            coalescing_ratio=(
+                (self.shared + self.cached) / self.calls if self.calls else 0.0
+            ),
+        )
+
+
+def all_stats() -> list[SingleFlightStats]:
+    return [group.stats() for group in groups]
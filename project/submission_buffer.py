@@ -0,0 +1,214 @@
+import asyncio
+import logging
+import os
+import time
+from typing import Any
+
+import prisma
+import prisma.models
+from project.duplicate_index import DUPLICATE_CHECK_ENABLED, duplicate_index
+from project.metrics import timed_query
+from pydantic import BaseModel
+
+logger = logging.getLogger(__name__)
+
+SUBMIT_BUFFERED = os.getenv("SUBMIT_BUFFERED", "0") == "1"
+
+SUBMIT_BUFFER_MAX = int(os.getenv("SUBMIT_BUFFER_MAX", "10000"))
+
+SUBMIT_FLUSH_SIZE = int(os.getenv("SUBMIT_FLUSH_SIZE", "500"))
+
+SUBMIT_FLUSH_SECONDS = float(os.getenv("SUBMIT_FLUSH_SECONDS", "0.25"))
+
+# A failed batch is retried this many times, waiting SUBMIT_RETRY_SECONDS
+# and then twice as long each time, before its jokes are given up on.
+SUBMIT_FLUSH_RETRIES = int(os.getenv("SUBMIT_FLUSH_RETRIES", "4"))
+
+SUBMIT_RETRY_SECONDS = float(os.getenv("SUBMIT_RETRY_SECONDS", "0.5"))
+
+
+class SubmissionBufferStats(BaseModel):
+    """
+    Queue depth and flush metrics for buffered joke submissions.
+    """
+
+    enabled: bool
+    depth: int
+    capacity: int
+    enqueued: int
+    rejected: int
+    flushed: int
+    failed: int
+    retries: int
+    flushes: int
+    last_flush_seconds: float
+    max_flush_seconds: float
+    avg_flush_seconds: float
+
+
+class SubmissionBuffer:
+    """
+    Bounded write-behind queue for joke inserts.
+
+    `offer` enqueues a ready-to-insert row without waiting. A background
+    task writes queued rows with create_many once `flush_size` rows are
+    waiting or `flush_interval` seconds have passed since the first one.
+
+    Queued jokes have already been acknowledged, so a failed write is
+    retried with exponential backoff, `retries` times, while new rows keep
+    queueing up to `max_size`. Rows carry their ids and are written with
+    skip_duplicates, so retrying a write that did commit is harmless. Only
+    a batch that keeps failing is dropped, its ids are logged and its jokes
+    are taken out of the duplicate index again.
+    """
+
+    def __init__(
+        self,
+        max_size: int = SUBMIT_BUFFER_MAX,
+        flush_size: int = SUBMIT_FLUSH_SIZE,
+        flush_interval: float = SUBMIT_FLUSH_SECONDS,
+        retries: int = SUBMIT_FLUSH_RETRIES,
+        retry_delay: float = SUBMIT_RETRY_SECONDS,
+    ) -> None:
+        self.max_size = max_size
+        self.flush_size = flush_size
+        self.flush_interval = flush_interval
+        self.retries = retries
+        self.retry_delay = retry_delay
+        self.enqueued = 0
+        self.rejected = 0
+        self.flushed = 0
+        self.failed = 0
+        self.retried = 0
+        self.flushes = 0
+        self.last_flush_seconds = 0.0
+        self.max_flush_seconds = 0.0
+        self.total_flush_seconds = 0.0
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._accepting = False
+
+    @property
+    def running(self) -> bool:
+        return self._accepting
+
+    def offer(self, data: dict[str, Any]) -> bool:
+        """
+        Enqueue a row for insertion.
+
+        Args:
+            data (dict[str, Any]): Joke create data, including a pre-assigned id.
+
+        Returns:
+            bool: False if the buffer is not running or full; the caller should then insert directly.
+        """
+        if not self._accepting:
+            return False
+        try:
+            self._queue.put_nowait(data)
+        except asyncio.QueueFull:
+            self.rejected += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._accepting = True
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """
+        Stop accepting rows and wait until everything queued has been written.
+        """
+        if self._task is None:
+            return
+        self._accepting = False
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        closing = False
+        while not closing:
+            first = await self._queue.get()
+            if first is None:
+                break
+            batch = [first]
+            deadline = loop.time() + self.flush_interval
+            while len(batch) < self.flush_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is None:
+                    closing = True
+                    break
+                batch.append(item)
+            await self._write(batch)
+
+    async def _write(self, batch: list[dict[str, Any]]) -> None:
+        started = time.perf_counter()
+        delay = self.retry_delay
+        for attempt in range(self.retries + 1):
+            try:
+                await timed_query(
+                    "Joke.create_many",
+                    prisma.models.Joke.prisma().create_many(
+                        data=batch, skip_duplicates=True
+                    ),
+                )
+                self.flushed += len(batch)
+                break
+            except Exception:
+                if attempt == self.retries:
+                    self.failed += len(batch)
+                    logger.exception(
+                        "Dropping %d buffered submissions after %d attempts: %s",
+                        len(batch),
+                        attempt + 1,
+                        ", ".join(data["id"] for data in batch),
+                    )
+                    if DUPLICATE_CHECK_ENABLED:
+                        for data in batch:
+                            duplicate_index.discard(data["id"], data["content"])
+                    break
+                self.retried += 1
+                logger.warning(
+                    "Failed to flush %d buffered submissions; retrying in %.2fs",
+                    len(batch),
+                    delay,
+                    exc_info=True,
+                )
+                await asyncio.sleep(delay)
+                delay *= 2
+        elapsed = time.perf_counter() - started
+        self.flushes += 1
+        self.last_flush_seconds = elapsed
+        self.max_flush_seconds = max(self.max_flush_seconds, elapsed)
+        self.total_flush_seconds += elapsed
+
+    def stats(self) -> SubmissionBufferStats:
+        return SubmissionBufferStats(
+            enabled=self._accepting,
+            depth=self._queue.qsize() if self._queue is not None else 0,
+            capacity=self.max_size,
+            enqueued=self.enqueued,
+            rejected=self.rejected,
+            flushed=self.flushed,
+            failed=self.failed,
+            retries=self.retried,
+            flushes=self.flushes,
+            last_flush_seconds=self.last_flush_seconds,
+            max_flush_seconds=self.max_flush_seconds,
+            avg_flush_seconds=(
+                self.total_flush_seconds / self.flushes if self.flushes else 0.0
+            ),
+        )
+
+
+submission_buffer = SubmissionBuffer()
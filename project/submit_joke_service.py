@@ -1,10 +1,21 @@
-from typing import Optional
+import os
+from typing import Any, AsyncIterator, Optional
+from uuid import uuid4
 
 import prisma
 import prisma.enums
 import prisma.models
+from project.duplicate_index import DUPLICATE_CHECK_ENABLED, duplicate_index
+from project.joke_events import joke_broadcaster
+from project.json_stream import MalformedBody
+from project.metrics import timed_query
+from project.submission_buffer import submission_buffer
 from pydantic import BaseModel
 
+JOKE_MAX_LENGTH = 1000
+
+JOKE_BATCH_CHUNK_SIZE = int(os.getenv("JOKE_BATCH_CHUNK_SIZE", "500"))
+
 
 class SubmitJokeResponse(BaseModel):
     """
@@ -14,29 +25,262 @@ class SubmitJokeResponse(BaseModel):
     success: bool
     joke_id: Optional[str] = None
     message: str
+    duplicate_of: Optional[str] = None
+
+
+class SubmitJokeBatchItem(BaseModel):
+    """
+    Outcome for one item of a batch submission, identified by its position in the body.
+    """
+
+    index: int
+    success: bool
+    joke_id: Optional[str] = None
+    message: str
+    duplicate_of: Optional[str] = None
+
+
+class SubmitJokeBatchResponse(BaseModel):
+    """
+    Response model for a batch submission, with totals and a result per submitted item.
+    """
+
+    submitted: int
+    failed: int
+    results: list[SubmitJokeBatchItem]
+    error: Optional[str] = None
 
 
-async def submit_joke(content: str) -> SubmitJokeResponse:
+def validate_joke_content(content: Any) -> str:
+    """
+    Check submitted joke content and normalize surrounding whitespace.
+
+    Args:
+        content (Any): The submitted content.
+
+    Returns:
+        str: The content, stripped.
+
+    Raises:
+        ValueError: If the content is not a non-empty string of at most JOKE_MAX_LENGTH characters.
+    """
+    if not isinstance(content, str):
+        raise ValueError("Joke content must be a string.")
+    content = content.strip()
+    if not content:
+        raise ValueError("Joke content must not be empty.")
+    if len(content) > JOKE_MAX_LENGTH:
+        raise ValueError(f"Joke content must be at most {JOKE_MAX_LENGTH} characters.")
+    return content
+
+
+def build_joke_data(content: str, user_id: str) -> dict[str, Any]:
+    """
+    Build the create payload for a new, pending joke with a pre-assigned id.
+
+    Args:
+        content (str): Validated joke content.
+        user_id (str): The submitting user's id.
+
+    Returns:
+        dict[str, Any]: Data suitable for Joke create or create_many.
+    """
+    return {
+        "id": str(uuid4()),
+        "content": content,
+        "status": prisma.enums.JokeStatus.PENDING,
+        "submittedBy": user_id,
+    }
+
+
+def check_duplicate(content: str) -> tuple[bool, Optional[str]]:
+    """
+    Look the content up in the duplicate index.
+
+    Args:
+        content (str): Validated joke content.
+
+    Returns:
+        tuple[bool, Optional[str]]: Whether the submission must be rejected as an exact duplicate, and the id of the joke it duplicates, if any.
+    """
+    if not DUPLICATE_CHECK_ENABLED:
+        return False, None
+    found = duplicate_index.check(content)
+    if found is None:
+        return False, None
+    kind, joke_id = found
+    return kind == "exact", joke_id
+
+
+async def submit_joke(content: str, user_id: str) -> SubmitJokeResponse:
     """
     Submit a new dad joke.
 
+    Exact duplicates of an existing joke (ignoring case and punctuation) are
+    rejected; near duplicates are accepted but flagged through
+    `duplicate_of`. When the submission buffer is running the joke is
+    acknowledged as soon as it is queued and inserted later in a batch; if
+    the buffer is full it is inserted directly.
+
     Args:
         content (str): The content of the dad joke being submitted.
+        user_id (str): The submitting user's id.
 
     Returns:
         SubmitJokeResponse: Response model for dad joke submission, indicating success and providing a reference ID.
     """
-    user_id = "your-user-id-here"
     try:
-        joke = await prisma.models.Joke.prisma().create(
-            data={
-                "content": content,
-                "status": prisma.enums.JokeStatus.PENDING,
-                "submittedBy": user_id,
-            }
+        content = validate_joke_content(content)
+    except ValueError as e:
+        return SubmitJokeResponse(success=False, message=str(e))
+    rejected, duplicate_of = check_duplicate(content)
+    if rejected:
+        return SubmitJokeResponse(
+            success=False,
+            message="This joke has already been submitted.",
+            duplicate_of=duplicate_of,
         )
+    data = build_joke_data(content, user_id)
+    # Indexed before the write so that a concurrent identical submission is
+    # rejected too; every path that does not end up writing the joke must
+    # discard it again.
+    if DUPLICATE_CHECK_ENABLED:
+        duplicate_index.add(data["id"], content)
+    if submission_buffer.offer(data):
+        joke_broadcaster.publish_pending(data["id"], content)
         return SubmitJokeResponse(
-            success=True, joke_id=joke.id, message="Joke submitted successfully."
+            success=True,
+            joke_id=data["id"],
+            message="Joke accepted for submission.",
+            duplicate_of=duplicate_of,
         )
-    except Exception as e:
+    try:
+        joke = await timed_query(
+            "Joke.create", prisma.models.Joke.prisma().create(data=data)
+        )
+        joke_broadcaster.publish_pending(joke.id, content)
+        return SubmitJokeResponse(
+            success=True,
+            joke_id=joke.id,
+            message="Joke submitted successfully.",
+            duplicate_of=duplicate_of,
+        )
+    except BaseException as e:
+        if DUPLICATE_CHECK_ENABLED:
+            duplicate_index.discard(data["id"], content)
+        if not isinstance(e, Exception):
+            raise
         return SubmitJokeResponse(success=False, message="Failed to submit the joke.")
+
+
+async def submit_jokes_batch(
+    items: AsyncIterator[Any], user_id: str, chunk_size: int = JOKE_BATCH_CHUNK_SIZE
+) -> SubmitJokeBatchResponse:
+    """
+    Submit many dad jokes, inserting them in create_many chunks.
+
+    Each item is either a string or an object with a "content" field. Items
+    are validated as they arrive and valid ones are inserted every
+    `chunk_size` items, so memory stays bounded by the chunk size plus the
+    per-item results. If the body turns out to be malformed, reading stops
+    there: the items before it are still submitted and `error` says where
+    the body broke.
+
+    Args:
+        items (AsyncIterator[Any]): Decoded items, e.g. from iter_json_items. An exception instance marks an unparsable item.
+        user_id (str): The submitting user's id.
+        chunk_size (int): Number of jokes per create_many call.
+
+    Returns:
+        SubmitJokeBatchResponse: Response model for a batch submission, with totals and a result per submitted item.
+    """
+    results: list[SubmitJokeBatchItem] = []
+    pending: list[tuple[int, dict[str, Any], Optional[str]]] = []
+
+    def discard_pending() -> None:
+        if DUPLICATE_CHECK_ENABLED:
+            for _, data, _ in pending:
+                duplicate_index.discard(data["id"], data["content"])
+
+    async def flush() -> None:
+        try:
+            await timed_query(
+                "Joke.create_many",
+                prisma.models.Joke.prisma().create_many(
+                    data=[data for _, data, _ in pending]
+                ),
+            )
+            results.extend(
+                SubmitJokeBatchItem(
+                    index=index,
+                    success=True,
+                    joke_id=data["id"],
+                    message="Joke submitted successfully.",
+                    duplicate_of=duplicate_of,
+                )
+                for index, data, duplicate_of in pending
+            )
+            for _, data, _ in pending:
+                joke_broadcaster.publish_pending(data["id"], data["content"])
+        except Exception:
+            discard_pending()
+            results.extend(
+                SubmitJokeBatchItem(
+                    index=index, success=False, message="Failed to submit the joke."
+                )
+                for index, _, _ in pending
+            )
+        pending.clear()
+
+    index = 0
+    error = None
+    try:
+        try:
+            async for item in items:
+                try:
+                    if isinstance(item, Exception):
+                        raise ValueError("Item is not valid JSON.")
+                    if isinstance(item, dict):
+                        item = item.get("content")
+                    content = validate_joke_content(item)
+                except ValueError as e:
+                    results.append(
+                        SubmitJokeBatchItem(index=index, success=False, message=str(e))
+                    )
+                else:
+                    rejected, duplicate_of = check_duplicate(content)
+                    if rejected:
+                        results.append(
+                            SubmitJokeBatchItem(
+                                index=index,
+                                success=False,
+                                message="This joke has already been submitted.",
+                                duplicate_of=duplicate_of,
+                            )
+                        )
+                    else:
+                        data = build_joke_data(content, user_id)
+                        if DUPLICATE_CHECK_ENABLED:
+                            duplicate_index.add(data["id"], content)
+                        pending.append((index, data, duplicate_of))
+                        if len(pending) >= chunk_size:
+                            await flush()
+                index += 1
+        except MalformedBody as e:
+            # Stop reading; what was parsed so far is still submitted.
+            error = str(e)
+        if pending:
+            await flush()
+    except BaseException:
+        # Jokes indexed for a chunk that will never be written, e.g. when
+        # the request body breaks off or the request is cancelled.
+        discard_pending()
+        raise
+    results.sort(key=lambda result: result.index)
+    submitted = sum(result.success for result in results)
+    return SubmitJokeBatchResponse(
+        submitted=submitted,
+        failed=len(results) - submitted,
+        results=results,
+        error=error,
+    )
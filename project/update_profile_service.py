@@ -4,6 +4,12 @@ from typing import Optional
 
 import prisma
 import prisma.models
+from fastapi import HTTPException, status
+from project.current_user import UserProfile, invalidate_user, to_profile
+from project.login_user_service import user_lookups
+from project.metrics import timed_query
+from project.password_hashing import PasswordHasherSaturated, password_hasher
+from project.refresh_tokens import refresh_token_store
 from pydantic import BaseModel
 
 
@@ -12,9 +18,9 @@ class Role(Enum):
     Enumeration of user roles within the application.
     """
 
-    USER: str = USER  # TODO(autogpt): F821 Undefined name `USER`
-    MODERATOR: str = MODERATOR  # TODO(autogpt): F821 Undefined name `MODERATOR`
-    ADMIN: str = ADMIN  # TODO(autogpt): F821 Undefined name `ADMIN`
+    USER = "USER"
+    MODERATOR = "MODERATOR"
+    ADMIN = "ADMIN"
 
 
 class User(BaseModel):
@@ -40,36 +46,81 @@ class UserProfileUpdateResponse(BaseModel):
 
 
 async def update_profile(
-    email: Optional[str], password: Optional[str], role: Optional[Role]
+    user: UserProfile,
+    email: Optional[str],
+    password: Optional[str],
+    role: Optional[Role],
+    user_id: Optional[str] = None,
 ) -> UserProfileUpdateResponse:
     """
-    Update user profile information.
+    Update the current user's profile, or, for admins, another user's.
+
+    Only admins may change a role or update another user. After the write
+    the user's cached profile is invalidated in every worker, and the login
+    lookup cache forgets the old and new email, so a changed password or
+    role applies to the next request. A password change also revokes the
+    user's refresh tokens, so other sessions end when their access token
+    expires.
 
     Args:
+        user (UserProfile): The authenticated user whose profile is updated.
         email (Optional[str]): The new email address for the user. Optional.
         password (Optional[str]): The user's new password. Optional.
         role (Optional[Role]): The new role for the user. Must be one of the predefined roles. Optional.
+        user_id (Optional[str]): The user to update instead of the current one (admins only). Optional.
 
     Returns:
         UserProfileUpdateResponse: The response object reflecting the result of the user profile update operation. It includes the updated profile information.
+
+    Raises:
+        HTTPException: 503 if the password hashing pool is saturated.
     """
+    is_admin = user.role == Role.ADMIN.value
+    if user_id is not None and user_id != user.id:
+        if not is_admin:
+            return UserProfileUpdateResponse(
+                success=False, message="Only admins can update other users."
+            )
+        target = await timed_query(
+            "User.find_unique",
+            prisma.models.User.prisma().find_unique(where={"id": user_id}),
+        )
+        if target is None:
+            return UserProfileUpdateResponse(success=False, message="User not found.")
+        user = to_profile(target)
+    if role is not None and role.value != user.role and not is_admin:
+        return UserProfileUpdateResponse(
+            success=False, message="Only admins can change roles."
+        )
+    update_data = {}
+    if password is not None:
+        try:
+            update_data["password"] = await password_hasher.hash(password)
+        except PasswordHasherSaturated:
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="Too many concurrent password changes, please retry shortly",
+                headers={"Retry-After": "1"},
+            )
     try:
-        update_data = {}
         if email is not None:
             update_data["email"] = email
-        if password is not None:
-            update_data["password"] = password
         if role is not None:
             update_data["role"] = role.value
-        user_id = "obtained_user_id"
-        updated_user = await prisma.models.User.prisma().update(
-            where={"id": user_id}, data=update_data
+        updated_user = await timed_query(
+            "User.update",
+            prisma.models.User.prisma().update(where={"id": user.id}, data=update_data),
         )
         if updated_user:
+            await invalidate_user(user.id)
+            if password is not None:
+                await refresh_token_store.revoke_all(user.id)
+            user_lookups.forget(user.email)
+            user_lookups.forget(updated_user.email)
             return UserProfileUpdateResponse(
                 success=True,
                 message="User profile updated successfully.",
-                updated_profile=updated_user,
+                updated_profile=User(**to_profile(updated_user).dict()),
             )
         else:
             return UserProfileUpdateResponse(